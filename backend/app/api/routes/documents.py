@@ -0,0 +1,122 @@
+"""
+Contenu des documents (app/services/blobs.py)
+
+- PUT /documents/{id}/content : envoi multipart (champ "file"), remplace le
+  fichier du document ;
+- GET /documents/{id}/content : téléchargement en streaming, avec prise en
+  charge des requêtes partielles (Range / If-Range) et de If-None-Match.
+
+Les métadonnées restent gérées par le CRUD générique (resources.py).
+"""
+
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+import psycopg
+from fastapi import APIRouter, Depends, File, HTTPException, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
+
+from app.core.dependencies import get_async_db_connection, get_current_user
+from app.services.blobs import get_blob, iter_content, parse_range, purge_orphan_blobs, store_upload
+from app.services.crud import ITEM_SQL
+
+
+router = APIRouter(
+    prefix="/documents",
+    tags=["documents"],
+)
+
+
+def _company_scope(current_user: Dict[str, Any]) -> Optional[str]:
+    # Même règle que JsonbResource : sans entreprise active (superAdmin), pas de filtre
+    return current_user.get("companyId") or None
+
+
+def _content_disposition(file_name: str) -> str:
+    ascii_name = file_name.encode("ascii", "replace").decode().replace('"', "")
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(file_name)}"
+
+
+@router.put("/{document_id}/content")
+async def upload_document_content(
+    document_id: str,
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """Enregistre le fichier du document (dédupliqué par SHA-256)"""
+    company_id = _company_scope(current_user)
+    metadata = await store_upload(file)
+    if file.filename:
+        metadata["fileName"] = file.filename
+
+    scope = " AND company_id = %s" if company_id else ""
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute(
+            f"""
+            UPDATE documents
+            SET data = (data - 'fileData') || %s::jsonb
+            WHERE id = %s{scope}
+            RETURNING {ITEM_SQL};
+            """,
+            [psycopg.types.json.Json(metadata), document_id] + ([company_id] if company_id else []),
+        )
+        row = await cur.fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Document non trouvé")
+    # L'ancien fichier du document est peut-être devenu orphelin
+    await purge_orphan_blobs([row[0].get("companyId")])
+    return {"success": True, "data": row[0]}
+
+
+@router.get("/{document_id}/content")
+async def download_document_content(
+    document_id: str,
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+):
+    """Télécharge le fichier du document (complet ou partiel)"""
+    company_id = _company_scope(current_user)
+    scope = " AND company_id = %s" if company_id else ""
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute(
+            f"SELECT data->>'blobSha256', data->>'fileName', data->>'title' FROM documents WHERE id = %s{scope};",
+            [document_id] + ([company_id] if company_id else []),
+        )
+        row = await cur.fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Document non trouvé")
+    sha256, file_name, title = row
+    blob = await get_blob(sha256) if sha256 else None
+    if not blob:
+        raise HTTPException(status_code=404, detail="Aucun fichier pour ce document")
+    size, content_type, chunk_size = blob
+
+    # Le contenu d'un SHA-256 ne change jamais : l'empreinte sert d'ETag
+    etag = f'"{sha256}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=86400",
+        "Content-Disposition": _content_disposition(file_name or title or document_id),
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == etag:
+        byte_range = parse_range(request.headers.get("range"), size)
+
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_content(sha256, start, end, chunk_size),
+        status_code=status_code,
+        media_type=content_type or "application/octet-stream",
+        headers=headers,
+    )
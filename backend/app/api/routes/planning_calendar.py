@@ -1,68 +1,56 @@
+import asyncio
 import base64
 import math
 import time
-from datetime import datetime
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Tuple
 from zoneinfo import ZoneInfo
 
 import httpx
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import os
 
+from app.core.cache import TTLCache
 from app.core.calendar_config import get_calendar_settings, CalendarSettings
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, require_role
 
 # Import du service Google Calendar (si disponible)
 try:
-    from app.services.google_calendar import GoogleCalendarService
+    from app.services.google_calendar import GoogleCalendarService, get_calendar_service
+    from app.services.calendar_sync import mirrored_calendars, query_events
     GOOGLE_CALENDAR_AVAILABLE = True
 except ImportError:
     GOOGLE_CALENDAR_AVAILABLE = False
     GoogleCalendarService = None
+    get_calendar_service = None
 
 
 PARIS_TZ = ZoneInfo("Europe/Paris")
 UTC_TZ = ZoneInfo("UTC")
-_CACHE_STORE: Dict[str, Dict[str, object]] = {}
-_CACHE_TTL_KEYS = ("CACHE_TTL_SECONDS", "CALENDAR_CACHE_TTL_SECONDS")
 
-
-def _get_cache_ttl() -> int:
-    for key in _CACHE_TTL_KEYS:
-        value = os.getenv(key)
-        if value:
-            try:
-                ttl = int(value)
-                if ttl > 0:
-                    return ttl
-            except ValueError:
-                continue
-    return 0
-
-
-def _cache_get(key: str) -> List[dict] | None:
-    ttl = _get_cache_ttl()
-    if ttl <= 0:
-        return None
-    cached = _CACHE_STORE.get(key)
-    if not cached:
-        return None
-    expires_at = cached.get("expires_at", 0)
-    if expires_at and expires_at > time.time():
-        return cached.get("data")  # type: ignore[return-value]
-    _CACHE_STORE.pop(key, None)
-    return None
+# Événements normalisés d'un calendrier pour un jour (UTC) :
+# (calendar_id, alias, jour) -> DaySlice. Une période est servie par les
+# tranches qui la couvrent, même si elle chevauche des périodes déjà demandées.
+day_slice_cache = TTLCache(
+    "calendar_day_slices",
+    maxsize=get_calendar_settings().cache_max_slices,
+    ttl=get_calendar_settings().cache_ttl_seconds + get_calendar_settings().cache_stale_seconds,
+)
+# Tranches périmées servies, rafraîchissements lancés en arrière-plan
+_cache_counters = {"stale": 0, "refreshes": 0}
+_refreshing: set = set()
+_refresh_tasks: set = set()
 
 
-def _cache_set(key: str, data: List[dict]) -> None:
-    ttl = _get_cache_ttl()
-    if ttl <= 0:
-        return
-    _CACHE_STORE[key] = {
-        "data": data,
-        "expires_at": time.time() + ttl,
-    }
+@dataclass(frozen=True)
+class DaySlice:
+    # (début UTC, fin UTC, événement normalisé) des événements qui chevauchent le jour
+    entries: tuple
+    fetched_at: float  # time.monotonic()
+    last_sync: str
 
 
 def _parse_iso_datetime(raw_value: str) -> datetime:
@@ -137,6 +125,36 @@ def _normalize_event(event: dict, alias: str) -> dict:
     }
 
 
+def _event_bounds(event: dict) -> Tuple[datetime, datetime] | None:
+    """Début et fin UTC d'un événement brut (une journée entière commence à minuit UTC)"""
+    start_payload = event.get("start") or {}
+    end_payload = event.get("end") or {}
+    start_raw = start_payload.get("dateTime") or start_payload.get("date")
+    if not start_raw:
+        return None
+    start = _parse_iso_datetime(start_raw).astimezone(UTC_TZ)
+    end_raw = end_payload.get("dateTime") or end_payload.get("date")
+    end = _parse_iso_datetime(end_raw).astimezone(UTC_TZ) if end_raw else start
+    return start, max(start, end)
+
+
+def _overlaps(start: datetime, end: datetime, from_date: datetime, to_date: datetime) -> bool:
+    # Comme timeMin / timeMax de l'API ; un événement de durée nulle appartient à son début
+    return start < to_date and (end > from_date or start >= from_date)
+
+
+def _utc_days(from_date: datetime, to_date: datetime) -> List[date]:
+    """Jours UTC qui couvrent [from_date, to_date)"""
+    first = from_date.astimezone(UTC_TZ).date()
+    last = (to_date.astimezone(UTC_TZ) - timedelta(microseconds=1)).date()
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+
+def _day_bounds(day: date) -> Tuple[datetime, datetime]:
+    start = datetime(day.year, day.month, day.day, tzinfo=UTC_TZ)
+    return start, start + timedelta(days=1)
+
+
 def _deduplicate_events(events: List[dict]) -> List[dict]:
     seen: set[str] = set()
     unique: List[dict] = []
@@ -214,6 +232,183 @@ def _resolve_requested_calendars(
     return unique_aliases, calendar_ids
 
 
+async def _fetch_window(
+    service: "GoogleCalendarService",
+    calendar_ids: List[str],
+    calendar_id_to_alias: Dict[str, str],
+    from_date: datetime,
+    to_date: datetime,
+) -> Tuple[List[Tuple[str, datetime, datetime, dict]], List[str], str]:
+    """
+    Événements normalisés de la période : (calendar_id, début UTC, fin UTC,
+    événement) ; avec les warnings et la date de synchronisation.
+    """
+    last_sync = datetime.utcnow().isoformat() + "Z"
+    # Copie locale synchronisée en arrière-plan (syncToken) ; les calendriers
+    # pas encore synchronisés ou hors de l'historique copié sont lus chez Google
+    mirrored = await mirrored_calendars(calendar_ids, from_date)
+    live_calendar_ids = [calendar_id for calendar_id in calendar_ids if calendar_id not in mirrored]
+    events = []
+    warnings: List[str] = []
+    if mirrored:
+        events = await query_events(list(mirrored), from_date, to_date)
+        for event in events:
+            event["calendarName"] = calendar_id_to_alias.get(event["calendar"], event["calendar"])
+        if not live_calendar_ids:
+            last_sync = min(mirrored.values()).astimezone(UTC_TZ).replace(tzinfo=None).isoformat() + "Z"
+    if live_calendar_ids:
+        live_events, warnings = await run_in_threadpool(
+            service.get_events,
+            calendar_ids=live_calendar_ids,
+            time_min=from_date.astimezone(UTC_TZ).replace(tzinfo=None),
+            time_max=to_date.astimezone(UTC_TZ).replace(tzinfo=None),
+            max_results=2500,
+        )
+        events.extend(live_events)
+
+    entries = []
+    for event in events:
+        bounds = _event_bounds(event)
+        if bounds is None:
+            continue
+        # Utiliser calendarName en priorité (défini dans get_events), sinon utiliser le mapping
+        calendar_name = event.get("calendarName")
+        calendar_id = event.get("calendar", "")
+        # calendarName devrait toujours être présent car il est ajouté dans get_events
+        if not calendar_name:
+            # Si calendarName n'est pas présent, utiliser le mapping
+            calendar_name = calendar_id_to_alias.get(calendar_id, calendar_id)
+            import sys
+            print(f"[DEBUG] calendarName manquant pour {event.get('id', '')[:20]}..., calendar_id: {calendar_id[:50]}..., alias utilisé: {calendar_name}", file=sys.stderr, flush=True)
+        entries.append((calendar_id, bounds[0], bounds[1], _normalize_event(event, calendar_name)))
+    return entries, warnings, last_sync
+
+
+async def _load_slices(
+    service: "GoogleCalendarService",
+    calendar_ids: List[str],
+    calendar_id_to_alias: Dict[str, str],
+    first_day: date,
+    last_day: date,
+) -> Tuple[Dict[Tuple[str, date], DaySlice], List[str]]:
+    """
+    Charge les jours [first_day, last_day] des calendriers en une lecture et
+    les découpe en tranches. Mises en cache seulement sans warning : un
+    calendrier en erreur donnerait des tranches vides.
+    """
+    from_date = _day_bounds(first_day)[0]
+    to_date = _day_bounds(last_day)[1]
+    entries, warnings, last_sync = await _fetch_window(service, calendar_ids, calendar_id_to_alias, from_date, to_date)
+    fetched_at = time.monotonic()
+
+    slices: Dict[Tuple[str, date], DaySlice] = {}
+    for calendar_id in calendar_ids:
+        calendar_entries = [entry[1:] for entry in entries if entry[0] == calendar_id]
+        for day in _utc_days(from_date, to_date):
+            day_start, day_end = _day_bounds(day)
+            slices[(calendar_id, day)] = DaySlice(
+                entries=tuple(entry for entry in calendar_entries if _overlaps(entry[0], entry[1], day_start, day_end)),
+                fetched_at=fetched_at,
+                last_sync=last_sync,
+            )
+    if not warnings and get_calendar_settings().cache_ttl_seconds > 0:
+        for (calendar_id, day), day_slice in slices.items():
+            day_slice_cache.set((calendar_id, calendar_id_to_alias.get(calendar_id), day), day_slice)
+    return slices, warnings
+
+
+async def _refresh_slices(
+    service: "GoogleCalendarService",
+    stale: Dict[str, List[date]],
+    calendar_id_to_alias: Dict[str, str],
+) -> None:
+    keys = {(calendar_id, day) for calendar_id, days in stale.items() for day in days}
+    try:
+        first_day = min(day for _, day in keys)
+        last_day = max(day for _, day in keys)
+        await _load_slices(service, list(stale), calendar_id_to_alias, first_day, last_day)
+    except Exception as exc:
+        print(f"[Google Calendar] Rafraîchissement du cache en échec: {exc}")
+    finally:
+        _refreshing.difference_update(keys)
+
+
+def _schedule_refresh(
+    service: "GoogleCalendarService",
+    stale: Dict[str, List[date]],
+    calendar_id_to_alias: Dict[str, str],
+) -> None:
+    """Rafraîchit en arrière-plan les tranches périmées (une seule fois par tranche)"""
+    pending = {
+        calendar_id: [day for day in days if (calendar_id, day) not in _refreshing]
+        for calendar_id, days in stale.items()
+    }
+    pending = {calendar_id: days for calendar_id, days in pending.items() if days}
+    if not pending:
+        return
+    _refreshing.update((calendar_id, day) for calendar_id, days in pending.items() for day in days)
+    _cache_counters["refreshes"] += 1
+    task = asyncio.get_running_loop().create_task(_refresh_slices(service, pending, calendar_id_to_alias))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+async def _get_window_events(
+    service: "GoogleCalendarService",
+    calendar_ids: List[str],
+    calendar_id_to_alias: Dict[str, str],
+    from_date: datetime,
+    to_date: datetime,
+) -> Tuple[List[dict], List[str], str]:
+    """
+    Événements normalisés de la période, triés, servis depuis les tranches
+    journalières en cache. Les jours manquants sont chargés en une lecture ;
+    les tranches périmées sont servies et rafraîchies en arrière-plan.
+    """
+    settings = get_calendar_settings()
+    days = _utc_days(from_date, to_date)
+    now = time.monotonic()
+    slices: Dict[Tuple[str, date], DaySlice] = {}
+    missing: Dict[str, List[date]] = {}
+    stale: Dict[str, List[date]] = {}
+    for calendar_id in calendar_ids:
+        for day in days:
+            day_slice = None
+            if settings.cache_ttl_seconds > 0:
+                day_slice = day_slice_cache.get((calendar_id, calendar_id_to_alias.get(calendar_id), day))
+            if day_slice is None:
+                missing.setdefault(calendar_id, []).append(day)
+                continue
+            slices[(calendar_id, day)] = day_slice
+            if now - day_slice.fetched_at > settings.cache_ttl_seconds:
+                stale.setdefault(calendar_id, []).append(day)
+
+    warnings: List[str] = []
+    if missing:
+        first_day = min(missing_days[0] for missing_days in missing.values())
+        last_day = max(missing_days[-1] for missing_days in missing.values())
+        loaded, warnings = await _load_slices(service, list(missing), calendar_id_to_alias, first_day, last_day)
+        slices.update(loaded)
+    if stale:
+        _cache_counters["stale"] += sum(len(stale_days) for stale_days in stale.values())
+        _schedule_refresh(service, stale, calendar_id_to_alias)
+
+    from_utc = from_date.astimezone(UTC_TZ)
+    to_utc = to_date.astimezone(UTC_TZ)
+    normalized_events = [
+        event
+        for calendar_id in calendar_ids
+        for day in days
+        for start, end, event in slices[(calendar_id, day)].entries
+        if _overlaps(start, end, from_utc, to_utc)
+    ]
+    # Un événement sur plusieurs jours figure dans chacune de leurs tranches
+    normalized_events = _deduplicate_events(normalized_events)
+    normalized_events.sort(key=lambda item: item.get("start", ""))
+    last_sync = min(slices[(calendar_id, day)].last_sync for calendar_id in calendar_ids for day in days)
+    return normalized_events, warnings, last_sync
+
+
 router = APIRouter(
     prefix="/planning/calendar",
     tags=["planning-calendar"],
@@ -317,7 +512,8 @@ async def get_calendar_events(
             detail="Service Google Calendar indisponible et aucun CALENDAR_BASE_URL configuré.",
         )
 
-    service = GoogleCalendarService()
+    # Service partagé par le processus (credentials et clients d'API réutilisés)
+    service = await run_in_threadpool(get_calendar_service)
     if not getattr(service, "services", None):
         raise HTTPException(
             status_code=500,
@@ -348,8 +544,6 @@ async def get_calendar_events(
         )
 
     alias_list, calendar_id_list = _resolve_requested_calendars(service, calendars, settings)
-    from_utc = from_date.astimezone(UTC_TZ).replace(tzinfo=None)
-    to_utc = to_date.astimezone(UTC_TZ).replace(tzinfo=None)
     calendar_id_to_alias = {
         calendar_id: info.get("name") or calendar_id
         for calendar_id, info in service.services.items()
@@ -358,35 +552,9 @@ async def get_calendar_events(
     import sys
     print(f"[DEBUG] calendar_id_to_alias: {calendar_id_to_alias}", file=sys.stderr, flush=True)
 
-    cache_key = f"{from_date.isoformat()}_{to_date.isoformat()}_{'-'.join(alias_list)}"
-    # Désactiver temporairement le cache pour forcer la régénération avec les nouveaux alias
-    cached_events = None  # _cache_get(cache_key)
-    if cached_events is not None:
-        normalized_events = cached_events
-        warnings: List[str] = []
-    else:
-        events, warnings = service.get_events(
-            calendar_ids=calendar_id_list or None,
-            time_min=from_utc,
-            time_max=to_utc,
-            max_results=2500,
-        )
-        normalized_events = []
-        for event in events:
-            # Utiliser calendarName en priorité (défini dans get_events), sinon utiliser le mapping
-            calendar_name = event.get("calendarName")
-            calendar_id = event.get("calendar", "")
-            # calendarName devrait toujours être présent car il est ajouté dans get_events
-            if not calendar_name:
-                # Si calendarName n'est pas présent, utiliser le mapping
-                calendar_name = calendar_id_to_alias.get(calendar_id, calendar_id)
-                import sys
-                print(f"[DEBUG] calendarName manquant pour {event.get('id', '')[:20]}..., calendar_id: {calendar_id[:50]}..., alias utilisé: {calendar_name}", file=sys.stderr, flush=True)
-            alias = calendar_name
-            normalized_events.append(_normalize_event(event, alias))
-        normalized_events = _deduplicate_events(normalized_events)
-        normalized_events.sort(key=lambda item: item.get("start", ""))
-        _cache_set(cache_key, normalized_events)
+    normalized_events, warnings, last_sync = await _get_window_events(
+        service, calendar_id_list, calendar_id_to_alias, from_date, to_date
+    )
 
     total_events = len(normalized_events)
     page_size = min(pageSize or 100, 1000)
@@ -411,7 +579,7 @@ async def get_calendar_events(
         "source": {
             "calendars": alias_list,
             "aggregated": True,
-            "lastSync": datetime.utcnow().isoformat() + "Z",
+            "lastSync": last_sync,
             "warnings": warnings,
         },
         "pagination": {
@@ -445,8 +613,8 @@ async def get_google_calendar_events(
         }
     
     try:
-        # Initialiser le service (charge automatiquement les Service Accounts depuis les variables d'environnement)
-        service = GoogleCalendarService()
+        # Service partagé par le processus (Service Accounts chargés à la première utilisation)
+        service = await run_in_threadpool(get_calendar_service)
         
         # Filtrer par utilisateur si spécifié
         calendar_ids = None
@@ -463,7 +631,7 @@ async def get_google_calendar_events(
                     calendar_ids = [calendar_id]
         
         # Récupérer les événements (utilise tous les calendriers configurés si calendar_ids est None)
-        events, warnings = service.get_events(calendar_ids)
+        events, warnings = await run_in_threadpool(service.get_events, calendar_ids)
         
         # Formater les événements pour le frontend
         formatted_events = [service.format_event_for_frontend(event) for event in events]
@@ -483,3 +651,16 @@ async def get_google_calendar_events(
         }
 
 
+@router.get("/cache-stats")
+async def get_calendar_cache_stats(current_user: dict = Depends(require_role(["superAdmin"]))):
+    """Compteurs du cache des tranches journalières d'événements (worker courant)"""
+    return {
+        "success": True,
+        "data": {
+            "pid": os.getpid(),
+            **day_slice_cache.stats(),
+            "staleServed": _cache_counters["stale"],
+            "backgroundRefreshes": _cache_counters["refreshes"],
+            "refreshing": len(_refreshing),
+        },
+    }
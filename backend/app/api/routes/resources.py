@@ -0,0 +1,308 @@
+"""
+Routes CRUD des ressources JSONB (clients, leads, services, factures...)
+
+Chaque ressource est déclarée une fois dans RESOURCES ; build_router génère
+les routes list/create/get/update/delete (+ transfer) et les variantes avec
+slash final attendues par le frontend.
+
+Les GET renvoient un ETag faible (liste : nombre d'éléments et dernier
+updated_at ; élément : son updated_at) : un If-None-Match identique reçoit
+304 sans que la liste soit lue ni sérialisée. ?since= renvoie seulement les
+éléments modifiés et les ids supprimés depuis une date.
+"""
+
+from datetime import datetime, timezone
+import hashlib
+import json
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+
+from app.core.dependencies import get_current_user
+from app.services.api_keys import invalidate_company_api_keys
+from app.services.backpack import invalidate_backpacks
+from app.services.blobs import extract_inline_file, purge_orphan_blobs
+from app.services.crud import JsonbResource, encode_cursor, parse_since
+from app.services.vat import invalidate_vat_cache
+
+
+# ------- Règles propres à certaines ressources -------
+
+def _set_updated_at(data: Dict[str, Any], current_user: Dict[str, Any]) -> Dict[str, Any]:
+    """Mettre à jour updatedAt (documents, abonnements)"""
+    data["updatedAt"] = datetime.now().isoformat()
+    return data
+
+
+async def _document_defaults(data: Dict[str, Any], current_user: Dict[str, Any]) -> Dict[str, Any]:
+    """S'assurer que updatedAt est défini ; fichier inline (fileData) stocké dans la table blobs"""
+    data.setdefault("updatedAt", datetime.now().isoformat())
+    return await extract_inline_file(data)
+
+
+async def _document_update(data: Dict[str, Any], current_user: Dict[str, Any]) -> Dict[str, Any]:
+    """Mettre à jour updatedAt ; fichier inline (fileData) stocké dans la table blobs"""
+    return await extract_inline_file(_set_updated_at(data, current_user))
+
+
+def _subscription_defaults(data: Dict[str, Any], current_user: Dict[str, Any]) -> Dict[str, Any]:
+    """S'assurer que createdAt et updatedAt sont définis"""
+    now = datetime.now().isoformat()
+    data.setdefault("createdAt", now)
+    data.setdefault("updatedAt", now)
+    return data
+
+
+MAX_PAGE_SIZE = 1000
+
+
+# ------- Déclaration des ressources (préfixe d'URL -> ressource) -------
+
+RESOURCES: Dict[str, JsonbResource] = {
+    "/clients": JsonbResource(
+        "clients", "Client non trouvé",
+        allow_create_without_company=True,
+        transfer=True,
+    ),
+    "/leads": JsonbResource("leads", "Lead non trouvé", transfer=True),
+    # Le companyId existant est conservé : la mise à jour est filtrée sur l'entreprise
+    "/services": JsonbResource("services", "Service non trouvé", cache_lists=True),
+    "/categories": JsonbResource("categories", "Catégorie non trouvée", cache_lists=True),
+    "/companies": JsonbResource(
+        "companies", "Entreprise non trouvée",
+        company_scoped=False,
+        on_write=[invalidate_company_api_keys, invalidate_backpacks],
+        cache_lists=True,
+    ),
+    "/project-members": JsonbResource("project_members", "Membre non trouvé", cache_lists=True),
+    "/vendor-invoices": JsonbResource(
+        "vendor_invoices", "Facture fournisseur non trouvée",
+        date_key="issueDate",
+        columns={"issueDate": "issue_date", "status": "status"},
+        on_write=[invalidate_vat_cache],
+    ),
+    "/client-invoices": JsonbResource(
+        "client_invoices", "Facture client non trouvée",
+        date_key="issueDate",
+        columns={"issueDate": "issue_date", "status": "status", "clientId": "client_id"},
+        on_write=[invalidate_vat_cache],
+    ),
+    "/purchases": JsonbResource(
+        "purchases", "Achat non trouvé",
+        date_key="date",
+        columns={"date": "issue_date", "status": "status"},
+    ),
+    "/documents": JsonbResource(
+        "documents", "Document non trouvé",
+        date_key="updatedAt",
+        prepare_create=_document_defaults,
+        prepare_update=_document_update,
+        on_write=[purge_orphan_blobs],
+    ),
+    "/subscriptions": JsonbResource(
+        "subscriptions", "Abonnement non trouvé",
+        transfer=True,
+        date_key="startDate",
+        prepare_create=_subscription_defaults,
+        prepare_update=_set_updated_at,
+    ),
+    # Les engagements fusionnent le payload avec les données existantes
+    "/appointments": JsonbResource(
+        "appointments", "Rendez-vous non trouvé",
+        merge_on_update=True,
+        transfer=True,
+        transfer_not_found="Engagement non trouvé",
+        date_key="scheduledAt",
+        columns={"scheduledAt": "scheduled_date", "status": "status", "clientId": "client_id"},
+    ),
+}
+
+
+# ------- Streaming (?stream=1 ou Accept: application/x-ndjson) -------
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _stream_mode(request: Request, stream: Optional[str]) -> Optional[str]:
+    """"ndjson", "json" (tableau envoyé par morceaux) ou None (réponse classique)"""
+    if (stream or "").lower() == "ndjson" or NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return "ndjson"
+    if (stream or "").lower() in ("1", "true", "json"):
+        return "json"
+    return None
+
+
+async def _ndjson_body(rows: AsyncIterator[Tuple[str, Any, str]], limit: Optional[int]) -> AsyncIterator[str]:
+    """Une ligne JSON par élément, envoyée dès sa lecture"""
+    count = 0
+    try:
+        async for item, _created_at, _item_id in rows:
+            if limit and count >= limit:
+                break
+            count += 1
+            yield item + "\n"
+    finally:
+        # Rendre la connexion au pool sans attendre le ramasse-miettes
+        await rows.aclose()
+
+
+async def _json_body(rows: AsyncIterator[Tuple[str, Any, str]], limit: Optional[int], paginated: bool) -> AsyncIterator[str]:
+    """Même enveloppe que la réponse classique ({"success", "data"[, "nextCursor"]}), envoyée par morceaux"""
+    count = 0
+    last = None
+    next_cursor = None
+    try:
+        yield '{"success": true, "data": ['
+        async for item, created_at, item_id in rows:
+            if limit and count >= limit:
+                # La ligne supplémentaire indique qu'il existe une page suivante
+                next_cursor = encode_cursor(*last)
+                break
+            yield ("," if count else "") + item
+            count += 1
+            last = (created_at, item_id)
+    finally:
+        await rows.aclose()
+    tail = "]"
+    if paginated:
+        tail += ', "nextCursor": ' + json.dumps(next_cursor)
+    yield tail + "}"
+
+
+# ------- Requêtes conditionnelles (ETag / If-None-Match) -------
+
+# Le navigateur revalide à chaque fois ; la réponse dépend de l'utilisateur et de l'entreprise active
+CONDITIONAL_HEADERS = {
+    "Cache-Control": "private, no-cache",
+    "Vary": "Authorization, X-Active-Company-Id",
+}
+
+
+def _weak_etag(*parts: Any) -> str:
+    digest = hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match (liste d'ETags ou *), comparaison faible comme l'impose la RFC 9110"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == bare for candidate in header.split(","))
+
+
+def _conditional_headers(etag: str, last_modified: Optional[datetime]) -> Dict[str, str]:
+    headers = {**CONDITIONAL_HEADERS, "ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = last_modified.astimezone(timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT")
+    return headers
+
+
+def build_router(prefix: str, resource: JsonbResource) -> APIRouter:
+    """Génère les routes CRUD d'une ressource"""
+    router = APIRouter(prefix=prefix, tags=[resource.table])
+
+    # Variantes avec slash final pour la compatibilité frontend
+    @router.get("")
+    @router.get("/")
+    async def list_items(
+        request: Request,
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Taille de page (active la pagination)"),
+        cursor: Optional[str] = Query(None, description="Curseur nextCursor de la page précédente"),
+        fields: Optional[str] = Query(None, description="Clés à retourner, séparées par des virgules"),
+        status: Optional[str] = None,
+        clientId: Optional[str] = None,
+        date_from: Optional[str] = Query(None, alias="from", description="Date de début incluse (AAAA-MM-JJ)"),
+        date_to: Optional[str] = Query(None, alias="to", description="Date de fin incluse (AAAA-MM-JJ)"),
+        stream: Optional[str] = Query(None, description="1/json : JSON envoyé par morceaux, ndjson : une ligne par élément"),
+        since: Optional[str] = Query(None, description="Date ISO : éléments modifiés et ids supprimés depuis (nextSince de la réponse précédente)"),
+        current_user: dict = Depends(get_current_user),
+    ):
+        if since is not None:
+            if any(value is not None for value in (limit, cursor, status, clientId, date_from, date_to, stream)):
+                raise HTTPException(status_code=400, detail="since ne se combine qu'avec fields")
+            items, deleted, next_since = await resource.changes(current_user, parse_since(since), fields)
+            return {"success": True, "data": items, "deleted": deleted, "nextSince": next_since.isoformat()}
+
+        options = {
+            "cursor": cursor,
+            "fields": fields,
+            "status": status,
+            "client_id": clientId,
+            "date_from": date_from,
+            "date_to": date_to,
+        }
+        stream_mode = _stream_mode(request, stream)
+        if stream_mode:
+            rows = resource.stream(current_user, limit=limit, **options)
+            if stream_mode == "ndjson":
+                return StreamingResponse(_ndjson_body(rows, limit), media_type=NDJSON_MEDIA_TYPE)
+            paginated = limit is not None or cursor is not None
+            return StreamingResponse(_json_body(rows, limit, paginated), media_type="application/json")
+
+        cached = None
+        if resource.cache_lists and all(value is None for value in (limit, cursor, status, clientId, date_from, date_to)):
+            # Liste de référence complète : ni requête ni connexion si elle est en cache
+            cached = await resource.cached_list(current_user, fields)
+            count, last_modified = cached[1], cached[2]
+        else:
+            count, last_modified = await resource.version(
+                current_user, status=status, client_id=clientId, date_from=date_from, date_to=date_to,
+            )
+        etag = _weak_etag(
+            resource.table, current_user.get("companyId"), count, last_modified,
+            sorted(request.query_params.multi_items()),
+        )
+        headers = _conditional_headers(etag, last_modified)
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+
+        response.headers.update(headers)
+        if cached is not None:
+            return {"success": True, "data": cached[0]}
+        items, next_cursor = await resource.list(current_user, limit=limit, **options)
+        # Sans limit ni curseur : réponse identique à l'historique (tableau complet)
+        if limit is None and cursor is None:
+            return {"success": True, "data": items}
+        return {"success": True, "data": items, "nextCursor": next_cursor}
+
+    @router.post("", status_code=201)
+    @router.post("/", status_code=201)
+    async def create_item(payload: Dict[str, Any], current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
+        return {"success": True, "data": await resource.create(payload, current_user)}
+
+    @router.get("/{item_id}")
+    async def get_item(item_id: str, request: Request, response: Response, current_user: dict = Depends(get_current_user)):
+        item, updated_at = await resource.get_versioned(item_id, current_user)
+        headers = _conditional_headers(_weak_etag(resource.table, item_id, updated_at), updated_at)
+        if etag_matches(request, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return {"success": True, "data": item}
+
+    @router.put("/{item_id}")
+    async def update_item(item_id: str, payload: Dict[str, Any], current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
+        return {"success": True, "data": await resource.update(item_id, payload, current_user)}
+
+    @router.delete("/{item_id}", status_code=200)
+    async def delete_item(item_id: str, current_user: dict = Depends(get_current_user)):
+        await resource.delete(item_id, current_user)
+        return {"success": True}
+
+    if resource.transfer:
+        @router.post("/{item_id}/transfer", status_code=200)
+        async def transfer_item(item_id: str, payload: Dict[str, Any], current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
+            """Transfère l'élément vers une autre entreprise (payload: targetCompanyId)"""
+            return {"success": True, "data": await resource.transfer(item_id, payload, current_user)}
+
+    return router
+
+
+router = APIRouter()
+for _prefix, _resource in RESOURCES.items():
+    router.include_router(build_router(_prefix, _resource))
@@ -52,7 +52,7 @@ def link_to_existing_crm_client(email: str, company_id: str) -> Optional[str]:
             # Vérifier dans les contacts des clients
             cur.execute("""
                 SELECT id FROM clients 
-                WHERE data->>'companyId' = %s 
+                WHERE company_id = %s 
                 AND (
                     data->>'email' = %s 
                     OR EXISTS (
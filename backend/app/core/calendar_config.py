@@ -1,4 +1,5 @@
 from typing import Optional
+from pydantic import AliasChoices, Field
 from pydantic_settings import BaseSettings
 
 
@@ -6,6 +7,15 @@ class CalendarSettings(BaseSettings):
     base_url: Optional[str] = None  # CALENDAR_BASE_URL (ex: https://mon-projet-calendrier.vercel.app)
     default_calendars: str = "adrien,clement"  # CALENDAR_DEFAULT_CALENDARS
     max_range_days: int = 90  # CALENDAR_MAX_RANGE_DAYS
+    # Copie locale des calendriers Google : intervalle de synchronisation (0 : désactivée)
+    sync_interval_seconds: int = 60  # CALENDAR_SYNC_INTERVAL_SECONDS
+    sync_history_days: int = 365  # CALENDAR_SYNC_HISTORY_DAYS (historique copié)
+    # Cache des événements normalisés par jour et par calendrier (par worker) :
+    # frais pendant cache_ttl_seconds (0 : désactivé), puis servis encore
+    # cache_stale_seconds pendant leur rafraîchissement en arrière-plan
+    cache_ttl_seconds: int = Field(60, validation_alias=AliasChoices("CALENDAR_CACHE_TTL_SECONDS", "CACHE_TTL_SECONDS"))
+    cache_stale_seconds: int = 600  # CALENDAR_CACHE_STALE_SECONDS
+    cache_max_slices: int = 5000  # CALENDAR_CACHE_MAX_SLICES (jours × calendriers)
 
     class Config:
         env_prefix = "CALENDAR_"
@@ -0,0 +1,128 @@
+"""
+Pool de connexions PostgreSQL partagé par le processus (un pool par worker uvicorn)
+"""
+
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+from app.core.config import settings
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+_async_pool: Optional[AsyncConnectionPool] = None
+_async_pool_lock: Optional[asyncio.Lock] = None
+
+
+def _get_dsn() -> str:
+    return os.getenv("DATABASE_URL", settings.DATABASE_URL)
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Retourne le pool de connexions du processus, créé et ouvert au premier appel.
+    Chaque worker uvicorn étant un processus distinct, chacun possède son propre pool.
+    """
+    global _pool
+    if _pool is not None:
+        return _pool
+    with _pool_lock:
+        if _pool is None:
+            pool = ConnectionPool(
+                _get_dsn(),
+                min_size=settings.DB_POOL_MIN_SIZE,
+                max_size=settings.DB_POOL_MAX_SIZE,
+                max_idle=settings.DB_POOL_MAX_IDLE,
+                max_lifetime=settings.DB_POOL_MAX_LIFETIME,
+                timeout=settings.DB_POOL_TIMEOUT,
+                kwargs={"autocommit": True},
+                # Vérifie la connexion (SELECT 1) avant de la confier à l'appelant
+                check=ConnectionPool.check_connection,
+                name="erp-sync",
+                open=False,
+            )
+            pool.open(wait=False)
+            _pool = pool
+    return _pool
+
+
+def close_pool() -> None:
+    """Ferme le pool (arrêt de l'application)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """
+    Retourne le pool asynchrone du processus (psycopg.AsyncConnection).
+    Il doit être ouvert depuis la boucle d'événements : on l'ouvre au démarrage,
+    ou à défaut au premier appel.
+    """
+    global _async_pool, _async_pool_lock
+    if _async_pool is not None:
+        return _async_pool
+    if _async_pool_lock is None:
+        _async_pool_lock = asyncio.Lock()
+    async with _async_pool_lock:
+        if _async_pool is None:
+            pool = AsyncConnectionPool(
+                _get_dsn(),
+                min_size=settings.DB_POOL_MIN_SIZE,
+                max_size=settings.DB_POOL_MAX_SIZE,
+                max_idle=settings.DB_POOL_MAX_IDLE,
+                max_lifetime=settings.DB_POOL_MAX_LIFETIME,
+                timeout=settings.DB_POOL_TIMEOUT,
+                kwargs={"autocommit": True},
+                check=AsyncConnectionPool.check_connection,
+                name="erp-async",
+                open=False,
+            )
+            await pool.open(wait=False)
+            _async_pool = pool
+    return _async_pool
+
+
+@asynccontextmanager
+async def get_async_connection(timeout: Optional[float] = None) -> AsyncIterator[psycopg.AsyncConnection]:
+    """
+    Équivalent asynchrone de get_db_connection :
+    `async with get_async_connection() as conn, conn.cursor() as cur`
+    timeout : attente max d'une connexion libre (défaut DB_POOL_TIMEOUT), PoolTimeout au-delà
+    """
+    pool = await get_async_pool()
+    async with pool.connection(timeout=timeout) as conn:
+        yield conn
+
+
+async def connect_async_dedicated() -> psycopg.AsyncConnection:
+    """
+    Connexion asynchrone hors pool, pour un usage qui l'occupe en permanence
+    (écoute LISTEN/NOTIFY) ; l'appelant la ferme
+    """
+    return await psycopg.AsyncConnection.connect(_get_dsn(), autocommit=True)
+
+
+async def close_async_pool() -> None:
+    """Ferme le pool asynchrone (arrêt de l'application)"""
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Statistiques des pools (taille, connexions disponibles, attentes, erreurs...)"""
+    stats: Dict[str, Any] = {}
+    stats["sync"] = {"open": True, **_pool.get_stats()} if _pool is not None else {"open": False}
+    stats["async"] = {"open": True, **_async_pool.get_stats()} if _async_pool is not None else {"open": False}
+    return stats
@@ -4,22 +4,71 @@ Dépendances FastAPI pour l'authentification
 
 from fastapi import Depends, HTTPException, Header, status, Request
 from typing import Optional, List, Dict, Any
+from app.core.cache import TTLCache
+from app.core.config import settings
 from app.core.security import decode_access_token
-import os
-import psycopg
+from app.core.database import get_pool, get_async_connection
+from app.core.notifications import notify, subscribe
+
+
+# Données (colonne data) des utilisateurs résolus par get_current_user, par id.
+# TTL court : borne le décalage si une invalidation entre workers est perdue.
+principal_cache = TTLCache("principals", maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
+
+# Canal NOTIFY des écritures sur la table users (payload : id de l'utilisateur)
+USERS_CHANNEL = "erp_users_changed"
+
+subscribe(USERS_CHANNEL, principal_cache.delete)
+
+
+def invalidate_user(user_id: str) -> None:
+    """
+    À appeler après toute écriture sur la table users : retire l'utilisateur du
+    cache du worker courant puis des autres workers (NOTIFY).
+    """
+    principal_cache.delete(user_id)
+    notify(USERS_CHANNEL, user_id)
 
 
 def get_db_connection():
-    """Connexion à la base de données"""
-    from app.core.config import settings
-    dsn = os.getenv("DATABASE_URL", settings.DATABASE_URL)
-    return psycopg.connect(dsn, autocommit=True)
+    """
+    Connexion à la base de données, empruntée au pool du processus.
+    S'utilise comme avant : `with get_db_connection() as conn` (la connexion
+    est rendue au pool à la sortie du bloc au lieu d'être fermée).
+    """
+    return get_pool().connection()
+
+
+def get_async_db_connection():
+    """
+    Connexion asynchrone (psycopg.AsyncConnection) empruntée au pool asynchrone.
+    Utilisation : `async with get_async_db_connection() as conn, conn.cursor() as cur`
+    """
+    return get_async_connection()
+
+
+async def get_user_data(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Données (colonne data) de l'utilisateur : cache du worker (principal_cache),
+    sinon base de données. None si l'utilisateur n'existe pas.
+    """
+    user_data = principal_cache.get(user_id)
+    if user_data is not None:
+        return user_data
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT data FROM users WHERE id = %s;", (user_id,), prepare=True)
+        row = await cur.fetchone()
+    if not row:
+        return None
+    principal_cache.set(user_id, row[0])
+    return row[0]
 
 
 async def get_current_user(request: Request) -> Dict[str, Any]:
     """
     Dépendance FastAPI pour récupérer l'utilisateur actuellement authentifié.
-    Récupère les données complètes de l'utilisateur depuis la base de données.
+    Récupère les données complètes de l'utilisateur depuis la base de données,
+    mises en cache par worker (principal_cache, invalidé par invalidate_user).
     
     Priorité pour companyId:
     1. Header X-Active-Company-Id (entreprise active sélectionnée par l'utilisateur)
@@ -33,11 +82,9 @@ async def get_current_user(request: Request) -> Dict[str, Any]:
     # Récupérer le header Authorization directement depuis la requête
     authorization = request.headers.get("Authorization") or request.headers.get("authorization")
     
-    # Debug: afficher ce qui est reçu
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.warning(f"[get_current_user] Authorization header reçu: {authorization is not None}, valeur: {authorization[:50] if authorization else 'None'}...")
-    logger.warning(f"[get_current_user] Tous les headers: {dict(request.headers)}")
+    if settings.DEBUG:
+        # Noms des headers uniquement : le token ne doit pas finir dans les logs
+        print(f"[Auth] {request.method} {request.url.path} Authorization: {authorization is not None}, headers: {list(request.headers.keys())}")
     
     if not authorization:
         raise HTTPException(
@@ -82,53 +129,47 @@ async def get_current_user(request: Request) -> Dict[str, Any]:
     # Récupérer l'ID de l'entreprise active depuis le header (priorité)
     active_company_id = request.headers.get("X-Active-Company-Id") or request.headers.get("x-active-company-id")
     
-    # Récupérer l'utilisateur depuis la base de données
+    # Récupérer l'utilisateur : cache du worker, sinon base de données
     try:
-        with get_db_connection() as conn, conn.cursor() as cur:
-            cur.execute("SELECT id, data FROM users WHERE id = %s;", (user_id,))
-            row = cur.fetchone()
-            
-            if not row:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Utilisateur non trouvé",
-                )
-            
-            user_data = row[1]
-            
-            # Vérifier si l'utilisateur est actif
-            if not user_data.get("active", True):
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="Compte désactivé",
-                )
-            
-            # Déterminer le companyId à utiliser
-            # Priorité: 1) Header X-Active-Company-Id, 2) companyId de l'utilisateur
-            user_company_id = user_data.get("companyId")
-            final_company_id = active_company_id if active_company_id else user_company_id
-            
-            # Retourner les données complètes de l'utilisateur
-            return {
-                "id": row[0],
-                "username": user_data.get("username", ""),
-                "fullName": user_data.get("fullName", ""),
-                "role": user_data.get("role", "agent"),
-                "active": user_data.get("active", True),
-                "pages": user_data.get("pages", []),
-                "permissions": user_data.get("permissions", []),
-                "companyId": final_company_id,  # Utiliser le companyId déterminé
-                "profile": user_data.get("profile", {}),
-                "notificationPreferences": user_data.get("notificationPreferences", {}),
-            }
-    except HTTPException:
-        raise
+        user_data = await get_user_data(user_id)
     except Exception as e:
         print(f"[Auth] Erreur lors de la récupération de l'utilisateur: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Erreur lors de la récupération de l'utilisateur",
         )
+    
+    if user_data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Utilisateur non trouvé",
+        )
+    
+    # Vérifier si l'utilisateur est actif
+    if not user_data.get("active", True):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Compte désactivé",
+        )
+    
+    # Déterminer le companyId à utiliser
+    # Priorité: 1) Header X-Active-Company-Id, 2) companyId de l'utilisateur
+    user_company_id = user_data.get("companyId")
+    final_company_id = active_company_id if active_company_id else user_company_id
+    
+    # Retourner les données complètes de l'utilisateur
+    return {
+        "id": user_id,
+        "username": user_data.get("username", ""),
+        "fullName": user_data.get("fullName", ""),
+        "role": user_data.get("role", "agent"),
+        "active": user_data.get("active", True),
+        "pages": list(user_data.get("pages", [])),
+        "permissions": list(user_data.get("permissions", [])),
+        "companyId": final_company_id,  # Utiliser le companyId déterminé
+        "profile": dict(user_data.get("profile", {})),
+        "notificationPreferences": dict(user_data.get("notificationPreferences", {})),
+    }
 
 
 def require_role(allowed_roles: List[str]):
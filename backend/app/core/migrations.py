@@ -0,0 +1,83 @@
+"""
+Migrations de schéma versionnées, appliquées au démarrage de l'application
+
+Les fichiers app/migrations/NNNN_description.sql sont exécutés dans l'ordre,
+une seule fois, chacun dans sa propre transaction ; les versions appliquées
+sont enregistrées dans la table schema_migrations.
+
+Un verrou consultatif PostgreSQL sérialise l'exécution : les workers uvicorn
+démarrent en parallèle mais un seul applique les migrations, les autres
+attendent puis constatent qu'il n'y a plus rien à faire.
+
+Les scripts de backend/migrations/ (reprise de données ponctuelle) restent
+manuels.
+"""
+
+import re
+from pathlib import Path
+from typing import List, Tuple
+
+from app.core.dependencies import get_db_connection
+
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+MIGRATION_FILE_RE = re.compile(r"^(\d{4})_(.+)\.sql$")
+
+# Identifiant arbitraire du verrou consultatif (pg_advisory_lock)
+MIGRATIONS_LOCK_ID = 7_202_411
+
+
+def list_migrations() -> List[Tuple[str, str, Path]]:
+    """(version, nom, chemin) des migrations disponibles, triées par version"""
+    migrations = []
+    for path in MIGRATIONS_DIR.glob("*.sql"):
+        match = MIGRATION_FILE_RE.match(path.name)
+        if match:
+            migrations.append((match.group(1), match.group(2), path))
+    return sorted(migrations)
+
+
+def run_migrations() -> List[str]:
+    """
+    Applique les migrations manquantes et retourne les versions appliquées.
+    Une migration en échec est annulée (transaction) et l'erreur est propagée :
+    le code applicatif suppose que le schéma est à jour.
+    """
+    applied: List[str] = []
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s);", (MIGRATIONS_LOCK_ID,))
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                      version TEXT PRIMARY KEY,
+                      name TEXT NOT NULL,
+                      applied_at TIMESTAMPTZ DEFAULT NOW()
+                    );
+                    """
+                )
+                cur.execute("SELECT version FROM schema_migrations;")
+                done = {row[0] for row in cur.fetchall()}
+
+            for version, name, path in list_migrations():
+                if version in done:
+                    continue
+                sql = path.read_text(encoding="utf-8")
+                try:
+                    with conn.transaction(), conn.cursor() as cur:
+                        cur.execute(sql)
+                        cur.execute(
+                            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                            (version, name),
+                        )
+                except Exception as e:
+                    print(f"[DB] Migration {version}_{name} en échec: {e}")
+                    raise
+                print(f"[DB] Migration {version}_{name} appliquée")
+                applied.append(version)
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATIONS_LOCK_ID,))
+    return applied
@@ -0,0 +1,89 @@
+"""
+Invalidation des caches entre workers via PostgreSQL LISTEN/NOTIFY
+
+Chaque worker uvicorn garde ses caches en mémoire (app/core/cache.py). Quand
+un worker modifie une donnée mise en cache, il l'invalide chez lui puis publie
+un NOTIFY ; la tâche d'écoute de chaque worker (connexion dédiée, hors pool)
+reçoit le message et appelle les callbacks abonnés au canal.
+
+Le TTL des caches reste le filet de sécurité : un message perdu pendant une
+reconnexion n'est rattrapé qu'à l'expiration de l'entrée.
+"""
+
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+from psycopg import sql
+
+from app.core.database import connect_async_dedicated, get_async_connection, get_pool
+
+
+# Délai avant reconnexion de l'écoute après une erreur (secondes)
+LISTENER_RETRY_DELAY = 5.0
+
+_subscribers: Dict[str, List[Callable[[str], None]]] = {}
+_listener_task: Optional[asyncio.Task] = None
+
+
+def subscribe(channel: str, callback: Callable[[str], None]) -> None:
+    """Abonne callback(payload) au canal (à appeler à l'import du module concerné)"""
+    _subscribers.setdefault(channel, []).append(callback)
+
+
+def notify(channel: str, payload: str) -> None:
+    """Publie un message aux autres workers (et à soi-même) ; n'échoue jamais"""
+    try:
+        with get_pool().connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_notify(%s, %s);", (channel, payload))
+    except Exception as e:
+        print(f"[DB] NOTIFY {channel} en échec: {e}")
+
+
+async def notify_async(channel: str, payload: str) -> None:
+    """notify() depuis un handler asynchrone (pool asynchrone)"""
+    try:
+        async with get_async_connection() as conn, conn.cursor() as cur:
+            await cur.execute("SELECT pg_notify(%s, %s);", (channel, payload))
+    except Exception as e:
+        print(f"[DB] NOTIFY {channel} en échec: {e}")
+
+
+def _dispatch(channel: str, payload: str) -> None:
+    for callback in _subscribers.get(channel, []):
+        try:
+            callback(payload)
+        except Exception as e:
+            print(f"[DB] Callback NOTIFY {channel} en échec: {e}")
+
+
+async def _listen() -> None:
+    while True:
+        try:
+            async with await connect_async_dedicated() as conn:
+                for channel in _subscribers:
+                    await conn.execute(sql.SQL("LISTEN {};").format(sql.Identifier(channel)))
+                async for message in conn.notifies():
+                    _dispatch(message.channel, message.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[DB] Écoute NOTIFY interrompue: {e} (reconnexion dans {LISTENER_RETRY_DELAY:.0f}s)")
+            await asyncio.sleep(LISTENER_RETRY_DELAY)
+
+
+def start_listener() -> None:
+    """Démarre la tâche d'écoute du worker (startup, dans la boucle d'événements)"""
+    global _listener_task
+    if _listener_task is None and _subscribers:
+        _listener_task = asyncio.get_running_loop().create_task(_listen())
+
+
+async def stop_listener() -> None:
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+        _listener_task = None
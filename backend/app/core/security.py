@@ -1,9 +1,20 @@
 """
 Utilitaires de sécurité pour l'authentification
+
+bcrypt (coût 12 : ~250 ms de CPU par appel) est exécuté dans un pool de
+processus dédié et borné (submit_password_task) : une rafale de connexions
+n'occupe ni la boucle d'événements ni le threadpool des handlers, et au-delà
+de PASSWORD_POOL_MAX_PENDING tâches en attente la requête est refusée
+immédiatement (503) au lieu de faire la queue.
 """
 
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Optional
+from fastapi import HTTPException, status
 from jose import JWTError, jwt
 import bcrypt
 from app.core.config import settings
@@ -28,11 +39,81 @@ def get_password_hash(password: str) -> str:
     if len(password.encode('utf-8')) > 72:
         password = password[:72]
     # Générer le salt et hasher le mot de passe
-    salt = bcrypt.gensalt(rounds=12)
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
 
+def needs_rehash(hashed_password: str) -> bool:
+    """
+    Vrai si le hash a été calculé avec un coût inférieur à BCRYPT_ROUNDS
+    ($2b$<coût>$...) : un hash n'est jamais remplacé par un hash plus faible
+    """
+    try:
+        return int(hashed_password.split("$")[2]) < settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+# ------- Pool de processus bcrypt (un par worker uvicorn) -------
+
+_password_pool: Optional[ProcessPoolExecutor] = None
+_password_pool_lock = threading.Lock()
+# Tâches en cours + en attente ; acquis sans bloquer, libéré à la fin de la tâche
+_password_slots = threading.BoundedSemaphore(settings.PASSWORD_POOL_MAX_PENDING)
+
+
+def _get_password_pool() -> ProcessPoolExecutor:
+    global _password_pool
+    if _password_pool is not None:
+        return _password_pool
+    with _password_pool_lock:
+        if _password_pool is None:
+            # spawn : ne pas dupliquer par fork les threads du worker (pools psycopg...)
+            _password_pool = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_POOL_SIZE,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _password_pool
+
+
+def submit_password_task(fn: Callable[..., Any], *args: Any) -> Future:
+    """
+    Exécute fn(*args) (verify_password, get_password_hash) dans le pool bcrypt.
+    Lève une HTTPException 503 si la file d'attente du worker est pleine.
+    """
+    if not _password_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Serveur occupé, veuillez réessayer dans quelques instants",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        future = _get_password_pool().submit(fn, *args)
+    except Exception:
+        _password_slots.release()
+        raise
+    future.add_done_callback(lambda _: _password_slots.release())
+    return future
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.wrap_future(submit_password_task(verify_password, plain_password, hashed_password))
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await asyncio.wrap_future(submit_password_task(get_password_hash, password))
+
+
+def shutdown_password_pool() -> None:
+    """Arrête les processus bcrypt (arrêt de l'application)"""
+    global _password_pool
+    with _password_pool_lock:
+        if _password_pool is not None:
+            _password_pool.shutdown(wait=False, cancel_futures=True)
+            _password_pool = None
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Crée un token JWT"""
     to_encode = data.copy()
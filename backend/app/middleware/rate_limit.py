@@ -1,136 +1,207 @@
 """
 Middleware de rate limiting pour protéger l'API contre les attaques
+
+Algorithme du seau à jetons : chaque clé dispose de `max_requests` jetons,
+rechargés en continu à raison de max_requests / window_seconds par seconde.
+Une requête consomme un jeton ; le travail par requête est O(1) (deux nombres
+par clé, pas de liste d'horodatages).
+
+Deux backends :
+- "postgres" (défaut) : seaux partagés par tous les workers uvicorn dans la
+  table UNLOGGED rate_limit_buckets (migration 0003), la limite configurée
+  est donc la limite réelle de l'API ;
+- "memory" : seaux locaux au worker (limite réelle = limite × nombre de workers).
+  Sert aussi de repli si PostgreSQL est indisponible, ou si aucune connexion
+  du pool ne se libère en RATE_LIMIT_DB_TIMEOUT : le rate limiting ne fait
+  pas attendre les requêtes derrière les handlers quand le pool est saturé.
 """
-from fastapi import Request, HTTPException, status
+from fastapi import Request, status
 from fastapi.responses import JSONResponse
-from collections import defaultdict
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from dataclasses import dataclass
+import math
 import time
-from typing import Dict, Tuple
+from typing import Optional, Tuple
 
+from app.core.config import settings
+from app.core.database import get_async_connection
+from app.core.security import decode_access_token
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """Limite appliquée aux chemins commençant par `prefix`"""
+    name: str
+    prefix: str
+    max_requests: int
+    window_seconds: int
+    # Compter par utilisateur authentifié (sub du JWT) plutôt que par IP
+    per_user: bool = True
+
+
+# Première politique dont le préfixe correspond (la dernière attrape tout)
+POLICIES = [
+    # Limite plus permissive pour les tentatives de login (éviter les blocages lors de connexions rapides)
+    RateLimitPolicy("login", "/auth/login", max_requests=20, window_seconds=60, per_user=False),
+    RateLimitPolicy("api", "/api", max_requests=60, window_seconds=60),
+    RateLimitPolicy("default", "", max_requests=100, window_seconds=60),
+]
+
+# Chemins non limités
+EXEMPT_PATHS = {"/health"}
+
+
+class MemoryBackend:
+    """Seaux à jetons en mémoire du worker, LRU borné à max_keys clés"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, capacity: float, rate: float) -> float:
+        """Consomme un jeton ; retourne les jetons restants, ou -1 si refusé"""
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.buckets[key] = (tokens, now)
+        self.buckets.move_to_end(key)
+        # Une clé évincée est une clé inactive depuis longtemps : son seau serait plein
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return tokens if allowed else -1
+
+
+class PostgresBackend:
+    """Seaux à jetons partagés entre workers (table UNLOGGED, fonction rate_limit_take)"""
+
+    # Suppression des seaux inactifs (pleins depuis longtemps), par worker
+    purge_interval = 600
+    purge_idle_seconds = 3600
 
-class RateLimiter:
-    """Rate limiter simple en mémoire (pour production, utiliser Redis)"""
-    
     def __init__(self):
-        self.requests: Dict[str, list] = defaultdict(list)
-        self.cleanup_interval = 300  # Nettoyer toutes les 5 minutes
-        self.last_cleanup = time.time()
-    
-    def is_allowed(
-        self, 
-        key: str, 
-        max_requests: int = 60, 
+        self.last_purge = time.monotonic()
+
+    async def take(self, key: str, capacity: float, rate: float) -> float:
+        async with get_async_connection(timeout=settings.RATE_LIMIT_DB_TIMEOUT) as conn, conn.cursor() as cur:
+            await cur.execute("SELECT rate_limit_take(%s, %s, %s);", (key, capacity, rate), prepare=True)
+            remaining = (await cur.fetchone())[0]
+            if time.monotonic() - self.last_purge > self.purge_interval:
+                self.last_purge = time.monotonic()
+                await cur.execute(
+                    "DELETE FROM rate_limit_buckets WHERE updated_at < extract(epoch FROM clock_timestamp()) - %s;",
+                    (self.purge_idle_seconds,),
+                )
+        return remaining
+
+
+class RateLimiter:
+    """Rate limiter par seau à jetons, backend partagé avec repli en mémoire"""
+
+    # Délai minimal entre deux logs d'erreur du backend (secondes)
+    error_log_interval = 60
+
+    def __init__(self, backend: Optional[str] = None):
+        self.fallback = MemoryBackend()
+        self.backend = PostgresBackend() if (backend or settings.RATE_LIMIT_BACKEND) == "postgres" else self.fallback
+        self.last_error_log = 0.0
+
+    async def is_allowed(
+        self,
+        key: str,
+        max_requests: int = 60,
         window_seconds: int = 60
     ) -> Tuple[bool, int]:
         """
         Vérifie si une requête est autorisée
-        
+
         Args:
             key: Identifiant unique (IP, user_id, etc.)
-            max_requests: Nombre maximum de requêtes
-            window_seconds: Fenêtre de temps en secondes
-            
+            max_requests: Nombre maximum de requêtes (capacité du seau)
+            window_seconds: Fenêtre de temps en secondes (durée de recharge complète)
+
         Returns:
             (is_allowed, remaining_requests)
         """
-        now = time.time()
-        
-        # Nettoyage périodique
-        if now - self.last_cleanup > self.cleanup_interval:
-            self._cleanup(now)
-            self.last_cleanup = now
-        
-        # Nettoyer les requêtes expirées pour cette clé
-        cutoff = now - window_seconds
-        self.requests[key] = [
-            req_time for req_time in self.requests[key] 
-            if req_time > cutoff
-        ]
-        
-        # Vérifier la limite
-        if len(self.requests[key]) >= max_requests:
-            remaining = 0
-            return False, remaining
-        
-        # Ajouter la requête actuelle
-        self.requests[key].append(now)
-        remaining = max_requests - len(self.requests[key])
-        
-        return True, remaining
-    
-    def _cleanup(self, now: float):
-        """Nettoie les entrées expirées"""
-        cutoff = now - 3600  # Garder seulement la dernière heure
-        keys_to_remove = []
-        
-        for key, requests in self.requests.items():
-            self.requests[key] = [
-                req_time for req_time in requests 
-                if req_time > cutoff
-            ]
-            if not self.requests[key]:
-                keys_to_remove.append(key)
-        
-        for key in keys_to_remove:
-            del self.requests[key]
+        rate = max_requests / window_seconds
+        try:
+            remaining = await self.backend.take(key, max_requests, rate)
+        except Exception as e:
+            now = time.monotonic()
+            if now - self.last_error_log > self.error_log_interval:
+                self.last_error_log = now
+                print(f"[RateLimit] Backend indisponible, repli en mémoire: {e}")
+            remaining = await self.fallback.take(key, max_requests, rate)
+        if remaining < 0:
+            return False, 0
+        return True, int(remaining)
 
 
 # Instance globale
 rate_limiter = RateLimiter()
 
 
+def get_policy(path: str) -> RateLimitPolicy:
+    for policy in POLICIES:
+        if path.startswith(policy.prefix):
+            return policy
+    return POLICIES[-1]
+
+
+def get_identity(request: Request, policy: RateLimitPolicy) -> str:
+    """Utilisateur authentifié (JWT valide, sans accès base) sinon IP du client"""
+    if policy.per_user:
+        authorization = request.headers.get("Authorization")
+        if authorization and authorization.lower().startswith("bearer "):
+            payload = decode_access_token(authorization[7:].strip())
+            if payload and payload.get("sub"):
+                return f"user:{payload['sub']}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
 async def rate_limit_middleware(request: Request, call_next):
     """
     Middleware de rate limiting
     """
-    # Ignorer pour les health checks
-    if request.url.path == "/health":
+    # Ignorer pour les health checks (ou si le rate limiting est désactivé)
+    if not settings.RATE_LIMIT_ENABLED or request.url.path in EXEMPT_PATHS:
         return await call_next(request)
-    
-    # Récupérer l'IP du client
-    client_ip = request.client.host if request.client else "unknown"
-    
-    # Limites différentes selon le type de requête
-    if request.url.path.startswith("/auth/login"):
-        # Limite plus permissive pour les tentatives de login (éviter les blocages lors de connexions rapides)
-        max_requests = 20
-        window = 60  # 1 minute
-    elif request.url.path.startswith("/api"):
-        # Limite normale pour l'API
-        max_requests = 60
-        window = 60  # 1 minute
-    else:
-        # Limite générale
-        max_requests = 100
-        window = 60
-    
+
+    policy = get_policy(request.url.path)
+    max_requests = policy.max_requests
+    window = policy.window_seconds
+
     # Vérifier la limite
-    is_allowed, remaining = rate_limiter.is_allowed(
-        key=client_ip,
+    is_allowed, remaining = await rate_limiter.is_allowed(
+        key=f"{policy.name}:{get_identity(request, policy)}",
         max_requests=max_requests,
         window_seconds=window
     )
-    
+
     if not is_allowed:
+        # Temps de recharge d'un jeton
+        retry_after = max(1, math.ceil(window / max_requests))
         return JSONResponse(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             content={
                 "detail": "Trop de requêtes. Veuillez réessayer plus tard.",
-                "retry_after": window
+                "retry_after": retry_after
             },
             headers={
                 "X-RateLimit-Limit": str(max_requests),
                 "X-RateLimit-Remaining": "0",
-                "X-RateLimit-Reset": str(int(time.time()) + window),
-                "Retry-After": str(window)
+                "X-RateLimit-Reset": str(int(time.time()) + retry_after),
+                "Retry-After": str(retry_after)
             }
         )
-    
+
     # Ajouter les headers de rate limit
     response = await call_next(request)
     response.headers["X-RateLimit-Limit"] = str(max_requests)
     response.headers["X-RateLimit-Remaining"] = str(remaining)
-    response.headers["X-RateLimit-Reset"] = str(int(time.time()) + window)
-    
+    # Seau de nouveau plein (jetons consommés rechargés)
+    response.headers["X-RateLimit-Reset"] = str(int(time.time()) + math.ceil((max_requests - remaining) * window / max_requests))
+
     return response
@@ -0,0 +1,109 @@
+-- Migration 0001 : colonnes générées pour les clés JSONB les plus filtrées
+-- companyId sur toutes les tables multi-entreprises, dates/statut/client/montants
+-- sur les factures, achats et engagements, avec des index b-tree composites.
+
+-- Conversions IMMUTABLE (obligatoire pour une colonne générée) et tolérantes :
+-- une valeur mal formée donne NULL au lieu de faire échouer l'écriture.
+CREATE OR REPLACE FUNCTION erp_iso_date(value TEXT) RETURNS DATE
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+BEGIN
+  IF value IS NULL OR value !~ '^\d{4}-\d{2}-\d{2}' THEN
+    RETURN NULL;
+  END IF;
+  RETURN make_date(substr(value, 1, 4)::int, substr(value, 6, 2)::int, substr(value, 9, 2)::int);
+EXCEPTION WHEN others THEN
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION erp_numeric(value TEXT) RETURNS NUMERIC
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+BEGIN
+  IF value IS NULL OR value !~ '^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$' THEN
+    RETURN NULL;
+  END IF;
+  RETURN value::numeric;
+EXCEPTION WHEN others THEN
+  RETURN NULL;
+END;
+$$;
+
+-- companyId -> company_id (toutes les tables filtrées par entreprise)
+ALTER TABLE clients ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+ALTER TABLE leads ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+ALTER TABLE services ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+ALTER TABLE categories ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+ALTER TABLE project_members ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+ALTER TABLE vendor_invoices ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+ALTER TABLE client_invoices ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+ALTER TABLE purchases ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS company_id TEXT GENERATED ALWAYS AS (data->>'companyId') STORED;
+
+-- Factures clients
+ALTER TABLE client_invoices
+  ADD COLUMN IF NOT EXISTS issue_date DATE GENERATED ALWAYS AS (erp_iso_date(data->>'issueDate')) STORED,
+  ADD COLUMN IF NOT EXISTS status TEXT GENERATED ALWAYS AS (data->>'status') STORED,
+  ADD COLUMN IF NOT EXISTS client_id TEXT GENERATED ALWAYS AS (data->>'clientId') STORED,
+  ADD COLUMN IF NOT EXISTS service_id TEXT GENERATED ALWAYS AS (data->>'serviceId') STORED,
+  ADD COLUMN IF NOT EXISTS amount_ht NUMERIC GENERATED ALWAYS AS (erp_numeric(data->>'amountHt')) STORED,
+  ADD COLUMN IF NOT EXISTS amount_ttc NUMERIC GENERATED ALWAYS AS (erp_numeric(data->>'amountTtc')) STORED;
+
+-- Factures fournisseurs
+ALTER TABLE vendor_invoices
+  ADD COLUMN IF NOT EXISTS issue_date DATE GENERATED ALWAYS AS (erp_iso_date(data->>'issueDate')) STORED,
+  ADD COLUMN IF NOT EXISTS status TEXT GENERATED ALWAYS AS (data->>'status') STORED,
+  ADD COLUMN IF NOT EXISTS amount_ht NUMERIC GENERATED ALWAYS AS (erp_numeric(data->>'amountHt')) STORED,
+  ADD COLUMN IF NOT EXISTS amount_ttc NUMERIC GENERATED ALWAYS AS (erp_numeric(data->>'amountTtc')) STORED;
+
+-- Achats (la date d'achat est stockée sous la clé "date")
+ALTER TABLE purchases
+  ADD COLUMN IF NOT EXISTS issue_date DATE GENERATED ALWAYS AS (erp_iso_date(data->>'date')) STORED,
+  ADD COLUMN IF NOT EXISTS status TEXT GENERATED ALWAYS AS (data->>'status') STORED,
+  ADD COLUMN IF NOT EXISTS amount_ht NUMERIC GENERATED ALWAYS AS (erp_numeric(data->>'amountHt')) STORED,
+  ADD COLUMN IF NOT EXISTS amount_ttc NUMERIC GENERATED ALWAYS AS (erp_numeric(data->>'amountTtc')) STORED;
+
+-- Engagements / rendez-vous
+ALTER TABLE appointments
+  ADD COLUMN IF NOT EXISTS scheduled_date DATE GENERATED ALWAYS AS (erp_iso_date(data->>'scheduledAt')) STORED,
+  ADD COLUMN IF NOT EXISTS status TEXT GENERATED ALWAYS AS (data->>'status') STORED,
+  ADD COLUMN IF NOT EXISTS client_id TEXT GENERATED ALWAYS AS (data->>'clientId') STORED,
+  ADD COLUMN IF NOT EXISTS service_id TEXT GENERATED ALWAYS AS (data->>'serviceId') STORED;
+
+-- Index de liste : filtre entreprise + pagination keyset (created_at DESC, id DESC)
+CREATE INDEX IF NOT EXISTS idx_clients_company_created ON clients (company_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_leads_company_created ON leads (company_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_services_company_created ON services (company_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_categories_company_created ON categories (company_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_project_members_company_created ON project_members (company_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_vendor_invoices_company_created ON vendor_invoices (company_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_client_invoices_company_created ON client_invoices (company_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_purchases_company_created ON purchases (company_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_documents_company_created ON documents (company_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_company_created ON subscriptions (company_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_appointments_company_created ON appointments (company_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_users_company_id ON users (company_id);
+
+-- Index de filtres (période, client, statut)
+CREATE INDEX IF NOT EXISTS idx_client_invoices_company_issue_date ON client_invoices (company_id, issue_date);
+CREATE INDEX IF NOT EXISTS idx_client_invoices_company_client ON client_invoices (company_id, client_id);
+CREATE INDEX IF NOT EXISTS idx_client_invoices_company_status ON client_invoices (company_id, status);
+CREATE INDEX IF NOT EXISTS idx_vendor_invoices_company_issue_date ON vendor_invoices (company_id, issue_date);
+CREATE INDEX IF NOT EXISTS idx_purchases_company_issue_date ON purchases (company_id, issue_date);
+CREATE INDEX IF NOT EXISTS idx_appointments_company_scheduled_date ON appointments (company_id, scheduled_date);
+CREATE INDEX IF NOT EXISTS idx_appointments_company_client ON appointments (company_id, client_id);
+
+-- Les index d'expression posés à la main (migrations/create_company_id_indexes.sql)
+-- sont remplacés par les index composites ci-dessus
+DROP INDEX IF EXISTS idx_clients_company_id;
+DROP INDEX IF EXISTS idx_leads_company_id;
+DROP INDEX IF EXISTS idx_services_company_id;
+DROP INDEX IF EXISTS idx_categories_company_id;
+DROP INDEX IF EXISTS idx_project_members_company_id;
+DROP INDEX IF EXISTS idx_vendor_invoices_company_id;
+DROP INDEX IF EXISTS idx_client_invoices_company_id;
+DROP INDEX IF EXISTS idx_purchases_company_id;
+DROP INDEX IF EXISTS idx_documents_company_id;
+DROP INDEX IF EXISTS idx_subscriptions_company_id;
@@ -0,0 +1,129 @@
+-- Migration 0002 : cube journalier des statistiques d'activité (/stats/overview)
+-- Une ligne par (entreprise, jour, catégorie de service, ville du client) avec
+-- CA HT, nombre d'interventions, durée estimée et clients distincts.
+-- Tenu à jour par triggers : une écriture sur une facture client (ou sur la
+-- catégorie/durée d'un service, la ville d'un client) recalcule les jours touchés.
+
+-- Dimensions : '' = facture sans service (category) ou sans client (city) ;
+-- ces factures ne sont exclues par aucun filtre et n'apparaissent pas dans les
+-- répartitions, comme dans le calcul historique en Python.
+CREATE TABLE IF NOT EXISTS stats_daily (
+  company_id TEXT NOT NULL,
+  day DATE NOT NULL,
+  category TEXT NOT NULL,
+  city TEXT NOT NULL,
+  revenue NUMERIC NOT NULL DEFAULT 0,
+  volume INTEGER NOT NULL DEFAULT 0,
+  duration NUMERIC NOT NULL DEFAULT 0,
+  client_ids TEXT[] NOT NULL DEFAULT '{}',
+  PRIMARY KEY (company_id, day, category, city)
+);
+
+CREATE INDEX IF NOT EXISTS idx_client_invoices_service ON client_invoices (service_id);
+CREATE INDEX IF NOT EXISTS idx_client_invoices_client ON client_invoices (client_id);
+
+-- Recalcule toutes les lignes d'un (entreprise, jour) à partir des factures.
+-- Le verrou consultatif sérialise les recalculs concurrents du même jour : le
+-- second attend le commit du premier et relit alors les factures à jour.
+CREATE OR REPLACE FUNCTION stats_refresh_day(p_company_id TEXT, p_day DATE) RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF p_company_id IS NULL OR p_day IS NULL THEN
+    RETURN;
+  END IF;
+  PERFORM pg_advisory_xact_lock(hashtext('stats_daily:' || p_company_id || ':' || p_day::text));
+
+  DELETE FROM stats_daily WHERE company_id = p_company_id AND day = p_day;
+
+  INSERT INTO stats_daily (company_id, day, category, city, revenue, volume, duration, client_ids)
+  SELECT i.company_id,
+         i.issue_date,
+         CASE WHEN i.service_id IS NULL THEN '' ELSE COALESCE(s.data->>'category', 'Autre') END,
+         CASE WHEN i.client_id IS NULL THEN '' ELSE COALESCE(c.data->>'city', 'Non renseigné') END,
+         COALESCE(SUM(i.amount_ht), 0),
+         COUNT(*),
+         COALESCE(SUM(erp_numeric(s.data->'options'->0->>'defaultDurationMin')), 0),
+         COALESCE(array_agg(DISTINCT i.client_id) FILTER (WHERE i.client_id IS NOT NULL), '{}')
+  FROM client_invoices i
+  LEFT JOIN services s ON s.id = i.service_id
+  LEFT JOIN clients c ON c.id = i.client_id
+  WHERE i.company_id = p_company_id
+    AND i.issue_date = p_day
+    AND i.status IS DISTINCT FROM 'annulé'
+    AND i.status IS DISTINCT FROM 'refusé'
+  GROUP BY 1, 2, 3, 4;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION stats_client_invoices_changed() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM stats_refresh_day(OLD.company_id, OLD.issue_date);
+  END IF;
+  IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND (NEW.company_id, NEW.issue_date) IS DISTINCT FROM (OLD.company_id, OLD.issue_date)) THEN
+    PERFORM stats_refresh_day(NEW.company_id, NEW.issue_date);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_client_invoices_stats ON client_invoices;
+CREATE TRIGGER trg_client_invoices_stats
+AFTER INSERT OR DELETE OR UPDATE OF data ON client_invoices
+FOR EACH ROW
+EXECUTE FUNCTION stats_client_invoices_changed();
+
+-- Catégorie ou durée d'un service modifiée : jours des factures qui le référencent
+CREATE OR REPLACE FUNCTION stats_services_changed() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+  target RECORD;
+BEGIN
+  IF TG_OP = 'UPDATE'
+     AND NEW.data->>'category' IS NOT DISTINCT FROM OLD.data->>'category'
+     AND NEW.data->'options'->0->>'defaultDurationMin' IS NOT DISTINCT FROM OLD.data->'options'->0->>'defaultDurationMin' THEN
+    RETURN NULL;
+  END IF;
+  FOR target IN
+    SELECT DISTINCT company_id, issue_date FROM client_invoices WHERE service_id = OLD.id
+  LOOP
+    PERFORM stats_refresh_day(target.company_id, target.issue_date);
+  END LOOP;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_services_stats ON services;
+CREATE TRIGGER trg_services_stats
+AFTER DELETE OR UPDATE OF data ON services
+FOR EACH ROW
+EXECUTE FUNCTION stats_services_changed();
+
+-- Ville d'un client modifiée : jours de ses factures
+CREATE OR REPLACE FUNCTION stats_clients_changed() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+  target RECORD;
+BEGIN
+  IF TG_OP = 'UPDATE' AND NEW.data->>'city' IS NOT DISTINCT FROM OLD.data->>'city' THEN
+    RETURN NULL;
+  END IF;
+  FOR target IN
+    SELECT DISTINCT company_id, issue_date FROM client_invoices WHERE client_id = OLD.id
+  LOOP
+    PERFORM stats_refresh_day(target.company_id, target.issue_date);
+  END LOOP;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_clients_stats ON clients;
+CREATE TRIGGER trg_clients_stats
+AFTER DELETE OR UPDATE OF data ON clients
+FOR EACH ROW
+EXECUTE FUNCTION stats_clients_changed();
+
+-- Remplissage initial à partir des factures existantes
+SELECT stats_refresh_day(company_id, issue_date)
+FROM (SELECT DISTINCT company_id, issue_date FROM client_invoices) AS days;
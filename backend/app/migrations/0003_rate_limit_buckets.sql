@@ -0,0 +1,37 @@
+-- Migration 0003 : état partagé du rate limiting (seaux à jetons)
+-- Table UNLOGGED : pas de WAL, contenu perdu après un crash, ce qui est sans
+-- conséquence (les seaux repartent pleins).
+
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+  key TEXT PRIMARY KEY,
+  tokens DOUBLE PRECISION NOT NULL,
+  updated_at DOUBLE PRECISION NOT NULL  -- epoch (secondes), horloge du serveur PostgreSQL
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated_at ON rate_limit_buckets (updated_at);
+
+-- Recharge le seau (p_rate jetons/seconde, plafonné à p_capacity) puis consomme
+-- un jeton s'il y en a un. Retourne les jetons restants, ou -1 si la requête
+-- est refusée. La ligne reste verrouillée entre les deux instructions : les
+-- appels concurrents sur la même clé sont sérialisés.
+CREATE OR REPLACE FUNCTION rate_limit_take(p_key TEXT, p_capacity DOUBLE PRECISION, p_rate DOUBLE PRECISION)
+RETURNS DOUBLE PRECISION
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_now DOUBLE PRECISION := extract(epoch FROM clock_timestamp());
+  v_tokens DOUBLE PRECISION;
+BEGIN
+  INSERT INTO rate_limit_buckets AS b (key, tokens, updated_at)
+  VALUES (p_key, p_capacity, v_now)
+  ON CONFLICT (key) DO UPDATE
+    SET tokens = LEAST(p_capacity, b.tokens + GREATEST(v_now - b.updated_at, 0) * p_rate),
+        updated_at = v_now
+  RETURNING tokens INTO v_tokens;
+
+  IF v_tokens < 1 THEN
+    RETURN -1;
+  END IF;
+  UPDATE rate_limit_buckets SET tokens = v_tokens - 1 WHERE key = p_key;
+  RETURN v_tokens - 1;
+END;
+$$;
@@ -0,0 +1,26 @@
+-- Migration 0004 : index fonctionnel unique sur le nom d'utilisateur (insensible à la casse)
+-- Utilisé par /auth/login, la création d'utilisateur et create_admin_user.py
+-- (WHERE lower(data->>'username') = ...), qui parcouraient toute la table users.
+
+-- Noms saisis avec des espaces autour : normalisés comme à la création
+UPDATE users
+SET data = jsonb_set(data, '{username}', to_jsonb(btrim(data->>'username')))
+WHERE data->>'username' <> btrim(data->>'username');
+
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM users
+    WHERE data->>'username' IS NOT NULL
+    GROUP BY lower(data->>'username')
+    HAVING COUNT(*) > 1
+  ) THEN
+    -- Doublons existants (voir GET /users/debug) : index non unique, à
+    -- remplacer par l'index unique une fois les doublons supprimés
+    RAISE WARNING 'users : noms d''utilisateur en double, index lower(username) créé sans contrainte d''unicité';
+    CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users (lower(data->>'username'));
+  ELSE
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_lower ON users (lower(data->>'username'));
+  END IF;
+END;
+$$;
@@ -0,0 +1,23 @@
+-- Migration 0005 : index unique sur la clé API des entreprises
+-- Le webhook /api/webhooks/reservations résout l'entreprise par
+-- data->>'apiKey' à chaque réservation (parcours complet de companies sans index).
+
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM companies
+    WHERE COALESCE(data->>'apiKey', '') <> ''
+    GROUP BY data->>'apiKey'
+    HAVING COUNT(*) > 1
+  ) THEN
+    -- Clé partagée par plusieurs entreprises : à régénérer
+    -- (POST /companies/{id}/generate-api-key) avant de rendre l'index unique
+    RAISE WARNING 'companies : clés API en double, index apiKey créé sans contrainte d''unicité';
+    CREATE INDEX IF NOT EXISTS idx_companies_api_key ON companies ((data->>'apiKey'))
+      WHERE COALESCE(data->>'apiKey', '') <> '';
+  ELSE
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_companies_api_key ON companies ((data->>'apiKey'))
+      WHERE COALESCE(data->>'apiKey', '') <> '';
+  END IF;
+END;
+$$;
@@ -0,0 +1,24 @@
+-- Migration 0006 : file d'attente durable des réservations reçues par webhook
+-- Le webhook enregistre la réservation brute et répond 202 ; les workers de
+-- app/services/webhook_inbox.py la transforment en prospect (leads) par lots,
+-- en réservant les lignes avec FOR UPDATE SKIP LOCKED.
+
+CREATE TABLE IF NOT EXISTS webhook_inbox (
+  id BIGSERIAL PRIMARY KEY,
+  company_id TEXT NOT NULL,
+  -- Header Idempotency-Key ou empreinte du contenu :
+  -- une réémission du site (timeout, retry) ne crée pas de doublon
+  idempotency_key TEXT NOT NULL,
+  payload JSONB NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending',  -- pending | done | failed
+  attempts INTEGER NOT NULL DEFAULT 0,
+  available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),  -- prochain essai (backoff)
+  last_error TEXT,
+  lead_id TEXT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  processed_at TIMESTAMPTZ,
+  UNIQUE (company_id, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_webhook_inbox_pending ON webhook_inbox (available_at, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_webhook_inbox_processed ON webhook_inbox (processed_at) WHERE status <> 'pending';
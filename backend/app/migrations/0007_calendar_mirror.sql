@@ -0,0 +1,26 @@
+-- Migration 0007 : copie locale des calendriers Google (app/services/calendar_sync.py)
+-- Synchronisée en arrière-plan (syncToken : seules les modifications sont
+-- téléchargées) ; /planning/calendar/events lit la période demandée ici au
+-- lieu de retélécharger jusqu'à 2 500 événements par calendrier.
+
+CREATE TABLE IF NOT EXISTS calendar_events (
+  calendar_id TEXT NOT NULL,
+  event_id TEXT NOT NULL,
+  data JSONB NOT NULL,  -- événement brut de l'API Google Calendar
+  start_at TIMESTAMPTZ NOT NULL,
+  end_at TIMESTAMPTZ NOT NULL,
+  synced_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (calendar_id, event_id)
+);
+
+-- WHERE calendar_id = ANY(...) AND start_at < :to AND end_at > :from
+CREATE INDEX IF NOT EXISTS idx_calendar_events_range ON calendar_events (calendar_id, start_at, end_at);
+
+CREATE TABLE IF NOT EXISTS calendar_sync_state (
+  calendar_id TEXT PRIMARY KEY,
+  sync_token TEXT,              -- nextSyncToken de la dernière synchronisation
+  synced_from TIMESTAMPTZ NOT NULL,  -- début de l'historique copié (synchronisation complète)
+  last_full_sync_at TIMESTAMPTZ NOT NULL,
+  last_sync_at TIMESTAMPTZ NOT NULL,
+  last_error TEXT
+);
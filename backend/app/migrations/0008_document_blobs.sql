@@ -0,0 +1,65 @@
+-- Migration 0008 : contenu des documents hors du JSONB (app/services/blobs.py)
+-- Le fichier (fileData, data URL base64) était stocké dans documents.data et
+-- renvoyé par GET /documents avec chaque document. Il est désormais stocké une
+-- seule fois par contenu (clé SHA-256), découpé en morceaux lisibles par plage
+-- (Range) ; documents.data ne garde que les métadonnées (blobSha256).
+
+CREATE TABLE IF NOT EXISTS blobs (
+  sha256 TEXT PRIMARY KEY,
+  size BIGINT NOT NULL,
+  content_type TEXT,
+  chunk_size INTEGER NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS blob_chunks (
+  sha256 TEXT NOT NULL REFERENCES blobs (sha256) ON DELETE CASCADE,
+  seq INTEGER NOT NULL,
+  data BYTEA NOT NULL,
+  PRIMARY KEY (sha256, seq)
+);
+
+-- Fichiers souvent déjà compressés (PDF, images) : pas de recompression TOAST
+ALTER TABLE blob_chunks ALTER COLUMN data SET STORAGE EXTERNAL;
+
+-- Recherche des contenus orphelins (documents supprimés ou remplacés)
+CREATE INDEX IF NOT EXISTS idx_documents_blob_sha256 ON documents ((data->>'blobSha256'));
+
+-- Reprise des fichiers existants (256 Kio par morceau, comme BLOB_CHUNK_SIZE)
+DO $$
+DECLARE
+  doc RECORD;
+  content BYTEA;
+  digest TEXT;
+  chunk INTEGER := 262144;
+BEGIN
+  FOR doc IN
+    SELECT id, data->>'fileData' AS file_data
+    FROM documents
+    WHERE data->>'fileData' LIKE 'data:%;base64,%'
+  LOOP
+    BEGIN
+      content := decode(substring(doc.file_data FROM position(',' IN doc.file_data) + 1), 'base64');
+      digest := encode(sha256(content), 'hex');
+      INSERT INTO blobs (sha256, size, content_type, chunk_size)
+      VALUES (digest, length(content), substring(doc.file_data FROM '^data:([^;,]+)'), chunk)
+      ON CONFLICT (sha256) DO NOTHING;
+      IF FOUND THEN
+        INSERT INTO blob_chunks (sha256, seq, data)
+        SELECT digest, seq, substring(content FROM seq * chunk + 1 FOR chunk)
+        FROM generate_series(0, greatest((length(content) - 1) / chunk, 0)) AS seq;
+      END IF;
+      UPDATE documents
+      SET data = (data - 'fileData') || jsonb_build_object(
+        'blobSha256', digest,
+        'hasContent', true,
+        'contentType', substring(doc.file_data FROM '^data:([^;,]+)'),
+        'contentLength', length(content)
+      )
+      WHERE id = doc.id;
+    EXCEPTION WHEN others THEN
+      RAISE WARNING 'documents : fichier du document % non repris (%)', doc.id, SQLERRM;
+    END;
+  END LOOP;
+END;
+$$;
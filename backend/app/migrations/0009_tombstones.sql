@@ -0,0 +1,63 @@
+-- Migration 0009 : requêtes conditionnelles et synchronisation incrémentale
+-- GET /{ressource}?since=... renvoie les éléments modifiés depuis une date
+-- (colonne updated_at) et les ids supprimés, enregistrés ici par trigger.
+-- Un transfert vers une autre entreprise compte comme une suppression pour
+-- l'entreprise d'origine.
+
+CREATE TABLE IF NOT EXISTS tombstones (
+  table_name TEXT NOT NULL,
+  id TEXT NOT NULL,
+  company_id TEXT,
+  deleted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (table_name, id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_tombstones_company_deleted ON tombstones (table_name, company_id, deleted_at);
+CREATE INDEX IF NOT EXISTS idx_tombstones_deleted ON tombstones (deleted_at);
+
+CREATE OR REPLACE FUNCTION erp_record_tombstone() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO tombstones (table_name, id, company_id, deleted_at)
+  VALUES (TG_TABLE_NAME, OLD.id, OLD.data->>'companyId', NOW())
+  ON CONFLICT (table_name, id) DO UPDATE
+  SET company_id = EXCLUDED.company_id, deleted_at = EXCLUDED.deleted_at;
+  RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+  t TEXT;
+BEGIN
+  FOREACH t IN ARRAY ARRAY[
+    'clients', 'leads', 'services', 'categories', 'companies', 'project_members',
+    'vendor_invoices', 'client_invoices', 'purchases', 'documents', 'subscriptions', 'appointments'
+  ] LOOP
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_tombstone_delete ON %1$I', t);
+    EXECUTE format(
+      'CREATE TRIGGER trg_%1$s_tombstone_delete AFTER DELETE ON %1$I '
+      'FOR EACH ROW EXECUTE FUNCTION erp_record_tombstone()', t
+    );
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_tombstone_transfer ON %1$I', t);
+    EXECUTE format(
+      'CREATE TRIGGER trg_%1$s_tombstone_transfer AFTER UPDATE ON %1$I FOR EACH ROW '
+      'WHEN (OLD.data->>''companyId'' IS DISTINCT FROM NEW.data->>''companyId'') '
+      'EXECUTE FUNCTION erp_record_tombstone()', t
+    );
+  END LOOP;
+END;
+$$;
+
+-- Version d'une liste (count, max(updated_at)) et ?since= : parcours d'index seul
+CREATE INDEX IF NOT EXISTS idx_clients_company_updated ON clients (company_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_leads_company_updated ON leads (company_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_services_company_updated ON services (company_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_categories_company_updated ON categories (company_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_project_members_company_updated ON project_members (company_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_vendor_invoices_company_updated ON vendor_invoices (company_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_client_invoices_company_updated ON client_invoices (company_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_purchases_company_updated ON purchases (company_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_documents_company_updated ON documents (company_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_company_updated ON subscriptions (company_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_appointments_company_updated ON appointments (company_id, updated_at);
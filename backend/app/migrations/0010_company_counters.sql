@@ -0,0 +1,100 @@
+-- Migration 0010 : nombre d'éléments par entreprise et par table (company_counters)
+-- Tenu à jour par des triggers de niveau instruction (tables de transition) :
+-- une insertion, une suppression ou un changement d'entreprise (transfert)
+-- ajuste le compteur dans la même transaction. Les backpacks lisent ces
+-- compteurs au lieu de COUNT(*) ; app/services/counters.py corrige en tâche de
+-- fond un éventuel écart et le signale.
+
+CREATE TABLE IF NOT EXISTS company_counters (
+  company_id TEXT NOT NULL,
+  table_name TEXT NOT NULL,
+  row_count BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (company_id, table_name)
+);
+
+-- Ajoute delta au compteur ; entreprises traitées dans l'ordre de leur id pour
+-- que deux instructions concurrentes verrouillent les compteurs dans le même ordre
+CREATE OR REPLACE FUNCTION erp_counters_insert() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO company_counters (company_id, table_name, row_count)
+  SELECT company_id, TG_TABLE_NAME, COUNT(*)
+  FROM new_rows WHERE company_id IS NOT NULL
+  GROUP BY company_id ORDER BY company_id
+  ON CONFLICT (company_id, table_name) DO UPDATE
+  SET row_count = company_counters.row_count + EXCLUDED.row_count, updated_at = NOW();
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION erp_counters_delete() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO company_counters (company_id, table_name, row_count)
+  SELECT company_id, TG_TABLE_NAME, -COUNT(*)
+  FROM old_rows WHERE company_id IS NOT NULL
+  GROUP BY company_id ORDER BY company_id
+  ON CONFLICT (company_id, table_name) DO UPDATE
+  SET row_count = company_counters.row_count + EXCLUDED.row_count, updated_at = NOW();
+  RETURN NULL;
+END;
+$$;
+
+-- Changement d'entreprise (transfert, upsert d'un id d'une autre entreprise)
+CREATE OR REPLACE FUNCTION erp_counters_update() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO company_counters (company_id, table_name, row_count)
+  SELECT company_id, TG_TABLE_NAME, SUM(delta)
+  FROM (
+    SELECT n.company_id, 1 AS delta
+    FROM new_rows n JOIN old_rows o ON o.id = n.id
+    WHERE o.company_id IS DISTINCT FROM n.company_id
+    UNION ALL
+    SELECT o.company_id, -1
+    FROM new_rows n JOIN old_rows o ON o.id = n.id
+    WHERE o.company_id IS DISTINCT FROM n.company_id
+  ) AS moves
+  WHERE company_id IS NOT NULL
+  GROUP BY company_id HAVING SUM(delta) <> 0 ORDER BY company_id
+  ON CONFLICT (company_id, table_name) DO UPDATE
+  SET row_count = company_counters.row_count + EXCLUDED.row_count, updated_at = NOW();
+  RETURN NULL;
+END;
+$$;
+
+-- Triggers et valeurs initiales (les CREATE TRIGGER bloquent les écritures
+-- sur la table jusqu'au commit : le comptage initial est exact)
+DO $$
+DECLARE
+  t TEXT;
+BEGIN
+  FOREACH t IN ARRAY ARRAY[
+    'clients', 'leads', 'services', 'categories', 'project_members', 'vendor_invoices',
+    'client_invoices', 'purchases', 'documents', 'subscriptions', 'appointments'
+  ] LOOP
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_counters_insert ON %1$I', t);
+    EXECUTE format(
+      'CREATE TRIGGER trg_%1$s_counters_insert AFTER INSERT ON %1$I '
+      'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION erp_counters_insert()', t
+    );
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_counters_delete ON %1$I', t);
+    EXECUTE format(
+      'CREATE TRIGGER trg_%1$s_counters_delete AFTER DELETE ON %1$I '
+      'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION erp_counters_delete()', t
+    );
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_counters_update ON %1$I', t);
+    EXECUTE format(
+      'CREATE TRIGGER trg_%1$s_counters_update AFTER UPDATE ON %1$I '
+      'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION erp_counters_update()', t
+    );
+
+    EXECUTE format('DELETE FROM company_counters WHERE table_name = %L', t);
+    EXECUTE format(
+      'INSERT INTO company_counters (company_id, table_name, row_count) '
+      'SELECT company_id, %1$L, COUNT(*) FROM %1$I WHERE company_id IS NOT NULL GROUP BY company_id', t
+    );
+  END LOOP;
+END;
+$$;
@@ -0,0 +1,21 @@
+-- Migration 0011 : une suppression enregistrée par entreprise (tombstones)
+-- Avec la clé (table_name, id), un élément transféré de A vers B puis supprimé
+-- dans B remplaçait la trace du transfert pour A : le client ?since= de A ne
+-- l'apprenait jamais. La clé inclut désormais l'entreprise (NULL pour les
+-- tables sans entreprise, d'où NULLS NOT DISTINCT).
+
+ALTER TABLE tombstones DROP CONSTRAINT IF EXISTS tombstones_pkey;
+ALTER TABLE tombstones DROP CONSTRAINT IF EXISTS tombstones_table_id_company_key;
+ALTER TABLE tombstones
+  ADD CONSTRAINT tombstones_table_id_company_key UNIQUE NULLS NOT DISTINCT (table_name, id, company_id);
+
+CREATE OR REPLACE FUNCTION erp_record_tombstone() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO tombstones (table_name, id, company_id, deleted_at)
+  VALUES (TG_TABLE_NAME, OLD.id, OLD.data->>'companyId', NOW())
+  ON CONFLICT (table_name, id, company_id) DO UPDATE
+  SET deleted_at = EXCLUDED.deleted_at;
+  RETURN NULL;
+END;
+$$;
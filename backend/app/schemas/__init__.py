@@ -40,6 +40,7 @@ from .erp import (
     CompanyUpdate,
     LeadCreate,
     LeadUpdate,
+    ReservationPayload,
     UserCreate,
     UserUpdate,
     UserPasswordUpdate,
@@ -84,6 +85,7 @@ __all__ = [
     "CompanyUpdate",
     "LeadCreate",
     "LeadUpdate",
+    "ReservationPayload",
     "UserCreate",
     "UserUpdate",
     "UserPasswordUpdate",
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, ValidationInfo, model_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -230,6 +230,46 @@ class LeadUpdate(BaseModel):
     notes: Optional[str] = None
     activities: Optional[List[Activity]] = None
 
+# Réservation reçue du site externe (webhooks /api/webhooks/reservations[/batch])
+# Aussi tolérant que l'ancien webhook : id numérique, champs à null (valeur par
+# défaut), aucun moyen de contact exigé hors du lot (context require_contact)
+class ReservationPayload(BaseModel):
+    # Le site envoie parfois des nombres (id, téléphone, SIRET, tags) : texte comme avant la file
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    id: Optional[str] = None
+    contact: str = ""
+    company: str = ""
+    email: str = ""
+    phone: str = ""
+    address: str = ""
+    status: str = "Nouveau"
+    source: str = "Site web"
+    segment: str = "général"
+    nextStepDate: Optional[str] = None
+    nextStepNote: str = ""
+    estimatedValue: float = 0
+    tags: List[str] = []
+    clientType: str = "company"
+    siret: Optional[str] = None
+    supportType: Optional[str] = None
+    supportDetail: str = ""
+    activities: List[Dict[str, Any]] = []
+
+    @model_validator(mode="before")
+    @classmethod
+    def drop_nulls(cls, data: Any) -> Any:
+        # null -> valeur par défaut du champ (le site envoie "contact": null)
+        if isinstance(data, dict):
+            return {key: value for key, value in data.items() if value is not None or key not in cls.model_fields}
+        return data
+
+    @model_validator(mode="after")
+    def check_contact(self, info: ValidationInfo) -> "ReservationPayload":
+        if (info.context or {}).get("require_contact") and not (self.contact.strip() or self.email.strip() or self.phone.strip()):
+            raise ValueError("contact, email ou phone requis")
+        return self
+
 # Modèles de réponse
 class ERPResponse(BaseModel):
     success: bool
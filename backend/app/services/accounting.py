@@ -0,0 +1,150 @@
+"""
+Agrégations comptables calculées par PostgreSQL
+
+Les KPIs du dashboard (totaux, TVA, série sur 6 mois) sont obtenus en une seule
+requête groupée sur les colonnes générées des factures (company_id, issue_date,
+amount_ttc) au lieu de charger toutes les factures en Python.
+"""
+
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from app.core.dependencies import get_async_db_connection
+
+
+# Nombre de mois (calendaires, mois courant inclus) de la série du dashboard
+DASHBOARD_MONTHS = 6
+
+# Factures clients et fournisseurs d'une entreprise, ramenées aux mêmes colonnes
+INVOICES_CTE = """
+    WITH invoices AS (
+        SELECT 'client' AS kind, issue_date, amount_ttc,
+               erp_numeric(data->>'vatAmount') AS vat_amount,
+               (data->'vatEnabled') = 'true'::jsonb AS vat_enabled
+        FROM client_invoices
+        WHERE company_id = %(company_id)s
+        UNION ALL
+        SELECT 'vendor' AS kind, issue_date, amount_ttc,
+               erp_numeric(data->>'vatAmount') AS vat_amount,
+               (data->'vatEnabled') = 'true'::jsonb AS vat_enabled
+        FROM vendor_invoices
+        WHERE company_id = %(company_id)s
+    )
+"""
+
+# Une ligne de total par type de facture + une ligne par (type, mois) de la fenêtre ;
+# les factures plus anciennes tombent dans le groupe month = NULL (ignoré)
+DASHBOARD_SQL = INVOICES_CTE + """
+    SELECT kind,
+           GROUPING(month) = 0 AS is_month,
+           month,
+           COUNT(*) AS invoice_count,
+           COALESCE(SUM(amount_ttc), 0) AS amount_ttc,
+           COALESCE(SUM(vat_amount) FILTER (WHERE vat_enabled), 0) AS vat_amount
+    FROM (
+        SELECT invoices.*,
+               CASE WHEN issue_date >= %(window_start)s
+                    THEN date_trunc('month', issue_date)::date END AS month
+        FROM invoices
+    ) AS windowed
+    GROUP BY GROUPING SETS ((kind), (kind, month));
+"""
+
+
+def add_months(day: date, months: int) -> date:
+    """Premier jour du mois décalé de `months` mois calendaires"""
+    index = day.year * 12 + (day.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _trend(current: float, previous: float) -> float:
+    return ((current - previous) / previous * 100) if previous > 0 else 0
+
+
+async def compute_dashboard(company_id: Optional[str], today: Optional[date] = None) -> Dict[str, Any]:
+    """Données de /accounting/dashboard pour une entreprise"""
+    today = today or date.today()
+    current_month = today.replace(day=1)
+    months: List[date] = [add_months(current_month, -i) for i in range(DASHBOARD_MONTHS - 1, -1, -1)]
+
+    totals = {"client": {"count": 0, "amount": 0.0, "vat": 0.0}, "vendor": {"count": 0, "amount": 0.0, "vat": 0.0}}
+    by_month = {"client": {}, "vendor": {}}
+
+    if company_id:
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                DASHBOARD_SQL,
+                {"company_id": company_id, "window_start": months[0]},
+                prepare=True,
+            )
+            for kind, is_month, month, count, amount, vat in await cur.fetchall():
+                if not is_month:
+                    totals[kind] = {"count": count, "amount": float(amount), "vat": float(vat)}
+                elif month is not None:
+                    by_month[kind][month] = float(amount)
+
+    total_revenue = totals["client"]["amount"]
+    total_expenses = totals["vendor"]["amount"]
+    vat_collected = totals["client"]["vat"]
+    vat_deductible = totals["vendor"]["vat"]
+
+    chart_points = [
+        {
+            "label": month.strftime("%b %Y"),
+            "revenue": by_month["client"].get(month, 0),
+            "expenses": by_month["vendor"].get(month, 0),
+        }
+        for month in months
+    ]
+
+    # Tendances : mois courant vs mois précédent (mois calendaires)
+    previous_month = add_months(current_month, -1)
+    revenue_trend = _trend(by_month["client"].get(current_month, 0), by_month["client"].get(previous_month, 0))
+    expenses_trend = _trend(by_month["vendor"].get(current_month, 0), by_month["vendor"].get(previous_month, 0))
+    profit_trend = revenue_trend - expenses_trend if revenue_trend and expenses_trend else 0
+
+    return {
+        "kpis": {
+            "revenue": {
+                "id": "revenue",
+                "label": "Chiffre d'affaires",
+                "value": total_revenue,
+                "trend": revenue_trend,
+                "trendLabel": "vs mois précédent"
+            },
+            "expenses": {
+                "id": "expenses",
+                "label": "Dépenses",
+                "value": total_expenses,
+                "trend": expenses_trend,
+                "trendLabel": "vs mois précédent"
+            },
+            "profit": {
+                "id": "profit",
+                "label": "Bénéfice net",
+                "value": total_revenue - total_expenses,
+                "trend": profit_trend,
+                "trendLabel": "vs mois précédent"
+            },
+            "vat": {
+                "id": "vat",
+                "label": "TVA nette",
+                "value": vat_collected - vat_deductible,
+                "trend": 0,
+                "trendLabel": ""
+            }
+        },
+        "charts": {
+            "revenueExpenses": chart_points,
+            "profit": [
+                {"label": point["label"], "value": point["revenue"] - point["expenses"]}
+                for point in chart_points
+            ]
+        },
+        "summary": {
+            "totalInvoices": totals["client"]["count"],
+            "totalVendorInvoices": totals["vendor"]["count"],
+            "vatCollected": vat_collected,
+            "vatDeductible": vat_deductible
+        }
+    }
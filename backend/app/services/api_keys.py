@@ -0,0 +1,67 @@
+"""
+Résolution des clés API d'entreprise (webhook des réservations externes)
+
+Clé API -> id d'entreprise via l'index unique sur data->>'apiKey' (migration
+0005), avec un cache par worker indexé par le SHA-256 de la clé (les clés en
+clair ne sont pas conservées en mémoire). La rotation d'une clé ou toute
+écriture sur une entreprise invalide le cache de tous les workers (NOTIFY).
+"""
+
+import hashlib
+from typing import List, Optional
+
+from app.core.cache import TTLCache
+from app.core.dependencies import get_async_db_connection
+from app.core.notifications import notify_async, subscribe
+
+
+# SHA-256 de la clé -> id de l'entreprise
+api_key_cache = TTLCache("company_api_keys", maxsize=4096, ttl=600)
+
+# Canal NOTIFY (payload : id de l'entreprise, ou "*" pour tout invalider)
+API_KEYS_CHANNEL = "erp_company_api_keys"
+
+
+def hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def _forget(company_id: str) -> None:
+    if company_id == "*":
+        api_key_cache.clear()
+    else:
+        api_key_cache.delete_where(lambda _key, value: value == company_id)
+
+
+subscribe(API_KEYS_CHANNEL, _forget)
+
+
+async def resolve_company_id(api_key: str) -> Optional[str]:
+    """Id de l'entreprise propriétaire de la clé, None si la clé est inconnue"""
+    key_hash = hash_api_key(api_key)
+    company_id = api_key_cache.get(key_hash)
+    if company_id is not None:
+        return company_id
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        # Le prédicat de l'index partiel doit figurer dans la requête pour qu'il soit utilisé
+        await cur.execute(
+            "SELECT id FROM companies WHERE data->>'apiKey' = %s AND COALESCE(data->>'apiKey', '') <> '';",
+            (api_key,),
+            prepare=True,
+        )
+        row = await cur.fetchone()
+    if not row:
+        return None
+    api_key_cache.set(key_hash, row[0])
+    return row[0]
+
+
+async def invalidate_company_api_keys(company_ids: List[Optional[str]]) -> None:
+    """
+    Oublie les clés des entreprises données dans tous les workers
+    (hook on_write de /companies ; None = entreprise inconnue, tout invalider)
+    """
+    targets = ["*"] if None in company_ids else list(dict.fromkeys(company_ids))
+    for target in targets:
+        _forget(target)
+        await notify_async(API_KEYS_CHANNEL, target)
@@ -0,0 +1,156 @@
+"""
+Chargement du "backpack" (données de démarrage du frontend)
+
+GET /user/backpack et GET /company/backpack partagent ce code : l'entreprise,
+les entreprises accessibles et le nombre d'éléments de chaque page (table
+company_counters tenue par triggers, sans COUNT(*)) sont lus en une seule
+requête, puis gardés en cache par worker et par entreprise pendant
+BACKPACK_CACHE_TTL secondes. Les compteurs peuvent donc avoir quelques
+secondes de retard ; une écriture sur une entreprise invalide le cache de
+tous les workers (NOTIFY).
+"""
+
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.dependencies import get_async_db_connection, get_user_data
+from app.core.notifications import notify_async, subscribe
+from app.services.crud import ITEM_SQL
+
+
+# Statistique -> table comptée (company_counters, migration 0010)
+COUNTED_TABLES = {
+    "totalClients": "clients",
+    "totalLeads": "leads",
+    "totalServices": "services",
+    "totalCategories": "categories",
+    "totalProjectMembers": "project_members",
+    "totalVendorInvoices": "vendor_invoices",
+    "totalClientInvoices": "client_invoices",
+    "totalPurchases": "purchases",
+    "totalDocuments": "documents",
+    "totalSubscriptions": "subscriptions",
+}
+
+# (entreprise, liste de toutes les entreprises ?) -> {"company", "companies", "stats"}
+backpack_cache = TTLCache("backpacks", maxsize=1024, ttl=settings.BACKPACK_CACHE_TTL)
+
+# Canal NOTIFY (payload : id de l'entreprise, ou "*" pour tout invalider)
+BACKPACK_CHANNEL = "erp_backpacks"
+
+BACKPACK_SQL = f"""
+    SELECT
+        (SELECT {ITEM_SQL} FROM companies WHERE id = %(company_id)s),
+        (SELECT COALESCE(jsonb_agg({ITEM_SQL} ORDER BY created_at DESC), '[]'::jsonb)
+         FROM companies WHERE %(all_companies)s OR id = %(company_id)s),
+        (SELECT COALESCE(jsonb_object_agg(table_name, row_count), '{{}}'::jsonb)
+         FROM company_counters WHERE company_id = %(company_id)s);
+"""
+
+
+def _forget(company_id: str) -> None:
+    if company_id == "*":
+        backpack_cache.clear()
+    else:
+        # La liste de toutes les entreprises contient aussi celle-ci
+        backpack_cache.delete_where(lambda key, _value: key[0] == company_id or key[1])
+
+
+subscribe(BACKPACK_CHANNEL, _forget)
+
+
+async def invalidate_backpacks(company_ids: List[Optional[str]]) -> None:
+    """Hook on_write de /companies : oublie les backpacks concernés dans tous les workers"""
+    targets = ["*"] if None in company_ids else list(dict.fromkeys(company_ids))
+    for target in targets:
+        _forget(target)
+        await notify_async(BACKPACK_CHANNEL, target)
+
+
+def can_access_company(user_data: Dict[str, Any], company_id: str) -> bool:
+    """
+    Même règle que verify_company_access (l'existence de l'entreprise est
+    vérifiée par l'appelant) : superAdmin et utilisateurs sans entreprise
+    ont accès à toutes les entreprises, les autres à la leur uniquement.
+    """
+    home_company_id = user_data.get("companyId")
+    return user_data.get("role") == "superAdmin" or home_company_id is None or home_company_id == company_id
+
+
+async def load_company_bundle(company_id: Optional[str], all_companies: bool) -> Dict[str, Any]:
+    """Entreprise, entreprises accessibles et compteurs (une requête, cache court)"""
+    key = (company_id, all_companies)
+    bundle = backpack_cache.get(key)
+    if bundle is not None:
+        return bundle
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute(BACKPACK_SQL, {"company_id": company_id, "all_companies": all_companies}, prepare=True)
+        company, companies, counts = await cur.fetchone()
+    bundle = {
+        "company": company,
+        "companies": companies,
+        "stats": {name: counts.get(table, 0) for name, table in COUNTED_TABLES.items()} if company_id else {},
+    }
+    backpack_cache.set(key, bundle)
+    return bundle
+
+
+def _company_settings(company: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Paramètres (TVA, etc.)"""
+    return {
+        "vatEnabled": company.get("vatEnabled", False) if company else False,
+        "vatRate": company.get("vatRate", 20) if company else 20,
+    }
+
+
+async def user_backpack(user_id: str) -> Dict[str, Any]:
+    """Données de démarrage de l'utilisateur : profil, son entreprise, entreprises accessibles, compteurs"""
+    user_data = await get_user_data(user_id)
+    if user_data is None:
+        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+    company_id = user_data.get("companyId")
+    bundle = await load_company_bundle(
+        company_id,
+        user_data.get("role") == "superAdmin" or company_id is None,
+    )
+    return {
+        "user": {
+            "id": user_id,
+            "username": user_data.get("username", ""),
+            "fullName": user_data.get("fullName", ""),
+            "role": user_data.get("role", "agent"),
+            "active": user_data.get("active", True),
+            "pages": user_data.get("pages", []),
+            "permissions": user_data.get("permissions", []),
+            "companyId": company_id,
+            "profile": user_data.get("profile", {}),
+            "notificationPreferences": user_data.get("notificationPreferences", {}),
+        },
+        "company": bundle["company"],
+        "companies": bundle["companies"],
+        "settings": _company_settings(bundle["company"]),
+        "stats": bundle["stats"],
+    }
+
+
+async def company_backpack(user_id: str, company_id: str) -> Dict[str, Any]:
+    """Données d'une entreprise : entreprise, compteurs de toutes les pages, paramètres"""
+    user_data = await get_user_data(user_id)
+    if user_data is None or not can_access_company(user_data, company_id):
+        raise HTTPException(status_code=403, detail="Accès non autorisé à cette entreprise")
+    bundle = await load_company_bundle(company_id, False)
+    if bundle["company"] is None:
+        # Comme verify_company_access : une entreprise inexistante n'est accessible qu'à son membre (404)
+        if user_data.get("companyId") == company_id:
+            raise HTTPException(status_code=404, detail="Entreprise non trouvée")
+        raise HTTPException(status_code=403, detail="Accès non autorisé à cette entreprise")
+    return {
+        "company": bundle["company"],
+        "stats": bundle["stats"],
+        "settings": _company_settings(bundle["company"]),
+        # Préférences (à implémenter plus tard dans une table dédiée)
+        "preferences": {},
+    }
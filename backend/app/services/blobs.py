@@ -0,0 +1,244 @@
+"""
+Contenu des documents, adressé par son SHA-256 (tables blobs et blob_chunks)
+
+documents.data ne garde que les métadonnées (blobSha256, contentType,
+contentLength) : GET /documents ne renvoie plus les fichiers, et un même
+fichier joint à plusieurs documents n'est stocké qu'une fois.
+Le contenu est découpé en morceaux de BLOB_CHUNK_SIZE octets : un
+téléchargement partiel (header Range) ne lit que les morceaux concernés, et
+ni l'envoi ni le téléchargement ne chargent le fichier entier en mémoire.
+"""
+
+import base64
+import binascii
+import hashlib
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import unquote_to_bytes
+
+from fastapi import HTTPException, UploadFile
+
+from app.core.config import settings
+from app.core.dependencies import get_async_db_connection
+
+
+# Taille d'un morceau (aussi utilisée par la reprise de la migration 0008)
+BLOB_CHUNK_SIZE = 256 * 1024
+
+# Morceaux lus par requête en téléchargement : la connexion est rendue au
+# pool entre deux lots, un client lent ne la monopolise pas
+CHUNKS_PER_READ = 16
+
+# Contenus sans document (supprimé, fichier remplacé) supprimés après ce délai
+ORPHAN_GRACE_HOURS = 24
+PURGE_INTERVAL = 3600
+_last_purge = 0.0
+
+DATA_URL_RE = re.compile(r"^data:([^;,]*)((?:;[^;,]*)*?)(;base64)?,", re.IGNORECASE)
+
+
+def max_size() -> int:
+    return settings.DOCUMENT_MAX_SIZE_MB * 1024 * 1024
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Fichier trop volumineux (maximum {settings.DOCUMENT_MAX_SIZE_MB} Mo)")
+
+
+def _metadata(sha256: str, size: int, content_type: str) -> Dict[str, Any]:
+    """Clés enregistrées dans documents.data"""
+    return {"blobSha256": sha256, "hasContent": True, "contentType": content_type, "contentLength": size}
+
+
+async def _store(sha256: str, size: int, content_type: str, chunks: AsyncIterator[bytes]) -> bool:
+    """
+    Enregistre le contenu s'il n'existe pas déjà (une transaction) ; retourne
+    True s'il a été créé. Deux envois simultanés du même fichier : le second
+    attend le premier sur la clé primaire puis ne fait rien.
+    Un contenu déjà présent voit son created_at remis à maintenant : même
+    orphelin depuis plus de ORPHAN_GRACE_HOURS, il n'est pas purgé avant que
+    le document qui le réutilise soit enregistré.
+    """
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        async with conn.transaction():
+            await cur.execute(
+                """
+                INSERT INTO blobs (sha256, size, content_type, chunk_size)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (sha256) DO UPDATE SET created_at = NOW()
+                RETURNING (xmax = 0);
+                """,
+                (sha256, size, content_type, BLOB_CHUNK_SIZE),
+            )
+            if not (await cur.fetchone())[0]:
+                return False
+            seq = 0
+            async for chunk in chunks:
+                await cur.execute(
+                    "INSERT INTO blob_chunks (sha256, seq, data) VALUES (%s, %s, %s);",
+                    (sha256, seq, chunk),
+                    prepare=True,
+                )
+                seq += 1
+    return True
+
+
+async def store_upload(upload: UploadFile) -> Dict[str, Any]:
+    """
+    Enregistre un fichier multipart (déjà mis en tampon sur disque par
+    Starlette) : une passe pour le SHA-256 et la taille, une seconde pour
+    l'écriture si le contenu est nouveau. Retourne les métadonnées du document.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await upload.read(BLOB_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_size():
+            raise _too_large()
+        digest.update(chunk)
+    await upload.seek(0)
+
+    async def chunks() -> AsyncIterator[bytes]:
+        while True:
+            chunk = await upload.read(BLOB_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    content_type = upload.content_type or "application/octet-stream"
+    sha256 = digest.hexdigest()
+    await _store(sha256, size, content_type, chunks())
+    return _metadata(sha256, size, content_type)
+
+
+async def store_bytes(content: bytes, content_type: str) -> Dict[str, Any]:
+    async def chunks() -> AsyncIterator[bytes]:
+        for offset in range(0, len(content), BLOB_CHUNK_SIZE):
+            yield content[offset:offset + BLOB_CHUNK_SIZE]
+
+    sha256 = hashlib.sha256(content).hexdigest()
+    await _store(sha256, len(content), content_type, chunks())
+    return _metadata(sha256, len(content), content_type)
+
+
+def decode_data_url(value: str) -> Tuple[bytes, Optional[str]]:
+    """Contenu et type d'un fileData : data URL (base64 ou non), sinon base64 brut"""
+    match = DATA_URL_RE.match(value)
+    try:
+        if match and not match.group(3):
+            return unquote_to_bytes(value[match.end():]), match.group(1) or None
+        payload = value[match.end():] if match else value
+        return base64.b64decode(payload), (match.group(1) or None) if match else None
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="fileData invalide (data URL ou base64 attendu)")
+
+
+async def extract_inline_file(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compatibilité avec l'envoi du fichier dans le JSON (fileData) : le contenu
+    part dans la table blobs, le document ne garde que ses métadonnées.
+    """
+    file_data = data.pop("fileData", None)
+    if not file_data:
+        return data
+    if not isinstance(file_data, str):
+        raise HTTPException(status_code=400, detail="fileData invalide (data URL ou base64 attendu)")
+    # base64 : 4 caractères pour 3 octets
+    if len(file_data) > max_size() * 4 // 3 + 1024:
+        raise _too_large()
+    content, content_type = decode_data_url(file_data)
+    if len(content) > max_size():
+        raise _too_large()
+    data.update(await store_bytes(content, content_type or "application/octet-stream"))
+    return data
+
+
+async def get_blob(sha256: str) -> Optional[Tuple[int, str, int]]:
+    """(taille, type MIME, taille des morceaux) ou None"""
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute(
+            "SELECT size, content_type, chunk_size FROM blobs WHERE sha256 = %s;",
+            (sha256,),
+            prepare=True,
+        )
+        return await cur.fetchone()
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Plage (début, fin incluse) d'un header Range: bytes=début-fin | début- | -suffixe.
+    None : pas de plage exploitable (contenu complet, comme le permet la RFC 9110,
+    y compris pour plusieurs plages). 416 si la plage est hors du contenu.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_raw, separator, end_raw = header[6:].strip().partition("-")
+    if not separator:
+        return None
+    try:
+        if not start_raw:
+            suffix = int(end_raw)
+            start, end = max(size - suffix, 0), size - 1
+            if suffix <= 0:
+                raise ValueError
+        else:
+            start = int(start_raw)
+            end = min(int(end_raw), size - 1) if end_raw else size - 1
+    except ValueError:
+        return None
+    if start < 0 or start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Plage demandée invalide",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+async def iter_content(sha256: str, start: int, end: int, chunk_size: int) -> AsyncIterator[bytes]:
+    """Octets [start, end] du contenu, lus par lots de CHUNKS_PER_READ morceaux"""
+    seq = start // chunk_size
+    last = end // chunk_size
+    while seq <= last:
+        batch_last = min(last, seq + CHUNKS_PER_READ - 1)
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT seq, data FROM blob_chunks
+                WHERE sha256 = %s AND seq BETWEEN %s AND %s
+                ORDER BY seq;
+                """,
+                (sha256, seq, batch_last),
+                prepare=True,
+            )
+            rows = await cur.fetchall()
+        for chunk_seq, data in rows:
+            offset = chunk_seq * chunk_size
+            yield bytes(data[max(start - offset, 0):min(end - offset + 1, len(data))])
+        seq = batch_last + 1
+
+
+async def purge_orphan_blobs(company_ids: List[Optional[str]]) -> None:
+    """
+    Hook on_write des documents : supprime (au plus une fois par heure et par
+    worker) les contenus qu'aucun document ne référence plus.
+    """
+    global _last_purge
+    if time.monotonic() - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = time.monotonic()
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute(
+            """
+            DELETE FROM blobs
+            WHERE created_at < NOW() - %s * INTERVAL '1 hour'
+              AND NOT EXISTS (SELECT 1 FROM documents WHERE documents.data->>'blobSha256' = blobs.sha256);
+            """,
+            (ORPHAN_GRACE_HOURS,),
+        )
+        if cur.rowcount:
+            print(f"[Documents] {cur.rowcount} contenu(s) orphelin(s) supprimé(s)")
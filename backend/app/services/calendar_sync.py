@@ -0,0 +1,252 @@
+"""
+Copie locale des calendriers Google (tables calendar_events et calendar_sync_state)
+
+Une tâche de fond synchronise chaque calendrier configuré toutes les
+CALENDAR_SYNC_INTERVAL_SECONDS secondes :
+- première fois (ou jeton expiré, HTTP 410) : synchronisation complète depuis
+  CALENDAR_SYNC_HISTORY_DAYS jours, la copie du calendrier est remplacée en
+  une transaction ;
+- ensuite : seules les modifications depuis le dernier nextSyncToken sont
+  téléchargées (événements supprimés : status 'cancelled').
+
+Un seul worker uvicorn synchronise à la fois (pg_try_advisory_lock) ; les
+autres trouvent le verrou pris et attendent le tour suivant.
+/planning/calendar/events lit ensuite la période demandée dans calendar_events.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg
+
+from app.core.calendar_config import get_calendar_settings
+from app.core.dependencies import get_async_db_connection, get_db_connection
+
+try:
+    from googleapiclient.errors import HttpError
+    from app.services.google_calendar import GoogleCalendarService, get_calendar_service
+    GOOGLE_CALENDAR_AVAILABLE = True
+except ImportError:
+    GOOGLE_CALENDAR_AVAILABLE = False
+
+
+# Identifiant arbitraire du verrou consultatif (voir MIGRATIONS_LOCK_ID)
+CALENDAR_SYNC_LOCK_ID = 7_202_412
+
+# Une copie non synchronisée depuis plus de N intervalles n'est plus utilisée
+MAX_STALE_INTERVALS = 5
+
+UPSERT_EVENTS_SQL = """
+    INSERT INTO calendar_events (calendar_id, event_id, data, start_at, end_at)
+    SELECT %s, event_id, data, start_at, end_at
+    FROM unnest(%s::text[], %s::jsonb[], %s::timestamptz[], %s::timestamptz[])
+        AS events(event_id, data, start_at, end_at)
+    ON CONFLICT (calendar_id, event_id) DO UPDATE
+    SET data = EXCLUDED.data, start_at = EXCLUDED.start_at, end_at = EXCLUDED.end_at, synced_at = NOW();
+"""
+
+_sync_task: Optional[asyncio.Task] = None
+
+
+def _parse_event_time(value: Dict[str, Any]) -> Optional[datetime]:
+    """start / end d'un événement ; une journée entière commence à minuit UTC (comme _parse_iso_datetime)"""
+    raw_value = value.get("dateTime") or value.get("date")
+    if not raw_value:
+        return None
+    if len(raw_value) == 10:
+        raw_value = f"{raw_value}T00:00:00+00:00"
+    elif raw_value.endswith("Z"):
+        raw_value = raw_value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(raw_value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _split_changes(events: List[Dict[str, Any]]) -> Tuple[Dict[str, Tuple[Dict[str, Any], datetime, datetime]], List[str]]:
+    """(événements à enregistrer par id, ids à supprimer) ; la dernière version d'un id l'emporte"""
+    upserts: Dict[str, Tuple[Dict[str, Any], datetime, datetime]] = {}
+    deletes: List[str] = []
+    for event in events:
+        event_id = event.get("id")
+        if not event_id:
+            continue
+        start = _parse_event_time(event.get("start") or {})
+        if event.get("status") == "cancelled" or start is None:
+            upserts.pop(event_id, None)
+            deletes.append(event_id)
+            continue
+        end = _parse_event_time(event.get("end") or {}) or start
+        upserts[event_id] = (event, start, max(start, end))
+    return upserts, deletes
+
+
+def _write_events(cur: psycopg.Cursor, calendar_id: str, upserts: Dict[str, Tuple[Dict[str, Any], datetime, datetime]]) -> None:
+    if not upserts:
+        return
+    cur.execute(
+        UPSERT_EVENTS_SQL,
+        (
+            calendar_id,
+            list(upserts.keys()),
+            [psycopg.types.json.Json(event) for event, _, _ in upserts.values()],
+            [start for _, start, _ in upserts.values()],
+            [end for _, _, end in upserts.values()],
+        ),
+    )
+
+
+def _full_sync(conn: psycopg.Connection, service: "GoogleCalendarService", calendar_id: str, history_days: int) -> int:
+    synced_from = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=history_days)
+    events, sync_token = service.list_changes(calendar_id, time_min=synced_from)
+    upserts, _ = _split_changes(events)
+    # Remplacement en une transaction : les lecteurs voient l'ancienne copie ou la nouvelle
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute("DELETE FROM calendar_events WHERE calendar_id = %s;", (calendar_id,))
+        _write_events(cur, calendar_id, upserts)
+        cur.execute(
+            """
+            INSERT INTO calendar_sync_state (calendar_id, sync_token, synced_from, last_full_sync_at, last_sync_at)
+            VALUES (%s, %s, %s, NOW(), NOW())
+            ON CONFLICT (calendar_id) DO UPDATE
+            SET sync_token = EXCLUDED.sync_token, synced_from = EXCLUDED.synced_from,
+                last_full_sync_at = NOW(), last_sync_at = NOW(), last_error = NULL;
+            """,
+            (calendar_id, sync_token, synced_from.replace(tzinfo=timezone.utc)),
+        )
+    return len(upserts)
+
+
+def _incremental_sync(conn: psycopg.Connection, service: "GoogleCalendarService", calendar_id: str, sync_token: str) -> int:
+    events, next_sync_token = service.list_changes(calendar_id, sync_token=sync_token)
+    upserts, deletes = _split_changes(events)
+    with conn.transaction(), conn.cursor() as cur:
+        if deletes:
+            cur.execute(
+                "DELETE FROM calendar_events WHERE calendar_id = %s AND event_id = ANY(%s);",
+                (calendar_id, deletes),
+            )
+        _write_events(cur, calendar_id, upserts)
+        cur.execute(
+            """
+            UPDATE calendar_sync_state
+            SET sync_token = COALESCE(%s, sync_token), last_sync_at = NOW(), last_error = NULL
+            WHERE calendar_id = %s;
+            """,
+            (next_sync_token, calendar_id),
+        )
+    return len(events)
+
+
+def sync_calendar(conn: psycopg.Connection, service: "GoogleCalendarService", calendar_id: str, history_days: int) -> str:
+    """Synchronise un calendrier : incrémentale si un jeton existe, complète sinon ou s'il a expiré"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT sync_token FROM calendar_sync_state WHERE calendar_id = %s;", (calendar_id,))
+        row = cur.fetchone()
+    name = service.services[calendar_id]["name"]
+    if row and row[0]:
+        try:
+            changes = _incremental_sync(conn, service, calendar_id, row[0])
+            return f"{changes} modification(s)"
+        except HttpError as error:
+            if error.resp.status != 410:
+                raise
+            print(f"[Google Calendar] Jeton de synchronisation expiré pour {name}, synchronisation complète")
+    count = _full_sync(conn, service, calendar_id, history_days)
+    print(f"[Google Calendar] Synchronisation complète de {name}: {count} événements")
+    return f"complète ({count} événements)"
+
+
+def sync_all() -> Dict[str, str]:
+    """Synchronise tous les calendriers configurés (rien si un autre worker synchronise déjà)"""
+    settings = get_calendar_settings()
+    service = get_calendar_service()
+    results: Dict[str, str] = {}
+    if not service.services:
+        return results
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (CALENDAR_SYNC_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                return results
+        try:
+            for calendar_id, info in service.services.items():
+                try:
+                    results[info["name"]] = sync_calendar(conn, service, calendar_id, settings.sync_history_days)
+                except Exception as e:
+                    results[info["name"]] = f"erreur: {e}"
+                    print(f"[Google Calendar] Synchronisation de {info['name']} en échec: {e}")
+                    with conn.cursor() as cur:
+                        cur.execute(
+                            "UPDATE calendar_sync_state SET last_error = %s WHERE calendar_id = %s;",
+                            (str(e), calendar_id),
+                        )
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (CALENDAR_SYNC_LOCK_ID,))
+    return results
+
+
+async def _sync_loop(interval: int) -> None:
+    while True:
+        try:
+            await asyncio.to_thread(sync_all)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Google Calendar] Synchronisation en échec: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_sync() -> None:
+    """Démarre la synchronisation de fond (sauf proxy CALENDAR_BASE_URL ou intervalle à 0)"""
+    global _sync_task
+    settings = get_calendar_settings()
+    if _sync_task is not None or not GOOGLE_CALENDAR_AVAILABLE or settings.base_url or settings.sync_interval_seconds <= 0:
+        return
+    _sync_task = asyncio.get_running_loop().create_task(_sync_loop(settings.sync_interval_seconds))
+
+
+async def stop_sync() -> None:
+    global _sync_task
+    if _sync_task is None:
+        return
+    _sync_task.cancel()
+    await asyncio.gather(_sync_task, return_exceptions=True)
+    _sync_task = None
+
+
+async def mirrored_calendars(calendar_ids: List[str], from_date: datetime) -> Dict[str, datetime]:
+    """
+    Calendriers dont la copie locale couvre la période (historique suffisant,
+    synchronisée récemment) -> date de dernière synchronisation
+    """
+    settings = get_calendar_settings()
+    if settings.sync_interval_seconds <= 0 or not calendar_ids:
+        return {}
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute(
+            """
+            SELECT calendar_id, last_sync_at
+            FROM calendar_sync_state
+            WHERE calendar_id = ANY(%s) AND synced_from <= %s
+              AND last_sync_at > NOW() - %s * INTERVAL '1 second';
+            """,
+            (calendar_ids, from_date, settings.sync_interval_seconds * MAX_STALE_INTERVALS),
+        )
+        return {calendar_id: last_sync_at for calendar_id, last_sync_at in await cur.fetchall()}
+
+
+async def query_events(calendar_ids: List[str], from_date: datetime, to_date: datetime) -> List[Dict[str, Any]]:
+    """Événements bruts de la copie locale qui chevauchent [from_date, to_date), triés par début"""
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute(
+            """
+            SELECT calendar_id, data
+            FROM calendar_events
+            WHERE calendar_id = ANY(%s) AND start_at < %s AND end_at > %s
+            ORDER BY start_at, calendar_id, event_id;
+            """,
+            (calendar_ids, to_date, from_date),
+        )
+        rows = await cur.fetchall()
+    return [{**data, "calendar": calendar_id} for calendar_id, data in rows]
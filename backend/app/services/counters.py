@@ -0,0 +1,121 @@
+"""
+Compteurs d'éléments par entreprise (table company_counters, migration 0010)
+
+Les triggers tiennent les compteurs à jour dans la transaction de chaque
+écriture. Une tâche de fond les compare toutes les
+COUNTERS_RECONCILE_INTERVAL secondes au COUNT(*) réel, signale l'écart
+éventuel (écriture hors triggers : restauration, session_replication_role...)
+et le corrige.
+
+La comparaison est faite dans un instantané REPEATABLE READ (comptage et
+compteurs cohérents entre eux), puis la correction est appliquée en
+incrément : une écriture validée entre-temps n'est pas écrasée. Un seul
+worker uvicorn réconcilie à la fois (pg_try_advisory_lock).
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.dependencies import get_async_db_connection
+
+
+# Tables comptées (triggers de la migration 0010)
+COUNTER_TABLES = (
+    "clients", "leads", "services", "categories", "project_members", "vendor_invoices",
+    "client_invoices", "purchases", "documents", "subscriptions", "appointments",
+)
+
+# Identifiant arbitraire du verrou consultatif (voir MIGRATIONS_LOCK_ID)
+COUNTERS_LOCK_ID = 7_202_413
+
+DRIFT_SQL = """
+    SELECT company_id, COALESCE(actual.row_count, 0) - COALESCE(counters.row_count, 0)
+    FROM (SELECT company_id, COUNT(*) AS row_count FROM {table} WHERE company_id IS NOT NULL GROUP BY company_id) AS actual
+    FULL JOIN (SELECT company_id, row_count FROM company_counters WHERE table_name = %s) AS counters USING (company_id)
+    WHERE COALESCE(actual.row_count, 0) <> COALESCE(counters.row_count, 0)
+    ORDER BY company_id;
+"""
+
+FIX_SQL = """
+    INSERT INTO company_counters (company_id, table_name, row_count)
+    SELECT company_id, %s, delta
+    FROM unnest(%s::text[], %s::bigint[]) AS drift(company_id, delta)
+    ORDER BY company_id
+    ON CONFLICT (company_id, table_name) DO UPDATE
+    SET row_count = company_counters.row_count + EXCLUDED.row_count, updated_at = NOW();
+"""
+
+_reconcile_task: Optional[asyncio.Task] = None
+
+# Dernier rapport de réconciliation du worker (GET /health/counters)
+_last_report: Dict[str, Any] = {}
+
+
+def last_report() -> Dict[str, Any]:
+    return _last_report
+
+
+async def reconcile_counters() -> Optional[Dict[str, Any]]:
+    """
+    Corrige les compteurs qui diffèrent du COUNT(*) réel. Retourne le rapport
+    ({table: {entreprise: écart}}), ou None si un autre worker réconcilie déjà.
+    """
+    global _last_report
+    started_at = datetime.utcnow()
+    drift: Dict[str, List[Tuple[str, int]]] = {}
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT pg_try_advisory_lock(%s);", (COUNTERS_LOCK_ID,))
+        if not (await cur.fetchone())[0]:
+            return None
+        try:
+            async with conn.transaction():
+                await cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+                for table in COUNTER_TABLES:
+                    await cur.execute(DRIFT_SQL.format(table=table), (table,))
+                    rows = await cur.fetchall()
+                    if rows:
+                        drift[table] = rows
+            for table, rows in drift.items():
+                await cur.execute(FIX_SQL, (table, [company_id for company_id, _ in rows], [delta for _, delta in rows]))
+        finally:
+            await cur.execute("SELECT pg_advisory_unlock(%s);", (COUNTERS_LOCK_ID,))
+
+    for table, rows in drift.items():
+        print(f"[Counters] Écart corrigé sur {table}: " + ", ".join(f"{company_id} {delta:+d}" for company_id, delta in rows))
+    _last_report = {
+        "checkedAt": started_at.isoformat(),
+        "durationMs": round((datetime.utcnow() - started_at).total_seconds() * 1000),
+        "drift": {table: dict(rows) for table, rows in drift.items()},
+    }
+    return _last_report
+
+
+async def _reconcile_loop(interval: float) -> None:
+    while True:
+        # Premier passage après un intervalle : pas de comptage complet à chaque démarrage
+        await asyncio.sleep(interval)
+        try:
+            await reconcile_counters()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Counters] Réconciliation en échec: {e}")
+
+
+def start_reconciliation() -> None:
+    """Démarre la réconciliation de fond (intervalle à 0 : désactivée)"""
+    global _reconcile_task
+    if _reconcile_task is not None or settings.COUNTERS_RECONCILE_INTERVAL <= 0:
+        return
+    _reconcile_task = asyncio.get_running_loop().create_task(_reconcile_loop(settings.COUNTERS_RECONCILE_INTERVAL))
+
+
+async def stop_reconciliation() -> None:
+    global _reconcile_task
+    if _reconcile_task is None:
+        return
+    _reconcile_task.cancel()
+    await asyncio.gather(_reconcile_task, return_exceptions=True)
+    _reconcile_task = None
@@ -0,0 +1,581 @@
+"""
+Moteur CRUD générique pour les tables JSONB (id, data, created_at, updated_at)
+
+Chaque ressource (clients, leads, factures...) est décrite une fois par un
+JsonbResource ; toutes les opérations sont des requêtes uniques :
+- UPDATE ... WHERE id = %s AND company_id = %s RETURNING
+- DELETE ... RETURNING id
+au lieu d'un SELECT de vérification suivi de l'écriture.
+
+Les requêtes fixes sont exécutées avec prepare=True : psycopg les prépare une
+fois par connexion du pool puis réutilise le plan. La requête de liste dépend des
+paramètres (pagination keyset sur (created_at, id), ?fields=, filtres) et laisse
+psycopg la préparer automatiquement quand elle se répète.
+
+version() et changes() servent les requêtes conditionnelles (ETag) et la
+synchronisation incrémentale (?since=) : updated_at est tenu à jour par le
+trigger set_updated_at, les suppressions sont enregistrées dans la table
+tombstones (migration 0009).
+"""
+
+import base64
+import inspect
+import json
+import re
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import psycopg
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.dependencies import get_async_db_connection
+from app.services import reference_cache
+
+
+# Hook (fonction ou coroutine) appelé avec (data, current_user) et qui retourne les données à enregistrer
+DataHook = Callable[[Dict[str, Any], Dict[str, Any]], Union[Dict[str, Any], Awaitable[Dict[str, Any]]]]
+
+# Hook (fonction ou coroutine) appelé après une écriture réussie avec les entreprises concernées
+# (None = entreprise inconnue : invalider tout)
+WriteHook = Callable[[List[Optional[str]]], Optional[Awaitable[None]]]
+
+# L'objet renvoyé au frontend est construit par PostgreSQL ({...data, "id": id})
+ITEM_SQL = "data || jsonb_build_object('id', id)"
+
+# Projection ?fields=a,b,c : noms de clés JSON simples uniquement
+FIELD_NAME_RE = re.compile(r"^[A-Za-z0-9_]{1,64}$")
+MAX_FIELDS = 50
+
+# ?since= : suppressions conservées N jours (au-delà : 410, recharger la liste complète)
+TOMBSTONE_RETENTION_DAYS = 30
+TOMBSTONE_PURGE_INTERVAL = 3600
+_last_tombstone_purge = 0.0
+
+# nextSince recule de quelques secondes : une écriture dont la transaction a
+# commencé avant la lecture (updated_at = début de transaction) mais validée
+# après n'est pas perdue ; le client reçoit au pire un élément deux fois
+SINCE_OVERLAP_SECONDS = 5
+
+
+def encode_cursor(created_at: datetime, item_id: str) -> str:
+    """Curseur opaque de pagination : position (created_at, id) du dernier élément"""
+    raw = json.dumps([created_at.isoformat(), item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, item_id = json.loads(raw)
+        datetime.fromisoformat(created_at)
+        return created_at, str(item_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+
+
+def parse_since(value: str) -> datetime:
+    """Date ISO 8601 de ?since= (sans fuseau : UTC)"""
+    try:
+        # "+02:00" non encodé dans l'URL arrive en " 02:00"
+        parsed = datetime.fromisoformat(re.sub(r" (\d{2}:?\d{2})$", r"+\1", value.strip()).replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Paramètre since invalide: {value} (date ISO 8601 attendue)")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Date invalide: {value} (format attendu AAAA-MM-JJ)")
+
+
+def _projection(fields: Optional[str]) -> Tuple[str, List[Any]]:
+    """Expression SQL de l'item retourné (?fields= : seules les clés demandées) et ses paramètres"""
+    if not fields:
+        return ITEM_SQL, []
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    if not names or len(names) > MAX_FIELDS or not all(FIELD_NAME_RE.match(n) for n in names):
+        raise HTTPException(status_code=400, detail="Paramètre fields invalide")
+    # Projection faite par PostgreSQL : seules les clés demandées quittent la base
+    pairs = ", ".join("%s::text, data->%s" for _ in names)
+    params: List[Any] = []
+    for name in names:
+        params.extend([name, name])
+    return f"jsonb_build_object({pairs}) || jsonb_build_object('id', id)", params
+
+
+async def _empty_rows() -> AsyncIterator[Tuple[str, datetime, str]]:
+    return
+    yield
+
+
+class JsonbResource:
+    """
+    Description d'une table JSONB exposée en CRUD.
+
+    Args:
+        table: nom de la table (constante du code, jamais issue de la requête)
+        not_found: message 404 ("Client non trouvé")
+        company_scoped: filtre sur la colonne générée company_id (False pour companies)
+        allow_create_without_company: un superAdmin peut créer sans entreprise
+        merge_on_update: PUT fusionne le payload avec l'existant (data || payload)
+        transfer: expose POST /{id}/transfer (changement d'entreprise)
+        transfer_not_found: message 404 propre au transfert (défaut: not_found)
+        date_key: clé de date filtrée par ?from=&to= (issueDate, scheduledAt...)
+        columns: clés JSON promues en colonnes générées indexées (migration 0001),
+            utilisées à la place de data->>'clé' pour les filtres
+        prepare_create / prepare_update: règles propres à la ressource (fonctions ou coroutines)
+        on_write: hooks appelés après chaque écriture (invalidation de caches)
+        cache_lists: liste complète gardée en cache par entreprise
+            (app/services/reference_cache.py), invalidée par chaque écriture
+    """
+
+    def __init__(
+        self,
+        table: str,
+        not_found: str,
+        *,
+        company_scoped: bool = True,
+        allow_create_without_company: bool = False,
+        merge_on_update: bool = False,
+        transfer: bool = False,
+        transfer_not_found: Optional[str] = None,
+        date_key: Optional[str] = None,
+        columns: Optional[Dict[str, str]] = None,
+        prepare_create: Optional[DataHook] = None,
+        prepare_update: Optional[DataHook] = None,
+        on_write: Sequence[WriteHook] = (),
+        cache_lists: bool = False,
+    ):
+        self.table = table
+        self.not_found = not_found
+        self.company_scoped = company_scoped
+        self.allow_create_without_company = allow_create_without_company
+        self.merge_on_update = merge_on_update
+        self.transfer = transfer
+        self.transfer_not_found = transfer_not_found
+        self.date_key = date_key
+        self.columns = columns or {}
+        self.prepare_create = prepare_create
+        self.prepare_update = prepare_update
+        self.on_write = list(on_write)
+        self.cache_lists = cache_lists
+        if cache_lists:
+            self.on_write.append(reference_cache.invalidate_reference_lists(table))
+
+        set_data = "data = data || %(data)s::jsonb" if merge_on_update else "data = %(data)s::jsonb"
+        scope = " AND company_id = %(company_id)s"
+
+        self.sql_insert = (
+            f"INSERT INTO {table} (id, data) VALUES (%(id)s, %(data)s::jsonb) "
+            f"ON CONFLICT (id) DO UPDATE SET data = EXCLUDED.data, updated_at = NOW() "
+            f"RETURNING {ITEM_SQL};"
+        )
+        self.sql_get = {
+            True: f"SELECT {ITEM_SQL}, updated_at FROM {table} WHERE id = %(id)s{scope};",
+            False: f"SELECT {ITEM_SQL}, updated_at FROM {table} WHERE id = %(id)s;",
+        }
+        self.sql_update = {
+            True: f"UPDATE {table} SET {set_data} WHERE id = %(id)s{scope} RETURNING {ITEM_SQL};",
+            False: f"UPDATE {table} SET {set_data} WHERE id = %(id)s RETURNING {ITEM_SQL};",
+        }
+        self.sql_delete = {
+            True: f"DELETE FROM {table} WHERE id = %(id)s{scope} RETURNING id, data->>'companyId';",
+            False: f"DELETE FROM {table} WHERE id = %(id)s RETURNING id, data->>'companyId';",
+        }
+        # Le transfert vérifie l'entreprise de destination dans la même requête
+        transfer_set = "data = jsonb_set(data, '{companyId}', to_jsonb(%(target)s::text))"
+        transfer_target = " AND EXISTS (SELECT 1 FROM companies WHERE id = %(target)s)"
+        self.sql_transfer = {
+            True: f"UPDATE {table} SET {transfer_set} WHERE id = %(id)s{scope}{transfer_target} RETURNING {ITEM_SQL};",
+            False: f"UPDATE {table} SET {transfer_set} WHERE id = %(id)s{transfer_target} RETURNING {ITEM_SQL};",
+        }
+        self.sql_transfer_check = {
+            True: (
+                f"SELECT EXISTS (SELECT 1 FROM {table} WHERE id = %(id)s{scope}), "
+                f"EXISTS (SELECT 1 FROM companies WHERE id = %(target)s);"
+            ),
+            False: (
+                f"SELECT EXISTS (SELECT 1 FROM {table} WHERE id = %(id)s), "
+                f"EXISTS (SELECT 1 FROM companies WHERE id = %(target)s);"
+            ),
+        }
+
+    async def written(self, *company_ids: Optional[str]) -> None:
+        """
+        Appelle les hooks on_write (invalidation des caches) ; à appeler aussi
+        après une écriture faite hors du moteur sur la même table.
+        """
+        for hook in self.on_write:
+            try:
+                result = hook(list(company_ids))
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"[CRUD] Hook on_write en échec ({self.table}): {e}")
+
+    def _column(self, key: str) -> str:
+        """Expression SQL d'une clé JSON : colonne générée si elle existe"""
+        return self.columns.get(key) or f"(data->>'{key}')"
+
+    def _scope(self, current_user: Dict[str, Any]) -> Optional[str]:
+        """Entreprise sur laquelle filtrer (None = pas de filtre)"""
+        if not self.company_scoped:
+            return None
+        return current_user.get("companyId") or None
+
+    def _filters(
+        self,
+        company_id: Optional[str],
+        status: Optional[str] = None,
+        client_id: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+    ) -> Tuple[List[str], List[Any]]:
+        """Conditions WHERE communes à la liste et à sa version (entreprise, statut, client, dates)"""
+        conditions: List[str] = []
+        params: List[Any] = []
+        if company_id:
+            conditions.append("company_id = %s")
+            params.append(company_id)
+        if status:
+            conditions.append(f"{self._column('status')} = %s")
+            params.append(status)
+        if client_id:
+            conditions.append(f"{self._column('clientId')} = %s")
+            params.append(client_id)
+        if date_from or date_to:
+            if not self.date_key:
+                raise HTTPException(status_code=400, detail="Filtre de date non disponible pour cette ressource")
+            date_column = self.columns.get(self.date_key)
+            # Colonne DATE générée, sinon comparaison de chaînes ISO dans le JSON
+            date_sql, cast = (date_column, "::date") if date_column else (f"(data->>'{self.date_key}')", "")
+            if date_from:
+                conditions.append(f"{date_sql} >= %s{cast}")
+                params.append(_parse_date(date_from).isoformat())
+            if date_to:
+                # Borne incluse : les dates ISO avec heure du dernier jour restent dans la plage
+                conditions.append(f"{date_sql} < %s{cast}")
+                params.append((_parse_date(date_to) + timedelta(days=1)).isoformat())
+        return conditions, params
+
+    def build_list_query(
+        self,
+        company_id: Optional[str],
+        *,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[str] = None,
+        status: Optional[str] = None,
+        client_id: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        as_text: bool = False,
+    ) -> Tuple[str, List[Any]]:
+        """
+        Construit la requête de liste (filtres, keyset, projection).
+        Colonnes retournées : item JSON, created_at, id (pour le curseur suivant).
+        as_text=True retourne l'item déjà sérialisé par PostgreSQL (streaming).
+        """
+        item_sql, params = _projection(fields)
+        conditions, filter_params = self._filters(company_id, status, client_id, date_from, date_to)
+        params.extend(filter_params)
+        if cursor:
+            created_at, last_id = decode_cursor(cursor)
+            conditions.append("(created_at, id) < (%s::timestamptz, %s)")
+            params.extend([created_at, last_id])
+
+        if as_text:
+            item_sql = f"({item_sql})::text"
+        sql = f"SELECT {item_sql}, created_at, id FROM {self.table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created_at DESC, id DESC"
+        if limit:
+            # Une ligne de plus pour savoir s'il existe une page suivante
+            sql += " LIMIT %s"
+            params.append(limit + 1)
+        return sql + ";", params
+
+    async def list(
+        self,
+        current_user: Dict[str, Any],
+        *,
+        limit: Optional[int] = None,
+        **options: Any,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Liste les éléments de l'entreprise, du plus récent au plus ancien.
+        Retourne (items, next_cursor) ; next_cursor vaut None sur la dernière page
+        ou lorsque limit n'est pas fourni (liste complète, comportement historique).
+        """
+        company_id = self._scope(current_user)
+        if self.company_scoped and not company_id:
+            return [], None
+        sql, params = self.build_list_query(company_id, limit=limit, **options)
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(sql, params)
+            rows = await cur.fetchall()
+
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][2])
+        return [row[0] for row in rows], next_cursor
+
+    async def version(self, current_user: Dict[str, Any], **filters: Any) -> Tuple[int, Optional[datetime]]:
+        """
+        (nombre d'éléments, dernier updated_at) de la liste filtrée : change à
+        chaque création, modification, suppression ou transfert. Sert d'ETag
+        de collection sans lire les données.
+        """
+        company_id = self._scope(current_user)
+        if self.company_scoped and not company_id:
+            return 0, None
+        sql, params = self._version_query(company_id, **filters)
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(sql, params)
+            return await cur.fetchone()
+
+    def _version_query(self, company_id: Optional[str], **filters: Any) -> Tuple[str, List[Any]]:
+        conditions, params = self._filters(company_id, **filters)
+        sql = f"SELECT COUNT(*), MAX(updated_at) FROM {self.table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return sql + ";", params
+
+    async def cached_list(
+        self,
+        current_user: Dict[str, Any],
+        fields: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int, Optional[datetime]]:
+        """
+        Liste complète (sans filtre ni pagination) et sa version, lues depuis le
+        cache du worker ; en cas d'absence, lues dans un même instantané puis
+        mises en cache. Réservé aux ressources déclarées avec cache_lists=True.
+        """
+        company_id = self._scope(current_user)
+        if self.company_scoped and not company_id:
+            return [], 0, None
+        cached = reference_cache.lookup(self.table, company_id, fields)
+        if cached is not None:
+            return cached
+
+        generation = reference_cache.current_generation()
+        version_sql, version_params = self._version_query(company_id)
+        sql, params = self.build_list_query(company_id, fields=fields)
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            # La version et la liste doivent décrire le même état de la table
+            async with conn.transaction():
+                await cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+                await cur.execute(version_sql, version_params)
+                count, last_modified = await cur.fetchone()
+                await cur.execute(sql, params)
+                rows = await cur.fetchall()
+        value = ([row[0] for row in rows], count, last_modified)
+        reference_cache.store(self.table, company_id, fields, generation, value)
+        return value
+
+    async def changes(
+        self,
+        current_user: Dict[str, Any],
+        since: datetime,
+        fields: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], List[str], datetime]:
+        """
+        Synchronisation incrémentale : (éléments modifiés depuis since, ids
+        supprimés ou transférés depuis since, prochaine valeur de since).
+        """
+        company_id = self._scope(current_user)
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                "SELECT NOW() - %s * INTERVAL '1 second', NOW() - %s * INTERVAL '1 day';",
+                (SINCE_OVERLAP_SECONDS, TOMBSTONE_RETENTION_DAYS),
+            )
+            next_since, oldest = await cur.fetchone()
+            if since < oldest:
+                raise HTTPException(
+                    status_code=410,
+                    detail=f"Paramètre since trop ancien (plus de {TOMBSTONE_RETENTION_DAYS} jours) : recharger la liste complète",
+                )
+            if self.company_scoped and not company_id:
+                return [], [], next_since
+
+            item_sql, params = _projection(fields)
+            scope = " AND company_id = %s" if company_id else ""
+            await cur.execute(
+                f"SELECT {item_sql} FROM {self.table} WHERE updated_at > %s{scope} ORDER BY updated_at, id;",
+                params + [since] + ([company_id] if company_id else []),
+            )
+            items = [row[0] for row in await cur.fetchall()]
+
+            # Une trace par (id, entreprise) : un élément transféré puis supprimé
+            # ailleurs reste signalé à l'entreprise d'origine. Un id supprimé puis
+            # recréé (ou transféré aller-retour) figure dans items, pas ici.
+            await cur.execute(
+                f"""
+                SELECT tomb.id FROM tombstones AS tomb
+                WHERE tomb.table_name = %s AND tomb.deleted_at > %s
+                  {"AND tomb.company_id = %s" if company_id else "AND tomb.company_id IS NULL"}
+                  AND NOT EXISTS (SELECT 1 FROM {self.table} AS t WHERE t.id = tomb.id{" AND t.company_id = %s" if company_id else ""})
+                ORDER BY tomb.deleted_at;
+                """,
+                [self.table, since] + ([company_id, company_id] if company_id else []),
+            )
+            deleted = [row[0] for row in await cur.fetchall()]
+        await purge_tombstones()
+        return items, deleted, next_since
+
+    def stream(
+        self,
+        current_user: Dict[str, Any],
+        **options: Any,
+    ) -> AsyncIterator[Tuple[str, datetime, str]]:
+        """
+        Variante streaming de list() : retourne un itérateur asynchrone de
+        (item JSON texte, created_at, id) lu par un curseur serveur nommé.
+        La requête est construite (et validée) immédiatement pour que les erreurs
+        400 partent avant le début de la réponse.
+        """
+        company_id = self._scope(current_user)
+        if self.company_scoped and not company_id:
+            return _empty_rows()
+        sql, params = self.build_list_query(company_id, as_text=True, **options)
+        return self._iter_rows(sql, params)
+
+    async def _iter_rows(self, sql: str, params: List[Any]) -> AsyncIterator[Tuple[str, datetime, str]]:
+        # La connexion reste empruntée pendant toute la réponse ; elle est rendue
+        # au pool à la fin du générateur (ou à la déconnexion du client)
+        async with get_async_db_connection() as conn:
+            # Un curseur serveur (DECLARE) n'existe que dans une transaction
+            async with conn.transaction():
+                async with conn.cursor(name=f"stream_{self.table}_{uuid.uuid4().hex[:8]}") as cur:
+                    cur.itersize = settings.DB_STREAM_ITERSIZE
+                    await cur.execute(sql, params)
+                    async for row in cur:
+                        yield row
+
+    async def create(self, payload: Dict[str, Any], current_user: Dict[str, Any]) -> Dict[str, Any]:
+        company_id = self._scope(current_user)
+        if self.company_scoped and not company_id:
+            # Permettre aux superAdmin de créer sans entreprise si la ressource l'autorise
+            if not (self.allow_create_without_company and current_user.get("role") == "superAdmin"):
+                raise HTTPException(status_code=400, detail="Aucune entreprise associée")
+
+        item_id = payload.get("id") or uuid.uuid4().hex
+        data = {**payload, "id": item_id}
+        if company_id:
+            data["companyId"] = company_id
+        if self.prepare_create:
+            data = self.prepare_create(data, current_user)
+            if inspect.isawaitable(data):
+                data = await data
+
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                self.sql_insert,
+                {"id": item_id, "data": psycopg.types.json.Json(data)},
+                prepare=True,
+            )
+            row = await cur.fetchone()
+        await self.written(row[0].get("companyId"))
+        return row[0]
+
+    async def get(self, item_id: str, current_user: Dict[str, Any]) -> Dict[str, Any]:
+        item, _updated_at = await self.get_versioned(item_id, current_user)
+        return item
+
+    async def get_versioned(self, item_id: str, current_user: Dict[str, Any]) -> Tuple[Dict[str, Any], datetime]:
+        """(item, updated_at) : updated_at sert d'ETag et de Last-Modified"""
+        company_id = self._scope(current_user)
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                self.sql_get[bool(company_id)],
+                {"id": item_id, "company_id": company_id},
+                prepare=True,
+            )
+            row = await cur.fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail=self.not_found)
+            return row[0], row[1]
+
+    async def update(self, item_id: str, payload: Dict[str, Any], current_user: Dict[str, Any]) -> Dict[str, Any]:
+        company_id = self._scope(current_user)
+        # S'assurer que l'id et le companyId ne sont pas modifiés
+        data = {**payload, "id": item_id}
+        if company_id:
+            data["companyId"] = company_id
+        if self.prepare_update:
+            data = self.prepare_update(data, current_user)
+            if inspect.isawaitable(data):
+                data = await data
+
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                self.sql_update[bool(company_id)],
+                {"id": item_id, "company_id": company_id, "data": psycopg.types.json.Json(data)},
+                prepare=True,
+            )
+            row = await cur.fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail=self.not_found)
+        await self.written(row[0].get("companyId"))
+        return row[0]
+
+    async def delete(self, item_id: str, current_user: Dict[str, Any]) -> None:
+        company_id = self._scope(current_user)
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                self.sql_delete[bool(company_id)],
+                {"id": item_id, "company_id": company_id},
+                prepare=True,
+            )
+            row = await cur.fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail=self.not_found)
+        await self.written(row[1])
+
+    async def transfer(self, item_id: str, payload: Dict[str, Any], current_user: Dict[str, Any]) -> Dict[str, Any]:
+        """Transfère l'élément vers l'entreprise payload["targetCompanyId"]"""
+        company_id = self._scope(current_user)
+        target_company_id = payload.get("targetCompanyId")
+        if not target_company_id:
+            raise HTTPException(status_code=400, detail="targetCompanyId est requis")
+
+        params = {"id": item_id, "company_id": company_id, "target": target_company_id}
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(self.sql_transfer[bool(company_id)], params, prepare=True)
+            row = await cur.fetchone()
+            if not row:
+                # Échec : une seconde requête uniquement pour choisir le bon message
+                await cur.execute(self.sql_transfer_check[bool(company_id)], params, prepare=True)
+                item_exists, target_exists = await cur.fetchone()
+                if not item_exists:
+                    raise HTTPException(status_code=404, detail=self.transfer_not_found or self.not_found)
+                raise HTTPException(status_code=404, detail="Entreprise de destination non trouvée")
+        # Hooks après avoir rendu la connexion (ils peuvent en emprunter une pour NOTIFY)
+        # Entreprise d'origine (inconnue sans filtre) et de destination
+        await self.written(company_id, target_company_id)
+        return row[0]
+
+
+async def purge_tombstones() -> None:
+    """Supprime (au plus une fois par heure et par worker) les suppressions hors de la fenêtre de ?since="""
+    global _last_tombstone_purge
+    if time.monotonic() - _last_tombstone_purge < TOMBSTONE_PURGE_INTERVAL:
+        return
+    _last_tombstone_purge = time.monotonic()
+    try:
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                "DELETE FROM tombstones WHERE deleted_at < NOW() - %s * INTERVAL '1 day';",
+                (TOMBSTONE_RETENTION_DAYS,),
+            )
+            if cur.rowcount:
+                print(f"[CRUD] {cur.rowcount} suppression(s) expirée(s) purgée(s)")
+    except Exception as e:
+        print(f"[CRUD] Purge des suppressions en échec: {e}")
@@ -3,219 +3,298 @@ Service Google Calendar pour récupérer les événements de plusieurs calendrie
 Support pour Service Accounts (recommandé pour serveurs)
 """
 import os
+import heapq
 import json
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import List, Dict, Any, Optional, Tuple
+import httplib2
 from google.auth.transport.requests import Request
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
 from googleapiclient.errors import HttpError
 
 # Scopes nécessaires pour lire les calendriers
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
 
 
+# Champs d'un fichier de Service Account (reconstruction d'un JSON mal échappé)
+SA_FIELDS = [
+    'type', 'project_id', 'private_key_id', 'private_key', 'client_email',
+    'client_id', 'auth_uri', 'token_uri', 'auth_provider_x509_cert_url',
+    'client_x509_cert_url', 'universe_domain',
+]
+
+# Comptes configurés : nom -> (variable de l'ID du calendrier, variable du fichier
+# Service Account, fichier par défaut, variables contenant le JSON)
+ACCOUNTS = {
+    'adrien': (
+        'CALENDAR_ID_ADRIEN',
+        'GOOGLE_SA_ADRIEN_FILE',
+        '/app/credentials_adrien.json',
+        ('GOOGLE_SERVICE_ACCOUNT_JSON_ADRIEN', 'GOOGLE_SA_ADRIEN_JSON', 'GOOGLE_SERVICE_ACCOUNT_JSON'),
+    ),
+    'clement': (
+        'CALENDAR_ID_CLEMENT',
+        'GOOGLE_SA_CLEMENT_FILE',
+        '/app/credentials_clement.json',
+        ('GOOGLE_SERVICE_ACCOUNT_JSON_CLEMENT', 'GOOGLE_SA_CLEMENT_JSON', 'GOOGLE_SERVICE_ACCOUNT_JSON'),
+    ),
+}
+
+
+def _parse_service_account_json(raw_json: str) -> Dict[str, Any]:
+    """Parse le JSON d'un Service Account, en le reconstruisant s'il est mal échappé"""
+    # Nettoyer le JSON
+    cleaned_json = raw_json.strip().strip("'").strip('"')
+    
+    # Essayer de parser directement
+    try:
+        return json.loads(cleaned_json)
+    except json.JSONDecodeError:
+        pass
+    
+    # Si ça échoue, reconstruire le JSON proprement en extrayant chaque champ individuellement
+    sa_info = {}
+    for field in SA_FIELDS:
+        pattern = f'"{field}"\\s*:\\s*"([^"]*(?:\\\\.[^"]*)*)"'
+        match = re.search(pattern, cleaned_json)
+        if match:
+            value = match.group(1)
+            # Décoder les échappements (la clé privée garde ses retours à la ligne)
+            value = value.replace('\\n', '\n').replace('\\"', '"').replace('\\\\', '\\')
+            sa_info[field] = value
+        else:
+            # Essayer sans guillemets
+            pattern = f'"{field}"\\s*:\\s*([^,}}]+)'
+            match = re.search(pattern, cleaned_json)
+            if match:
+                sa_info[field] = match.group(1).strip().strip('"').strip("'")
+    
+    # Si on n'a pas réussi à extraire tous les champs, essayer une autre méthode
+    if not sa_info.get('type'):
+        # Dernière tentative : remplacer tous les retours à la ligne par des espaces
+        cleaned_json = cleaned_json.replace('\r\n', ' ').replace('\n', ' ').replace('\r', ' ')
+        cleaned_json = ' '.join(cleaned_json.split())
+        # Remplacer les \n échappés dans private_key
+        cleaned_json = re.sub(
+            r'"private_key"\s*:\s*"([^"]*)"',
+            lambda m: '"private_key":"' + m.group(1).replace(" ", "\\n") + '"',
+            cleaned_json
+        )
+        sa_info = json.loads(cleaned_json)
+    return sa_info
+
+
+def _load_service_account_json(name: str, file_env: str, default_file: str, json_envs: Tuple[str, ...]) -> Optional[str]:
+    """JSON du Service Account : fichier d'abord, puis variables d'environnement"""
+    sa_file = os.getenv(file_env, default_file)
+    if os.path.exists(sa_file):
+        try:
+            with open(sa_file, 'r') as f:
+                sa_json = json.dumps(json.load(f))
+                print(f"[Google Calendar] ✅ Fichier Service Account {name} chargé: {sa_file}")
+                return sa_json
+        except Exception as e:
+            print(f"[Google Calendar] ⚠️ Erreur lors du chargement du fichier {sa_file}: {e}")
+    
+    for env_name in json_envs:
+        if os.getenv(env_name):
+            return os.getenv(env_name)
+    return None
+
+
+@lru_cache(maxsize=1)
+def _discovery_document() -> Optional[Dict[str, Any]]:
+    """Document de découverte calendar v3 (fourni avec google-api-python-client), parsé une fois"""
+    document = discovery_cache.get_static_doc('calendar', 'v3')
+    return json.loads(document) if document else None
+
+
+def _build_calendar_service(credentials) -> Any:
+    document = _discovery_document()
+    if document is None:
+        return build('calendar', 'v3', credentials=credentials, cache_discovery=False)
+    return build_from_document(document, credentials=credentials)
+
+
+# Champs demandés pour chaque événement
+EVENT_FIELDS = (
+    'id,summary,description,location,start,end,attendees,organizer,htmlLink,created,updated,'
+    'recurrence,attachments,conferenceData,reminders,colorId,status,extendedProperties,'
+    'hangoutLink,source,transparency,visibility,iCalUID,recurringEventId'
+)
+
+# Délai maximal d'une requête HTTP à l'API, en secondes
+FETCH_TIMEOUT = float(os.getenv('GOOGLE_CALENDAR_TIMEOUT', '10'))
+# Nombre maximal de pages lues par calendrier : avec FETCH_TIMEOUT, borne la
+# durée pendant laquelle une lecture occupe un thread
+FETCH_MAX_PAGES = int(os.getenv('GOOGLE_CALENDAR_MAX_PAGES', '10'))
+# Threads partagés par le processus pour lire les calendriers en parallèle
+FETCH_WORKERS = int(os.getenv('GOOGLE_CALENDAR_FETCH_WORKERS', '8'))
+
+_fetch_executor: Optional[ThreadPoolExecutor] = None
+_fetch_executor_lock = threading.Lock()
+
+
+def _get_fetch_executor() -> ThreadPoolExecutor:
+    global _fetch_executor
+    if _fetch_executor is None:
+        with _fetch_executor_lock:
+            if _fetch_executor is None:
+                _fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='google-calendar')
+    return _fetch_executor
+
+
+def _event_start_key(event: Dict[str, Any]) -> str:
+    start = event.get('start', {})
+    return start.get('dateTime') or start.get('date', '')
+
+
 class GoogleCalendarService:
-    """Service pour interagir avec Google Calendar API via Service Accounts"""
+    """
+    Service pour interagir avec Google Calendar API via Service Accounts
+
+    Utiliser get_calendar_service() : l'instance est partagée par le processus
+    (credentials, jetons d'accès rafraîchis et clients d'API réutilisés d'une
+    requête à l'autre). httplib2 n'étant pas thread-safe, chaque thread exécute
+    les requêtes avec son propre transport autorisé.
+    """
     
     def __init__(self):
         """Initialise le service Google Calendar avec Service Accounts"""
         self.services: Dict[str, Any] = {}  # Cache des services par calendrier
+        self._local = threading.local()
         self._initialize_services()
     
     def _initialize_services(self):
         """Initialise les services pour chaque calendrier avec leur Service Account"""
         # Essayer d'abord les fichiers JSON, puis les variables d'environnement
-        # Configuration pour adrien
-        adrien_calendar_id = os.getenv('CALENDAR_ID_ADRIEN')
-        adrien_sa_json = None
-        
-        # Essayer de charger depuis un fichier
-        adrien_file = os.getenv('GOOGLE_SA_ADRIEN_FILE', '/app/credentials_adrien.json')
-        if os.path.exists(adrien_file):
-            try:
-                with open(adrien_file, 'r') as f:
-                    adrien_sa_json = json.dumps(json.load(f))
-                    print(f"[Google Calendar] ✅ Fichier Service Account adrien chargé: {adrien_file}")
-            except Exception as e:
-                print(f"[Google Calendar] ⚠️ Erreur lors du chargement du fichier {adrien_file}: {e}")
-        
-        # Sinon, essayer depuis la variable d'environnement
-        if not adrien_sa_json:
-            adrien_sa_json = (
-                os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON_ADRIEN')
-                or os.getenv('GOOGLE_SA_ADRIEN_JSON')
-                or os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
-            )
-        
-        # Configuration pour clement
-        clement_calendar_id = os.getenv('CALENDAR_ID_CLEMENT')
-        clement_sa_json = None
-        
-        # Essayer de charger depuis un fichier
-        clement_file = os.getenv('GOOGLE_SA_CLEMENT_FILE', '/app/credentials_clement.json')
-        if os.path.exists(clement_file):
-            try:
-                with open(clement_file, 'r') as f:
-                    clement_sa_json = json.dumps(json.load(f))
-                    print(f"[Google Calendar] ✅ Fichier Service Account clement chargé: {clement_file}")
-            except Exception as e:
-                print(f"[Google Calendar] ⚠️ Erreur lors du chargement du fichier {clement_file}: {e}")
-        
-        # Sinon, essayer depuis la variable d'environnement
-        if not clement_sa_json:
-            clement_sa_json = (
-                os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON_CLEMENT')
-                or os.getenv('GOOGLE_SA_CLEMENT_JSON')
-                or os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
-            )
-        
-        # Créer un service pour chaque Service Account
-        if adrien_sa_json and adrien_calendar_id:
-            try:
-                # Nettoyer le JSON
-                cleaned_json = adrien_sa_json.strip().strip("'").strip('"')
-                
-                # Essayer de parser directement
-                try:
-                    sa_info = json.loads(cleaned_json)
-                except json.JSONDecodeError:
-                    # Si ça échoue, reconstruire le JSON proprement
-                    import re
-                    # Extraire tous les champs du JSON
-                    fields = {}
-                    
-                    # Extraire chaque champ individuellement
-                    for field in ['type', 'project_id', 'private_key_id', 'private_key', 'client_email', 
-                                 'client_id', 'auth_uri', 'token_uri', 'auth_provider_x509_cert_url', 
-                                 'client_x509_cert_url', 'universe_domain']:
-                        pattern = f'"{field}"\\s*:\\s*"([^"]*(?:\\\\.[^"]*)*)"'
-                        match = re.search(pattern, cleaned_json)
-                        if match:
-                            value = match.group(1)
-                            # Décoder les échappements
-                            value = value.replace('\\n', '\n').replace('\\"', '"').replace('\\\\', '\\')
-                            fields[field] = value
-                        else:
-                            # Essayer sans guillemets
-                            pattern = f'"{field}"\\s*:\\s*([^,}}]+)'
-                            match = re.search(pattern, cleaned_json)
-                            if match:
-                                value = match.group(1).strip().strip('"').strip("'")
-                                fields[field] = value
-                    
-                    # Reconstruire le JSON proprement
-                    sa_info = {}
-                    for key, value in fields.items():
-                        if key == 'private_key':
-                            # La clé privée doit garder ses retours à la ligne
-                            sa_info[key] = value
-                        else:
-                            sa_info[key] = value
-                    
-                    # Si on n'a pas réussi à extraire tous les champs, essayer une autre méthode
-                    if not sa_info.get('type'):
-                        # Dernière tentative : remplacer tous les retours à la ligne par des espaces
-                        cleaned_json = cleaned_json.replace('\r\n', ' ').replace('\n', ' ').replace('\r', ' ')
-                        cleaned_json = ' '.join(cleaned_json.split())
-                        # Remplacer les \n échappés dans private_key
-                        cleaned_json = re.sub(
-                            r'"private_key"\s*:\s*"([^"]*)"',
-                            lambda m: f'"private_key":"{m.group(1).replace(" ", "\\n")}"',
-                            cleaned_json
-                        )
-                        sa_info = json.loads(cleaned_json)
-                credentials = service_account.Credentials.from_service_account_info(
-                    sa_info, scopes=SCOPES
-                )
-                service = build('calendar', 'v3', credentials=credentials)
-                self.services[adrien_calendar_id] = {
-                    'service': service,
-                    'name': 'adrien'
-                }
-                print(f"[Google Calendar] ✅ Service Account 'adrien' initialisé pour calendrier {adrien_calendar_id[:30]}...")
-            except json.JSONDecodeError as e:
-                print(f"[Google Calendar] ❌ Erreur JSON pour adrien: {e}")
-                print(f"[Google Calendar] JSON reçu (50 premiers caractères): {adrien_sa_json[:50]}...")
-            except Exception as e:
-                import traceback
-                print(f"[Google Calendar] ❌ Erreur lors de l'initialisation du Service Account adrien: {e}")
-                print(f"[Google Calendar] Traceback: {traceback.format_exc()}")
-        
-        if clement_sa_json and clement_calendar_id:
+        for name, (calendar_env, file_env, default_file, json_envs) in ACCOUNTS.items():
+            calendar_id = os.getenv(calendar_env)
+            sa_json = _load_service_account_json(name, file_env, default_file, json_envs)
+            
+            # Créer un service pour chaque Service Account
+            if not (sa_json and calendar_id):
+                continue
             try:
-                # Nettoyer le JSON
-                cleaned_json = clement_sa_json.strip().strip("'").strip('"')
-                
-                # Essayer de parser directement
-                try:
-                    sa_info = json.loads(cleaned_json)
-                except json.JSONDecodeError:
-                    # Si ça échoue, reconstruire le JSON proprement
-                    import re
-                    # Extraire tous les champs du JSON
-                    fields = {}
-                    
-                    # Extraire chaque champ individuellement
-                    for field in ['type', 'project_id', 'private_key_id', 'private_key', 'client_email', 
-                                 'client_id', 'auth_uri', 'token_uri', 'auth_provider_x509_cert_url', 
-                                 'client_x509_cert_url', 'universe_domain']:
-                        pattern = f'"{field}"\\s*:\\s*"([^"]*(?:\\\\.[^"]*)*)"'
-                        match = re.search(pattern, cleaned_json)
-                        if match:
-                            value = match.group(1)
-                            # Décoder les échappements
-                            value = value.replace('\\n', '\n').replace('\\"', '"').replace('\\\\', '\\')
-                            fields[field] = value
-                        else:
-                            # Essayer sans guillemets
-                            pattern = f'"{field}"\\s*:\\s*([^,}}]+)'
-                            match = re.search(pattern, cleaned_json)
-                            if match:
-                                value = match.group(1).strip().strip('"').strip("'")
-                                fields[field] = value
-                    
-                    # Reconstruire le JSON proprement
-                    sa_info = {}
-                    for key, value in fields.items():
-                        if key == 'private_key':
-                            # La clé privée doit garder ses retours à la ligne
-                            sa_info[key] = value
-                        else:
-                            sa_info[key] = value
-                    
-                    # Si on n'a pas réussi à extraire tous les champs, essayer une autre méthode
-                    if not sa_info.get('type'):
-                        # Dernière tentative : remplacer tous les retours à la ligne par des espaces
-                        cleaned_json = cleaned_json.replace('\r\n', ' ').replace('\n', ' ').replace('\r', ' ')
-                        cleaned_json = ' '.join(cleaned_json.split())
-                        # Remplacer les \n échappés dans private_key
-                        cleaned_json = re.sub(
-                            r'"private_key"\s*:\s*"([^"]*)"',
-                            lambda m: f'"private_key":"{m.group(1).replace(" ", "\\n")}"',
-                            cleaned_json
-                        )
-                        sa_info = json.loads(cleaned_json)
+                sa_info = _parse_service_account_json(sa_json)
                 credentials = service_account.Credentials.from_service_account_info(
                     sa_info, scopes=SCOPES
                 )
-                service = build('calendar', 'v3', credentials=credentials)
-                self.services[clement_calendar_id] = {
-                    'service': service,
-                    'name': 'clement'
+                self.services[calendar_id] = {
+                    'service': _build_calendar_service(credentials),
+                    'credentials': credentials,
+                    'name': name
                 }
-                print(f"[Google Calendar] ✅ Service Account 'clement' initialisé pour calendrier {clement_calendar_id[:30]}...")
+                print(f"[Google Calendar] ✅ Service Account '{name}' initialisé pour calendrier {calendar_id[:30]}...")
             except json.JSONDecodeError as e:
-                print(f"[Google Calendar] ❌ Erreur JSON pour clement: {e}")
-                print(f"[Google Calendar] JSON reçu (50 premiers caractères): {clement_sa_json[:50]}...")
+                print(f"[Google Calendar] ❌ Erreur JSON pour {name}: {e}")
+                print(f"[Google Calendar] JSON reçu (50 premiers caractères): {sa_json[:50]}...")
             except Exception as e:
                 import traceback
-                print(f"[Google Calendar] ❌ Erreur lors de l'initialisation du Service Account clement: {e}")
+                print(f"[Google Calendar] ❌ Erreur lors de l'initialisation du Service Account {name}: {e}")
                 print(f"[Google Calendar] Traceback: {traceback.format_exc()}")
         
         if not self.services:
             print("[Google Calendar] Aucun Service Account configuré. Vérifiez les variables d'environnement.")
     
+    def _http(self, calendar_id: str) -> AuthorizedHttp:
+        """Transport autorisé du thread courant pour ce calendrier (jeton partagé via les credentials)"""
+        transports = getattr(self._local, 'transports', None)
+        if transports is None:
+            transports = self._local.transports = {}
+        http = transports.get(calendar_id)
+        if http is None:
+            http = transports[calendar_id] = AuthorizedHttp(
+                self.services[calendar_id]['credentials'], http=httplib2.Http(timeout=FETCH_TIMEOUT)
+            )
+        return http
+    
+    def _fetch_calendar(
+        self,
+        calendar_id: str,
+        time_min: datetime,
+        time_max: datetime,
+        page_size: int,
+    ) -> List[Dict[str, Any]]:
+        """Événements d'un calendrier (au plus FETCH_MAX_PAGES pages), triés par date de début"""
+        service_info = self.services[calendar_id]
+        service = service_info['service']
+        calendar_name = service_info['name']
+        http = self._http(calendar_id)
+        
+        events: List[Dict[str, Any]] = []
+        page_token = None
+        for _ in range(FETCH_MAX_PAGES):
+            # Demander tous les champs disponibles pour obtenir plus de détails
+            events_result = service.events().list(
+                calendarId=calendar_id,
+                timeMin=time_min.isoformat() + 'Z',
+                timeMax=time_max.isoformat() + 'Z',
+                maxResults=page_size,
+                pageToken=page_token,
+                singleEvents=True,
+                orderBy='startTime',
+                fields=f'items({EVENT_FIELDS}),nextPageToken'
+            ).execute(http=http)
+            
+            # Ajouter le champ 'calendar' et 'calendarName' à chaque événement
+            for event in events_result.get('items', []):
+                event['calendar'] = calendar_id
+                event['calendarName'] = calendar_name
+                events.append(event)
+            
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                break
+        else:
+            print(f"[Google Calendar] Calendrier {calendar_name} tronqué à {FETCH_MAX_PAGES} pages ({len(events)} événements)")
+        
+        # Déjà dans l'ordre de l'API (orderBy=startTime) : tri quasi linéaire,
+        # nécessaire pour que heapq.merge utilise la même clé
+        events.sort(key=_event_start_key)
+        print(f"[Google Calendar] {len(events)} événements récupérés du calendrier {calendar_name}")
+        return events
+    
+    def list_changes(
+        self,
+        calendar_id: str,
+        sync_token: Optional[str] = None,
+        time_min: Optional[datetime] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Synchronisation d'un calendrier (toutes les pages) : complète depuis
+        time_min sans sync_token, sinon les seules modifications depuis le
+        jeton (événements supprimés inclus, status 'cancelled').
+        Retourne (événements, nextSyncToken). HttpError 410 : jeton expiré.
+        """
+        service = self.services[calendar_id]['service']
+        http = self._http(calendar_id)
+        params: Dict[str, Any] = {'calendarId': calendar_id, 'singleEvents': True, 'maxResults': 2500}
+        if sync_token:
+            params['syncToken'] = sync_token
+        elif time_min is not None:
+            params['timeMin'] = time_min.isoformat() + 'Z'
+        
+        events: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            result = service.events().list(
+                pageToken=page_token,
+                fields=f'items({EVENT_FIELDS}),nextPageToken,nextSyncToken',
+                **params
+            ).execute(http=http)
+            events.extend(result.get('items', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return events, result.get('nextSyncToken')
+    
     def get_events(
         self,
         calendar_ids: Optional[List[str]] = None,
@@ -224,16 +303,22 @@ class GoogleCalendarService:
         max_results: int = 2500
     ) -> Tuple[List[Dict[str, Any]], List[str]]:
         """
-        Récupère les événements de plusieurs calendriers
+        Récupère les événements de plusieurs calendriers, en parallèle
+        
+        Chaque calendrier est lu dans un thread ; la latence est celle du
+        calendrier le plus lent. Une lecture ne peut pas être interrompue : sa
+        durée est bornée par le délai de chaque requête HTTP (FETCH_TIMEOUT)
+        et par le nombre de pages (FETCH_MAX_PAGES). Un calendrier en erreur
+        ou hors délai produit un warning.
         
         Args:
             calendar_ids: Liste des IDs de calendriers (optionnel, utilise tous les calendriers configurés si None)
             time_min: Date de début (par défaut: 30 jours dans le passé)
             time_max: Date de fin (par défaut: 365 jours dans le futur)
-            max_results: Nombre maximum de résultats par calendrier
+            max_results: Nombre de résultats par page (2500 maximum côté API)
         
         Returns:
-            Tuple (liste des événements, liste des warnings)
+            Tuple (liste des événements triés par date de début, liste des warnings)
         """
         if not self.services:
             return [], ["Aucun Service Account configuré"]
@@ -251,45 +336,28 @@ class GoogleCalendarService:
         if time_max is None:
             time_max = datetime.utcnow() + timedelta(days=365)
         
-        all_events = []
         warnings = []
-        
-        for calendar_id in calendar_ids:
+        futures: Dict[Future, str] = {}
+        executor = _get_fetch_executor()
+        for calendar_id in dict.fromkeys(calendar_ids):
             # Trouver le service correspondant à ce calendrier
-            service_info = self.services.get(calendar_id)
-            if not service_info:
+            if calendar_id not in self.services:
                 warning = f"Calendrier {calendar_id} non configuré. Service Account manquant."
                 warnings.append(warning)
                 print(f"[Google Calendar] {warning}")
                 continue
-            
-            service = service_info['service']
-            calendar_name = service_info['name']
-            
+            future = executor.submit(self._fetch_calendar, calendar_id, time_min, time_max, min(max_results, 2500))
+            futures[future] = calendar_id
+        
+        per_calendar: List[List[Dict[str, Any]]] = []
+        for future, calendar_id in futures.items():
+            calendar_name = self.services[calendar_id]['name']
             try:
-                # Demander tous les champs disponibles pour obtenir plus de détails
-                # Vous pouvez aussi spécifier des champs précis comme :
-                # fields='items(id,summary,description,location,start,end,attendees,organizer,htmlLink,created,updated,recurrence,attachments,conferenceData,reminders,colorId,status,extendedProperties)'
-                events_result = service.events().list(
-                    calendarId=calendar_id,
-                    timeMin=time_min.isoformat() + 'Z',
-                    timeMax=time_max.isoformat() + 'Z',
-                    maxResults=max_results,
-                    singleEvents=True,
-                    orderBy='startTime',
-                    fields='items(id,summary,description,location,start,end,attendees,organizer,htmlLink,created,updated,recurrence,attachments,conferenceData,reminders,colorId,status,extendedProperties,hangoutLink,source,transparency,visibility,iCalUID,recurringEventId),nextPageToken'
-                ).execute()
-                
-                events = events_result.get('items', [])
-                
-                # Ajouter le champ 'calendar' et 'calendarName' à chaque événement
-                for event in events:
-                    event['calendar'] = calendar_id
-                    event['calendarName'] = calendar_name
-                    all_events.append(event)
-                
-                print(f"[Google Calendar] {len(events)} événements récupérés du calendrier {calendar_name}")
-                
+                per_calendar.append(future.result())
+            except TimeoutError:
+                warning = f"Délai dépassé pour le calendrier {calendar_name} ({FETCH_TIMEOUT:g} s par requête)"
+                warnings.append(warning)
+                print(f"[Google Calendar] {warning}")
             except HttpError as error:
                 warning = f"Erreur HTTP pour le calendrier {calendar_name} ({calendar_id[:20]}...): {error}"
                 warnings.append(warning)
@@ -299,8 +367,8 @@ class GoogleCalendarService:
                 warnings.append(warning)
                 print(f"[Google Calendar] {warning}")
         
-        # Trier par date de début
-        all_events.sort(key=lambda x: x.get('start', {}).get('dateTime') or x.get('start', {}).get('date', ''))
+        # Fusion k-voies des calendriers (chacun déjà trié par date de début)
+        all_events = list(heapq.merge(*per_calendar, key=_event_start_key))
         
         return all_events, warnings
     
@@ -385,3 +453,41 @@ class GoogleCalendarService:
         
         return formatted
 
+
+# Instance partagée par le processus, reconstruite si la configuration change
+_service: Optional[GoogleCalendarService] = None
+_service_fingerprint: Optional[tuple] = None
+_service_lock = threading.Lock()
+
+
+def _config_fingerprint() -> tuple:
+    """Variables d'environnement et date de modification des fichiers des Service Accounts"""
+    parts = []
+    for calendar_env, file_env, default_file, json_envs in ACCOUNTS.values():
+        sa_file = os.getenv(file_env, default_file)
+        try:
+            mtime = os.stat(sa_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        parts.append((os.getenv(calendar_env), sa_file, mtime, tuple(os.getenv(name) for name in json_envs)))
+    return tuple(parts)
+
+
+def get_calendar_service(reload: bool = False) -> GoogleCalendarService:
+    """
+    Service Google Calendar du processus, construit à la première utilisation.
+    Reconstruit si les credentials changent (fichier modifié, variables
+    d'environnement) ou si reload=True.
+    """
+    global _service, _service_fingerprint
+    fingerprint = _config_fingerprint()
+    service = _service
+    if service is not None and not reload and fingerprint == _service_fingerprint:
+        return service
+    with _service_lock:
+        if _service is None or reload or fingerprint != _service_fingerprint:
+            if _service is not None:
+                print("[Google Calendar] Configuration modifiée, rechargement des Service Accounts")
+            _service = GoogleCalendarService()
+            _service_fingerprint = fingerprint
+        return _service
@@ -0,0 +1,77 @@
+"""
+Cache des listes de référence (services, catégories, entreprises, membres)
+
+Ces listes sont lues sur presque tous les écrans et modifiées quelques fois
+par semaine : la liste complète d'une entreprise (avec sa version, pour
+l'ETag) est gardée en mémoire par worker, sans requête ni connexion à la
+lecture. Toute écriture sur la ressource (création, modification,
+suppression, transfert) l'invalide dans tous les workers (hook on_write
+ajouté par JsonbResource(cache_lists=True), puis NOTIFY).
+
+Une lecture commencée avant une écriture ne remet pas l'ancienne liste en
+cache après l'invalidation : chaque invalidation incrémente une génération,
+et une liste lue sous une génération dépassée n'est pas enregistrée.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.notifications import notify_async, subscribe
+
+
+# (table, entreprise, ?fields=) -> (items, nombre, dernier updated_at)
+reference_cache = TTLCache("reference_lists", maxsize=settings.REFERENCE_CACHE_SIZE, ttl=settings.REFERENCE_CACHE_TTL)
+
+# Canal NOTIFY (payload : "table:entreprise", ou "table:*" pour toute la table)
+REFERENCE_CHANNEL = "erp_reference_lists"
+
+# Au-delà, la liste n'est pas mise en cache (mémoire bornée par entrée)
+MAX_CACHED_ITEMS = 5000
+
+CachedList = Tuple[List[Dict[str, Any]], int, Optional[datetime]]
+
+_generation = 0
+
+
+def _forget(payload: str) -> None:
+    global _generation
+    _generation += 1
+    table, _, company_id = payload.partition(":")
+    if company_id == "*":
+        reference_cache.delete_where(lambda key, _value: key[0] == table)
+    else:
+        reference_cache.delete_where(lambda key, _value: key[0] == table and key[1] == company_id)
+
+
+subscribe(REFERENCE_CHANNEL, _forget)
+
+
+def current_generation() -> int:
+    """À lire avant la requête, puis à passer à store()"""
+    return _generation
+
+
+def lookup(table: str, company_id: Optional[str], fields: Optional[str]) -> Optional[CachedList]:
+    return reference_cache.get((table, company_id, fields))
+
+
+def store(table: str, company_id: Optional[str], fields: Optional[str], generation: int, value: CachedList) -> None:
+    """Enregistre la liste sauf si une invalidation a eu lieu pendant sa lecture"""
+    if generation != _generation or value[1] > MAX_CACHED_ITEMS:
+        return
+    reference_cache.set((table, company_id, fields), value)
+
+
+def invalidate_reference_lists(table: str):
+    """Hook on_write : oublie les listes des entreprises modifiées dans tous les workers"""
+
+    async def hook(company_ids: List[Optional[str]]) -> None:
+        targets = ["*"] if None in company_ids else list(dict.fromkeys(company_ids))
+        for target in targets:
+            payload = f"{table}:{target}"
+            _forget(payload)
+            await notify_async(REFERENCE_CHANNEL, payload)
+
+    return hook
@@ -0,0 +1,132 @@
+"""
+Réservations du site externe -> prospects (table leads)
+
+Utilisé par les webhooks /api/webhooks/reservations (une réservation) et
+/api/webhooks/reservations/batch (lot JSON ou NDJSON). Un lot est enregistré
+en un seul INSERT ... SELECT FROM unnest(...) ON CONFLICT : un aller-retour
+PostgreSQL quel que soit le nombre de réservations.
+"""
+
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Set, Tuple
+
+import psycopg
+from pydantic import ValidationError
+
+from app.core.dependencies import get_async_db_connection
+from app.schemas import ReservationPayload
+
+
+# Nombre maximal de réservations par lot
+MAX_BATCH_SIZE = 1000
+
+# Upsert multi-lignes. Une réservation ne met à jour un prospect existant que
+# s'il appartient à la même entreprise ; sinon elle n'est pas retournée.
+UPSERT_LEADS_SQL = """
+    INSERT INTO leads (id, data)
+    SELECT id, data FROM unnest(%s::text[], %s::jsonb[]) AS batch(id, data)
+    ON CONFLICT (id) DO UPDATE SET data = EXCLUDED.data, updated_at = NOW()
+    WHERE leads.data->>'companyId' = EXCLUDED.data->>'companyId'
+    RETURNING id;
+"""
+
+
+def lead_from_reservation(payload: Dict[str, Any], company_id: str) -> Dict[str, Any]:
+    """Données du prospect créé depuis une réservation"""
+    # Le payload doit contenir au minimum: contact, email, phone, company (optionnel), address (optionnel)
+    return {
+        "id": payload.get("id") or uuid.uuid4().hex,
+        "companyId": company_id,
+        "contact": payload.get("contact", ""),
+        "company": payload.get("company", ""),
+        "email": payload.get("email", ""),
+        "phone": payload.get("phone", ""),
+        "address": payload.get("address", ""),
+        "status": payload.get("status", "Nouveau"),
+        "source": payload.get("source", "Site web"),
+        "segment": payload.get("segment", "général"),
+        "nextStepDate": payload.get("nextStepDate"),
+        "nextStepNote": payload.get("nextStepNote", ""),
+        "estimatedValue": payload.get("estimatedValue", 0),
+        "tags": payload.get("tags", []),
+        "clientType": payload.get("clientType", "company"),
+        "siret": payload.get("siret"),
+        "supportType": payload.get("supportType"),
+        "supportDetail": payload.get("supportDetail", ""),
+        "activities": payload.get("activities", []),
+        "createdAt": datetime.now().isoformat(),
+    }
+
+
+def parse_batch(body: bytes, ndjson: bool) -> List[Any]:
+    """Éléments bruts d'un lot : tableau JSON, ou une réservation JSON par ligne (NDJSON)"""
+    if ndjson:
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    items = json.loads(body)
+    if not isinstance(items, list):
+        raise ValueError("un tableau de réservations est attendu")
+    return items
+
+
+def build_lead(item: Any, company_id: str, require_contact: bool = False) -> Dict[str, Any]:
+    """
+    Valide une réservation brute (ReservationPayload) ; ValueError avec le détail sinon.
+    require_contact : contact, email ou phone obligatoire (lots uniquement, le
+    webhook unitaire garde le contrat historique)
+    """
+    try:
+        reservation = ReservationPayload.model_validate(item, context={"require_contact": require_contact})
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(part) for part in error['loc']) or 'réservation'}: {error['msg']}"
+            for error in e.errors()
+        ))
+    return lead_from_reservation(reservation.model_dump(), company_id)
+
+
+async def upsert_leads(cur: psycopg.AsyncCursor, leads: List[Dict[str, Any]]) -> Set[str]:
+    """Enregistre les prospects (ids distincts) en une requête ; retourne les ids enregistrés"""
+    if not leads:
+        return set()
+    await cur.execute(
+        UPSERT_LEADS_SQL,
+        ([lead["id"] for lead in leads], [psycopg.types.json.Json(lead) for lead in leads]),
+    )
+    return {row[0] for row in await cur.fetchall()}
+
+
+async def ingest_reservations(items: List[Any], company_id: str) -> Dict[str, Any]:
+    """
+    Valide chaque réservation (ReservationPayload) puis enregistre les valides
+    en une requête. Retourne un résultat par élément, dans l'ordre du lot.
+    """
+    results: List[Dict[str, Any]] = [{"index": index} for index in range(len(items))]
+    leads: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+
+    for index, item in enumerate(items):
+        try:
+            lead = build_lead(item, company_id, require_contact=True)
+        except ValueError as e:
+            results[index].update(success=False, error=str(e))
+            continue
+        previous = leads.get(lead["id"])
+        if previous:
+            # Même id deux fois dans le lot : la dernière occurrence l'emporte
+            results[previous[0]].update(success=False, error=f"id {lead['id']} en double dans le lot")
+        leads[lead["id"]] = (index, lead)
+
+    saved: Set[str] = set()
+    if leads:
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            saved = await upsert_leads(cur, [lead for _, lead in leads.values()])
+
+    for lead_id, (index, _lead) in leads.items():
+        if lead_id in saved:
+            results[index].update(success=True, id=lead_id)
+        else:
+            results[index].update(success=False, error=f"id {lead_id} déjà utilisé par une autre entreprise")
+
+    created = sum(1 for result in results if result["success"])
+    return {"created": created, "failed": len(results) - created, "results": results}
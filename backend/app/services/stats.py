@@ -0,0 +1,179 @@
+"""
+Statistiques d'activité (/stats/overview) lues dans le cube stats_daily
+
+stats_daily (migration 0002) agrège les factures clients par entreprise, jour,
+catégorie de service et ville du client ; des triggers le recalculent pour les
+jours touchés à chaque écriture. Une requête de vue d'ensemble ne somme donc que
+quelques lignes par jour, quelle que soit la taille de l'historique.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.dependencies import get_async_db_connection
+
+
+# Filtres communs (entreprise, période, catégorie, ville). Les lignes '' (facture
+# sans service / sans client) passent tous les filtres.
+FILTERS_SQL = """
+    WHERE company_id = %(company_id)s
+      AND day BETWEEN %(start)s AND %(end)s
+      AND (%(category)s::text IS NULL OR category IN (%(category)s, ''))
+      AND (%(city)s::text IS NULL OR city IN (%(city)s, ''))
+"""
+
+# Totaux par jour, par catégorie et par ville en une passe ; les lignes du
+# groupe global (by_day = by_category = by_city = false) portent les KPIs
+OVERVIEW_SQL = """
+    SELECT GROUPING(day) = 0 AS by_day,
+           GROUPING(category) = 0 AS by_category,
+           GROUPING(city) = 0 AS by_city,
+           day, category, city,
+           COALESCE(SUM(revenue), 0) AS revenue,
+           COALESCE(SUM(volume), 0) AS volume,
+           COALESCE(SUM(duration), 0) AS duration
+    FROM stats_daily
+""" + FILTERS_SQL + """
+    GROUP BY GROUPING SETS ((), (day), (category), (city));
+"""
+
+UNIQUE_CLIENTS_SQL = """
+    SELECT COUNT(DISTINCT client_id)
+    FROM stats_daily, unnest(client_ids) AS client_id
+""" + FILTERS_SQL + ";"
+
+AVAILABLE_CITIES_SQL = """
+    SELECT DISTINCT city FROM stats_daily
+    WHERE company_id = %(company_id)s AND city <> ''
+    ORDER BY city;
+"""
+
+
+def _bucket_mode(start_date: datetime, end_date: datetime) -> str:
+    days_diff = (end_date - start_date).days
+    if days_diff <= 14:
+        return "day"
+    if days_diff <= 90:
+        return "week"
+    return "month"
+
+
+def _buckets(start_date: datetime, end_date: datetime) -> List[Tuple[datetime, datetime, str]]:
+    """(début, fin, libellé) des buckets de tendance : jour, semaine ou mois selon la période"""
+    bucket_mode = _bucket_mode(start_date, end_date)
+    buckets = []
+    current = start_date
+    while current <= end_date:
+        if bucket_mode == "day":
+            bucket_end = current.replace(hour=23, minute=59, second=59)
+            label = current.strftime("%d %b")
+            next_date = current + timedelta(days=1)
+        elif bucket_mode == "week":
+            # Semaine du lundi au dimanche
+            week_start = current - timedelta(days=current.weekday())
+            bucket_end = min(week_start + timedelta(days=6, hours=23, minutes=59, seconds=59), end_date)
+            label = f"Sem. {week_start.strftime('%U')}"
+            next_date = week_start + timedelta(days=7)
+        else:
+            month_start = current.replace(day=1)
+            if month_start.month == 12:
+                month_end = datetime(month_start.year + 1, 1, 1) - timedelta(days=1)
+            else:
+                month_end = datetime(month_start.year, month_start.month + 1, 1) - timedelta(days=1)
+            bucket_end = min(month_end.replace(hour=23, minute=59, second=59), end_date)
+            label = month_start.strftime("%b %Y")
+            next_date = month_end + timedelta(days=1)
+        buckets.append((current, bucket_end, label))
+        current = next_date
+    return buckets
+
+
+async def compute_stats_overview(
+    company_id: Optional[str],
+    start_date: datetime,
+    end_date: datetime,
+    category: Optional[str] = None,
+    city: Optional[str] = None,
+) -> Dict[str, Any]:
+    """KPIs, tendance, répartition par catégorie et par ville sur [start_date, end_date]"""
+    params = {
+        "company_id": company_id,
+        "start": start_date.date(),
+        "end": end_date.date(),
+        "category": category if category and category != "all" else None,
+        "city": city if city and city != "all" else None,
+    }
+
+    totals = {"revenue": 0.0, "volume": 0, "duration": 0.0}
+    by_day: Dict[date, Dict[str, Any]] = {}
+    category_data: List[Dict[str, Any]] = []
+    city_data: List[Dict[str, Any]] = []
+    unique_clients = 0
+    available_cities: List[str] = []
+
+    if company_id:
+        async with get_async_db_connection() as conn, conn.cursor() as cur:
+            await cur.execute(OVERVIEW_SQL, params, prepare=True)
+            for is_day, is_category, is_city, day, cat, city_name, revenue, volume, duration in await cur.fetchall():
+                values = {"revenue": float(revenue), "volume": int(volume), "duration": float(duration)}
+                if is_day:
+                    by_day[day] = values
+                elif is_category:
+                    if cat:
+                        category_data.append({"category": cat, **values})
+                elif is_city:
+                    if city_name:
+                        city_data.append({
+                            "city": city_name,
+                            "interventions": values["volume"],
+                            "revenue": values["revenue"],
+                            "duration": values["duration"],
+                        })
+                else:
+                    totals = values
+
+            await cur.execute(UNIQUE_CLIENTS_SQL, params, prepare=True)
+            unique_clients = (await cur.fetchone())[0]
+
+            await cur.execute(AVAILABLE_CITIES_SQL, params, prepare=True)
+            available_cities = [row[0] for row in await cur.fetchall()]
+
+    total_revenue = totals["revenue"]
+    total_volume = totals["volume"]
+    total_duration = totals["duration"]
+
+    category_data.sort(key=lambda x: x["revenue"], reverse=True)
+    city_data.sort(key=lambda x: x["revenue"], reverse=True)
+
+    trend_data = []
+    for bucket_start, bucket_end, label in _buckets(start_date, end_date):
+        bucket = {"revenue": 0.0, "volume": 0, "duration": 0.0}
+        day = bucket_start.date()
+        while day <= bucket_end.date():
+            values = by_day.get(day)
+            if values:
+                for key in bucket:
+                    bucket[key] += values[key]
+            day += timedelta(days=1)
+        trend_data.append({
+            "label": label,
+            "start": bucket_start.isoformat(),
+            "end": bucket_end.isoformat(),
+            **bucket,
+            "averageTicket": bucket["revenue"] / bucket["volume"] if bucket["volume"] > 0 else 0,
+        })
+
+    return {
+        "kpis": {
+            "totalVolume": total_volume,
+            "totalRevenue": total_revenue,
+            "averageTicket": total_revenue / total_volume if total_volume > 0 else 0,
+            "totalDuration": total_duration,
+            "revenuePerHour": total_revenue / (total_duration / 60) if total_duration > 0 else 0,
+            "uniqueClients": unique_clients,
+        },
+        "trendData": trend_data,
+        "categoryBreakdown": category_data,
+        "cityStats": city_data[:5],
+        "availableCities": available_cities,
+    }
@@ -0,0 +1,186 @@
+"""
+Calcul de la TVA par période de déclaration (mensuelle ou trimestrielle)
+
+La TVA collectée (factures clients) et déductible (factures fournisseurs) est
+ventilée par période calendaire en une seule requête GROUP BY
+date_trunc('month' | 'quarter', issue_date), limitée à l'entreprise active.
+
+Les périodes clôturées sont mises en cache par worker : elles ne sont
+recalculées qu'après une écriture sur les factures de l'entreprise (hook
+on_write du moteur CRUD, propagé aux autres workers par NOTIFY) ou à
+l'expiration du TTL. Comme pour les listes de référence, un calcul commencé
+avant une invalidation n'est pas remis en cache (compteur de générations).
+"""
+
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.core.cache import TTLCache
+from app.core.dependencies import get_async_db_connection
+from app.core.notifications import notify_async, subscribe
+from app.services.accounting import INVOICES_CTE, add_months
+
+
+FREQUENCIES = {
+    # fréquence de déclaration -> (unité date_trunc, nombre de mois par période)
+    "Mensuelle": ("month", 1),
+    "Trimestrielle": ("quarter", 3),
+}
+DEFAULT_FREQUENCY = "Mensuelle"
+
+# Nombre de périodes de l'historique (période courante incluse)
+HISTORY_PERIODS = 4
+
+# (company_id, unité, début de période) -> (collectée, déductible)
+# Le TTL borne le décalage si une invalidation entre workers est perdue
+closed_periods_cache = TTLCache("vat_closed_periods", maxsize=4096, ttl=600)
+
+# Canal NOTIFY (payload : id de l'entreprise, ou "*" pour tout invalider)
+VAT_CHANNEL = "erp_vat_periods"
+
+_generation = 0
+
+VAT_SQL = INVOICES_CTE + """
+    SELECT date_trunc(%(unit)s, issue_date)::date AS period,
+           COALESCE(SUM(vat_amount) FILTER (WHERE kind = 'client'), 0) AS collected,
+           COALESCE(SUM(vat_amount) FILTER (WHERE kind = 'vendor'), 0) AS deductible
+    FROM invoices
+    WHERE vat_enabled
+      AND issue_date >= %(start)s
+      AND issue_date < %(end)s
+    GROUP BY 1;
+"""
+
+
+def _forget(company_id: str) -> None:
+    global _generation
+    _generation += 1
+    if company_id == "*":
+        closed_periods_cache.clear()
+    else:
+        closed_periods_cache.delete_where(lambda key, _value: key[0] == company_id)
+
+
+subscribe(VAT_CHANNEL, _forget)
+
+
+async def invalidate_vat_cache(company_ids: List[Optional[str]]) -> None:
+    """Hook on_write des factures : oublie les périodes des entreprises modifiées dans tous les workers"""
+    targets = ["*"] if None in company_ids else list(dict.fromkeys(company_ids))
+    for target in targets:
+        _forget(target)
+        await notify_async(VAT_CHANNEL, target)
+
+
+def period_start(day: date, months_per_period: int) -> date:
+    """Premier jour de la période (mois ou trimestre calendaire) contenant day"""
+    month = (day.month - 1) // months_per_period * months_per_period + 1
+    return date(day.year, month, 1)
+
+
+def period_label(start: date, frequency: str) -> str:
+    if frequency == "Trimestrielle":
+        return f"T{(start.month - 1) // 3 + 1} {start.year}"
+    return start.strftime("%B %Y")
+
+
+async def _company_frequency(cur, company_id: str) -> Optional[str]:
+    """Fréquence enregistrée dans les paramètres de l'entreprise (vatDeclarationFrequency)"""
+    await cur.execute(
+        "SELECT data->>'vatDeclarationFrequency' FROM companies WHERE id = %s;",
+        (company_id,),
+        prepare=True,
+    )
+    row = await cur.fetchone()
+    return row[0] if row and row[0] in FREQUENCIES else None
+
+
+async def _load_periods(cur, company_id: str, unit: str, start: date, end: date) -> Dict[date, Tuple[float, float]]:
+    await cur.execute(
+        VAT_SQL,
+        {"company_id": company_id, "unit": unit, "start": start, "end": end},
+        prepare=True,
+    )
+    return {
+        period: (float(collected), float(deductible))
+        for period, collected, deductible in await cur.fetchall()
+    }
+
+
+async def compute_vat(company_id: Optional[str], frequency: Optional[str] = None, today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Données de /accounting/vat : période courante + historique.
+    Sans fréquence explicite, celle de l'entreprise est utilisée (Mensuelle par défaut).
+    """
+    if frequency is not None and frequency not in FREQUENCIES:
+        raise HTTPException(status_code=400, detail=f"Fréquence de déclaration invalide: {frequency} (Mensuelle ou Trimestrielle)")
+    if not company_id:
+        return _build_response({}, frequency or DEFAULT_FREQUENCY, today)
+
+    # Lue avant les requêtes : une invalidation pendant le calcul empêche sa mise en cache
+    generation = _generation
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        if frequency is None:
+            frequency = await _company_frequency(cur, company_id) or DEFAULT_FREQUENCY
+        unit, months_per_period = FREQUENCIES[frequency]
+        current, periods, next_period = _periods(today, months_per_period)
+
+        # Périodes clôturées déjà calculées : servies depuis le cache
+        totals: Dict[date, Tuple[float, float]] = {}
+        missing = []
+        for start in periods[:-1]:
+            cached = closed_periods_cache.get((company_id, unit, start))
+            if cached is None:
+                missing.append(start)
+            else:
+                totals[start] = cached
+        # Une seule requête pour la période courante et les périodes manquantes
+        loaded = await _load_periods(cur, company_id, unit, missing[0] if missing else current, next_period)
+
+    for start in missing + [current]:
+        totals[start] = loaded.get(start, (0.0, 0.0))
+        if start != current and generation == _generation:
+            closed_periods_cache.set((company_id, unit, start), totals[start])
+    return _build_response(totals, frequency, today)
+
+
+def _periods(today: Optional[date], months_per_period: int) -> Tuple[date, List[date], date]:
+    """(période courante, périodes de l'historique, période suivante)"""
+    current = period_start(today or date.today(), months_per_period)
+    periods = [add_months(current, -months_per_period * i) for i in range(HISTORY_PERIODS - 1, -1, -1)]
+    return current, periods, add_months(current, months_per_period)
+
+
+def _build_response(totals: Dict[date, Tuple[float, float]], frequency: str, today: Optional[date]) -> Dict[str, Any]:
+    _unit, months_per_period = FREQUENCIES[frequency]
+    current, periods, next_period = _periods(today, months_per_period)
+
+    history = [
+        {
+            "period": period_label(start, frequency),
+            "collected": totals.get(start, (0.0, 0.0))[0],
+            "deductible": totals.get(start, (0.0, 0.0))[1],
+        }
+        for start in periods
+    ]
+
+    # Déclaration le 15 du mois suivant la fin de période, paiement 15 jours après
+    next_declaration = next_period + timedelta(days=14)
+    payment_deadline = next_declaration + timedelta(days=15)
+    last_declaration = add_months(current, -months_per_period) + timedelta(days=14)
+    current_collected, current_deductible = totals.get(current, (0.0, 0.0))
+
+    return {
+        "snapshot": {
+            "periodLabel": period_label(current, frequency),
+            "collected": current_collected,
+            "deductible": current_deductible,
+            "declarationFrequency": frequency,
+            "nextDeclarationDate": next_declaration.isoformat(),
+            "lastDeclarationDate": last_declaration.isoformat(),
+            "paymentDeadline": payment_deadline.isoformat(),
+        },
+        "history": history,
+    }
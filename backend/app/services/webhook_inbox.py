@@ -0,0 +1,269 @@
+"""
+File d'attente durable des réservations reçues par webhook (table webhook_inbox)
+
+Le webhook se contente d'enregistrer la réservation (clé d'idempotence unique
+par entreprise) et de répondre 202 : un PostgreSQL lent ne fait plus expirer
+la requête du site externe, dont les réémissions créaient des doublons.
+
+Des tâches asyncio (WEBHOOK_WORKERS par worker uvicorn) réservent les lignes
+en attente par lots (FOR UPDATE SKIP LOCKED : plusieurs consommateurs sans
+double traitement), les transforment en prospects en une requête et les
+marquent traitées. Une erreur PostgreSQL replanifie la ligne avec un backoff
+exponentiel ; une réservation invalide est marquée en échec définitif.
+Les consommateurs sont réveillés par NOTIFY à chaque réception, et
+interrogent la table toutes les WEBHOOK_POLL_INTERVAL secondes à défaut.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.dependencies import get_async_db_connection
+from app.core.notifications import subscribe
+from app.services.reservations import build_lead, upsert_leads
+
+
+# Canal NOTIFY émis à chaque réservation mise en file
+INBOX_CHANNEL = "erp_webhook_inbox"
+
+# Au-delà, la réservation passe en échec définitif (délais : 2, 4, 8... s, 1 h max)
+MAX_ATTEMPTS = 8
+MAX_BACKOFF_SECONDS = 3600
+
+# Conservation des lignes traitées (fenêtre d'idempotence)
+RETENTION_DAYS = 7
+PURGE_INTERVAL = 3600
+
+ENQUEUE_SQL = """
+    WITH inserted AS (
+        INSERT INTO webhook_inbox (company_id, idempotency_key, payload)
+        VALUES (%s, %s, %s::jsonb)
+        ON CONFLICT (company_id, idempotency_key) DO NOTHING
+        RETURNING id, status, payload->>'id' AS lead_id
+    )
+    SELECT id, status, lead_id, pg_notify(%s, '') FROM inserted;
+"""
+
+CLAIM_SQL = """
+    SELECT id, company_id, payload
+    FROM webhook_inbox
+    WHERE status = 'pending' AND available_at <= NOW()
+    ORDER BY available_at, id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED;
+"""
+
+DONE_SQL = """
+    UPDATE webhook_inbox AS inbox
+    SET status = 'done', lead_id = done.lead_id, attempts = inbox.attempts + 1,
+        last_error = NULL, processed_at = NOW()
+    FROM unnest(%s::bigint[], %s::text[]) AS done(id, lead_id)
+    WHERE inbox.id = done.id;
+"""
+
+FAILED_SQL = """
+    UPDATE webhook_inbox AS inbox
+    SET status = 'failed', attempts = inbox.attempts + 1, last_error = failed.error, processed_at = NOW()
+    FROM unnest(%s::bigint[], %s::text[]) AS failed(id, error)
+    WHERE inbox.id = failed.id;
+"""
+
+RETRY_SQL = """
+    UPDATE webhook_inbox
+    SET attempts = attempts + 1,
+        last_error = %(error)s,
+        status = CASE WHEN attempts + 1 >= %(max_attempts)s THEN 'failed' ELSE 'pending' END,
+        available_at = NOW() + LEAST(power(2, attempts + 1), %(max_backoff)s) * INTERVAL '1 second',
+        processed_at = CASE WHEN attempts + 1 >= %(max_attempts)s THEN NOW() END
+    WHERE id = ANY(%(ids)s);
+"""
+
+_wakeup: Optional[asyncio.Event] = None
+_workers: List[asyncio.Task] = []
+
+
+def _wake(_payload: str) -> None:
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+subscribe(INBOX_CHANNEL, _wake)
+
+
+def idempotency_key(payload: Dict[str, Any], header: Optional[str]) -> str:
+    """
+    Header Idempotency-Key, sinon empreinte du contenu complet : une
+    réservation renvoyée avec le même id mais un contenu modifié n'est pas un
+    doublon (elle met à jour le prospect, comme avant la file)
+    """
+    if header:
+        return f"header:{header}"
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return f"sha256:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+async def enqueue_reservation(company_id: str, payload: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """
+    Met la réservation en file (une requête). Une réservation déjà reçue avec la
+    même clé n'est pas réinsérée : on retourne l'entrée existante (duplicate).
+    """
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute(
+            ENQUEUE_SQL,
+            (company_id, key, json.dumps(payload, default=str), INBOX_CHANNEL),
+            prepare=True,
+        )
+        row = await cur.fetchone()
+        duplicate = row is None
+        if duplicate:
+            await cur.execute(
+                """
+                SELECT id, status, COALESCE(lead_id, payload->>'id')
+                FROM webhook_inbox WHERE company_id = %s AND idempotency_key = %s;
+                """,
+                (company_id, key),
+            )
+            row = await cur.fetchone()
+    return {"id": row[0], "status": row[1], "leadId": row[2], "duplicate": duplicate}
+
+
+async def process_batch(batch_size: int) -> int:
+    """Traite un lot de réservations en attente ; retourne le nombre de lignes réservées"""
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        async with conn.transaction():
+            await cur.execute(CLAIM_SQL, (batch_size,))
+            rows = await cur.fetchall()
+            if not rows:
+                return 0
+
+            # id du prospect -> (lignes de la file, prospect) ; la dernière réception l'emporte
+            leads: Dict[str, Tuple[List[int], Dict[str, Any]]] = {}
+            failed: List[Tuple[int, str]] = []
+            for inbox_id, company_id, payload in rows:
+                try:
+                    lead = build_lead(payload, company_id)
+                except ValueError as e:
+                    failed.append((inbox_id, str(e)))
+                    continue
+                inbox_ids = leads[lead["id"]][0] if lead["id"] in leads else []
+                leads[lead["id"]] = (inbox_ids + [inbox_id], lead)
+
+            saved, retry = await _upsert_isolated(conn, cur, leads)
+
+            done: List[Tuple[int, str]] = []
+            for lead_id, (inbox_ids, _lead) in leads.items():
+                if lead_id in retry:
+                    continue
+                for inbox_id in inbox_ids:
+                    if lead_id in saved:
+                        done.append((inbox_id, lead_id))
+                    else:
+                        failed.append((inbox_id, f"id {lead_id} déjà utilisé par une autre entreprise"))
+
+            if done:
+                await cur.execute(DONE_SQL, ([i for i, _ in done], [lead_id for _, lead_id in done]))
+            if failed:
+                await cur.execute(FAILED_SQL, ([i for i, _ in failed], [error for _, error in failed]))
+            for lead_id, error in retry.items():
+                await cur.execute(RETRY_SQL, {
+                    "ids": leads[lead_id][0],
+                    "error": error,
+                    "max_attempts": MAX_ATTEMPTS,
+                    "max_backoff": MAX_BACKOFF_SECONDS,
+                })
+    return len(rows)
+
+
+async def _upsert_isolated(conn, cur, leads: Dict[str, Tuple[List[int], Dict[str, Any]]]) -> Tuple[set, Dict[str, str]]:
+    """
+    Upsert du lot en une requête (savepoint) ; en cas d'erreur, reprise prospect
+    par prospect pour isoler la ligne fautive. Retourne (ids enregistrés,
+    {id à replanifier: erreur}).
+    """
+    try:
+        async with conn.transaction():
+            return await upsert_leads(cur, [lead for _, lead in leads.values()]), {}
+    except Exception as e:
+        if len(leads) == 1:
+            return set(), {lead_id: str(e) for lead_id in leads}
+    saved: set = set()
+    retry: Dict[str, str] = {}
+    for lead_id, (_inbox_ids, lead) in leads.items():
+        try:
+            async with conn.transaction():
+                saved |= await upsert_leads(cur, [lead])
+        except Exception as e:
+            retry[lead_id] = str(e)
+    return saved, retry
+
+
+async def purge_processed() -> None:
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute(
+            "DELETE FROM webhook_inbox WHERE status <> 'pending' AND processed_at < NOW() - %s * INTERVAL '1 day';",
+            (RETENTION_DAYS,),
+        )
+
+
+async def _worker(index: int) -> None:
+    last_purge = 0.0
+    while True:
+        try:
+            processed = await process_batch(settings.WEBHOOK_BATCH_SIZE)
+            if index == 0 and time.monotonic() - last_purge > PURGE_INTERVAL:
+                last_purge = time.monotonic()
+                await purge_processed()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Webhook] Consommateur {index} en échec: {e}")
+            processed = 0
+        # Lot plein : il reste sans doute du travail, on enchaîne
+        if processed < settings.WEBHOOK_BATCH_SIZE:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=settings.WEBHOOK_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+def start_workers() -> None:
+    """Démarre les consommateurs de la file du worker (startup, dans la boucle d'événements)"""
+    global _wakeup
+    if _workers or settings.WEBHOOK_WORKERS <= 0:
+        return
+    _wakeup = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for index in range(settings.WEBHOOK_WORKERS):
+        _workers.append(loop.create_task(_worker(index)))
+
+
+async def stop_workers() -> None:
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+async def queue_stats() -> Dict[str, Any]:
+    """Profondeur de la file : lignes par statut et âge de la plus ancienne en attente"""
+    async with get_async_db_connection() as conn, conn.cursor() as cur:
+        await cur.execute(
+            """
+            SELECT status, COUNT(*), EXTRACT(EPOCH FROM NOW() - MIN(created_at))
+            FROM webhook_inbox GROUP BY status;
+            """
+        )
+        rows = await cur.fetchall()
+    counts = {status: count for status, count, _ in rows}
+    oldest = next((age for status, _, age in rows if status == "pending"), None)
+    return {
+        "pending": counts.get("pending", 0),
+        "done": counts.get("done", 0),
+        "failed": counts.get("failed", 0),
+        "oldestPendingSeconds": float(oldest) if oldest is not None else None,
+        "consumers": len(_workers),
+    }
@@ -28,7 +28,8 @@ def create_admin_user():
         database_url = get_database_url()
         with psycopg.connect(database_url) as conn, conn.cursor() as cur:
             # Vérifier si l'admin existe déjà
-            cur.execute("SELECT id FROM users WHERE data->>'username' = %s;", ('admin',))
+            # Recherche insensible à la casse, via l'index lower(username) (migration 0004)
+            cur.execute("SELECT id FROM users WHERE lower(data->>'username') = lower(%s);", ('admin',))
             existing = cur.fetchone()
             
             # Créer l'utilisateur admin uniquement s'il n'existe pas
@@ -1,5 +1,7 @@
 -- Migration : Créer les index sur companyId pour toutes les tables
 -- Ces index optimisent les requêtes filtrées par companyId
+-- OBSOLÈTE : remplacé par app/migrations/0001_generated_columns.sql (colonne générée
+-- company_id + index composites), appliqué automatiquement au démarrage.
 
 -- Index pour clients
 CREATE INDEX IF NOT EXISTS idx_clients_company_id ON clients ((data->>'companyId'));
@@ -0,0 +1,194 @@
+"""
+Synchronisation des calendriers (app/services/calendar_sync.py)
+
+L'API Google Calendar est rejouée à partir de réponses enregistrées
+(fixtures/calendar_sync.json) : le vrai client d'API et
+GoogleCalendarService.list_changes (pagination, jetons) sont exécutés, seul
+le transport HTTP est remplacé. La connexion PostgreSQL est une fausse
+connexion qui enregistre les requêtes exécutées.
+"""
+
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("psycopg")
+pytest.importorskip("googleapiclient")
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpMockSequence
+
+from app.services import calendar_sync
+from app.services.google_calendar import GoogleCalendarService, _discovery_document
+
+if not calendar_sync.GOOGLE_CALENDAR_AVAILABLE or _discovery_document() is None:
+    pytest.skip("client Google Calendar indisponible", allow_module_level=True)
+
+
+CALENDAR_ID = "adrien@erpwashgo.fr"
+FIXTURES = json.loads((Path(__file__).parent / "fixtures" / "calendar_sync.json").read_text(encoding="utf-8"))
+
+
+def _ok(page):
+    return {"status": "200", "content-type": "application/json"}, json.dumps(page)
+
+
+def _expired():
+    return {"status": "410", "content-type": "application/json"}, json.dumps(FIXTURES["expired"])
+
+
+def make_service(responses):
+    """GoogleCalendarService d'un calendrier dont les requêtes HTTP rejouent responses"""
+    http = HttpMockSequence(list(responses))
+    service = GoogleCalendarService.__new__(GoogleCalendarService)
+    service.services = {
+        CALENDAR_ID: {
+            # Transport factice : chaque requête est exécutée avec le transport du thread
+            "service": build_from_document(_discovery_document(), http=httplib2.Http()),
+            "credentials": None,
+            "name": "adrien",
+        }
+    }
+    service._local = threading.local()
+    service._local.transports = {CALENDAR_ID: http}
+    return service, http
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None, **kwargs):
+        self.conn.executed.append((" ".join(query.split()), params))
+
+    def fetchone(self):
+        return (self.conn.sync_token,) if self.conn.sync_token else None
+
+
+class FakeConnection:
+    """Enregistre les requêtes (sql normalisé, paramètres) et les transactions ouvertes"""
+
+    def __init__(self, sync_token=None):
+        self.sync_token = sync_token
+        self.executed = []
+        self.transactions = 0
+
+    @contextmanager
+    def transaction(self):
+        self.transactions += 1
+        yield
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def statements(self, prefix):
+        return [params for query, params in self.executed if query.startswith(prefix)]
+
+
+def _written_events(conn):
+    """{event_id: (données, début, fin)} écrits par UPSERT_EVENTS_SQL"""
+    written = {}
+    for _, ids, events, starts, ends in conn.statements("INSERT INTO calendar_events"):
+        for event_id, event, start, end in zip(ids, events, starts, ends):
+            written[event_id] = (event.obj, start, end)
+    return written
+
+
+def _query(uri):
+    return dict(pair.split("=", 1) for pair in uri.split("?", 1)[1].split("&"))
+
+
+def test_split_changes_last_version_wins_and_cancelled_are_deleted():
+    events = FIXTURES["full"][0]["items"] + FIXTURES["incremental"][0]["items"]
+    upserts, deletes = calendar_sync._split_changes(events)
+
+    assert list(upserts) == ["evt-lavage-1", "evt-conges"]
+    assert deletes == ["evt-lavage-2"]
+    event, start, end = upserts["evt-lavage-1"]
+    assert event["summary"] == "Lavage Clio - M. Martin (décalé)"
+    assert start == datetime(2026, 10, 5, 9, 0, tzinfo=timezone.utc)
+    assert end == datetime(2026, 10, 5, 10, 30, tzinfo=timezone.utc)
+    # Journée entière : minuit UTC
+    _, start, end = upserts["evt-conges"]
+    assert (start, end) == (datetime(2026, 10, 12, tzinfo=timezone.utc), datetime(2026, 10, 17, tzinfo=timezone.utc))
+
+
+def test_full_sync_replaces_the_copy_and_stores_the_sync_token():
+    service, http = make_service([_ok(page) for page in FIXTURES["full"]])
+    conn = FakeConnection()
+
+    result = calendar_sync.sync_calendar(conn, service, CALENDAR_ID, history_days=30)
+
+    assert result == "complète (3 événements)"
+    # Deux pages : la seconde est demandée avec le nextPageToken de la première
+    assert len(http.request_sequence) == 2
+    first, second = (_query(uri) for uri, *_ in http.request_sequence)
+    assert "timeMin" in first and "syncToken" not in first
+    assert second["pageToken"] == "page-2"
+
+    assert conn.transactions == 1
+    assert conn.statements("DELETE FROM calendar_events WHERE calendar_id = %s;") == [(CALENDAR_ID,)]
+    assert set(_written_events(conn)) == {"evt-lavage-1", "evt-conges", "evt-lavage-2"}
+    (state,) = conn.statements("INSERT INTO calendar_sync_state")
+    assert state[:2] == (CALENDAR_ID, "sync-token-1")
+
+
+def test_incremental_sync_applies_changes_and_deletes_cancelled_events():
+    service, http = make_service([_ok(page) for page in FIXTURES["incremental"]])
+    conn = FakeConnection(sync_token="sync-token-1")
+
+    result = calendar_sync.sync_calendar(conn, service, CALENDAR_ID, history_days=30)
+
+    assert result == "2 modification(s)"
+    (request,) = http.request_sequence
+    query = _query(request[0])
+    assert query["syncToken"] == "sync-token-1" and "timeMin" not in query
+
+    assert conn.transactions == 1
+    # Pas de remplacement complet : seul l'événement annulé est supprimé
+    assert conn.statements("DELETE FROM calendar_events WHERE calendar_id = %s;") == []
+    assert conn.statements("DELETE FROM calendar_events WHERE calendar_id = %s AND event_id") == [
+        (CALENDAR_ID, ["evt-lavage-2"])
+    ]
+    written = _written_events(conn)
+    assert list(written) == ["evt-lavage-1"]
+    assert written["evt-lavage-1"][1] == datetime(2026, 10, 5, 9, 0, tzinfo=timezone.utc)
+    assert conn.statements("UPDATE calendar_sync_state") == [("sync-token-2", CALENDAR_ID)]
+
+
+def test_expired_sync_token_falls_back_to_a_full_sync():
+    service, http = make_service([_expired()] + [_ok(page) for page in FIXTURES["full"]])
+    conn = FakeConnection(sync_token="sync-token-0")
+
+    result = calendar_sync.sync_calendar(conn, service, CALENDAR_ID, history_days=30)
+
+    assert result == "complète (3 événements)"
+    queries = [_query(uri) for uri, *_ in http.request_sequence]
+    assert queries[0]["syncToken"] == "sync-token-0"
+    assert all("syncToken" not in query for query in queries[1:])
+    # La synchronisation incrémentale n'a rien écrit avant l'erreur
+    assert conn.transactions == 1
+    assert conn.statements("UPDATE calendar_sync_state") == []
+    (state,) = conn.statements("INSERT INTO calendar_sync_state")
+    assert state[:2] == (CALENDAR_ID, "sync-token-1")
+
+
+def test_other_http_errors_are_not_treated_as_an_expired_token():
+    error = {"status": "403", "content-type": "application/json"}, json.dumps({"error": {"code": 403, "message": "Forbidden"}})
+    service, _ = make_service([error])
+    conn = FakeConnection(sync_token="sync-token-1")
+
+    with pytest.raises(calendar_sync.HttpError):
+        calendar_sync.sync_calendar(conn, service, CALENDAR_ID, history_days=30)
+    assert conn.transactions == 0
@@ -0,0 +1,56 @@
+"""
+Validation des réservations du site externe (ReservationPayload, build_lead)
+
+Le webhook unitaire doit accepter ce que l'ancien webhook enregistrait :
+valeurs null, nombres à la place de textes.
+"""
+
+import pytest
+
+pytest.importorskip("psycopg")
+pytest.importorskip("pydantic")
+
+from app.services.reservations import build_lead
+
+
+COMPANY_ID = "company-1"
+
+
+def test_numeric_phone_is_stored_as_text():
+    lead = build_lead({"contact": "a", "phone": 612345678}, COMPANY_ID)
+
+    assert lead["phone"] == "612345678"
+
+
+def test_numeric_siret_is_stored_as_text():
+    lead = build_lead({"contact": "a", "siret": 12345678901234}, COMPANY_ID)
+
+    assert lead["siret"] == "12345678901234"
+
+
+def test_numeric_tags_are_stored_as_text():
+    lead = build_lead({"contact": "a", "tags": [1, "vip"]}, COMPANY_ID)
+
+    assert lead["tags"] == ["1", "vip"]
+
+
+def test_numeric_id_is_kept_as_lead_id():
+    lead = build_lead({"id": 42, "contact": "a"}, COMPANY_ID)
+
+    assert lead["id"] == "42"
+    assert lead["companyId"] == COMPANY_ID
+
+
+def test_null_values_fall_back_to_defaults():
+    lead = build_lead({"contact": None, "tags": None, "status": None}, COMPANY_ID)
+
+    assert lead["contact"] == ""
+    assert lead["tags"] == []
+    assert lead["status"] == "Nouveau"
+
+
+def test_contact_is_only_required_in_batches():
+    assert build_lead({"company": "Boulangerie Petit"}, COMPANY_ID)["company"] == "Boulangerie Petit"
+    with pytest.raises(ValueError, match="contact, email ou phone requis"):
+        build_lead({"company": "Boulangerie Petit"}, COMPANY_ID, require_contact=True)
+    assert build_lead({"phone": 612345678}, COMPANY_ID, require_contact=True)["phone"] == "612345678"
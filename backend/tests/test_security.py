@@ -0,0 +1,34 @@
+"""
+Recalcul des hashs bcrypt à la connexion (needs_rehash)
+"""
+
+import pytest
+
+pytest.importorskip("bcrypt")
+
+from app.core import security
+from app.core.security import needs_rehash
+
+
+SALT_AND_HASH = "N9qo8uLOickgx2ZMRZoMyeIjZAgcfl7p92ldGxad68LJZdL17lhWy"
+
+
+@pytest.fixture(autouse=True)
+def bcrypt_rounds(monkeypatch):
+    monkeypatch.setattr(security.settings, "BCRYPT_ROUNDS", 12)
+
+
+def test_weaker_hash_is_upgraded():
+    assert needs_rehash(f"$2b$10${SALT_AND_HASH}") is True
+
+
+def test_current_cost_is_kept():
+    assert needs_rehash(f"$2b$12${SALT_AND_HASH}") is False
+
+
+def test_stronger_hash_is_never_downgraded():
+    assert needs_rehash(f"$2b$14${SALT_AND_HASH}") is False
+
+
+def test_unknown_format_is_left_alone():
+    assert needs_rehash("pas-un-hash-bcrypt") is False
@@ -0,0 +1,47 @@
+"""
+Recherche d'un utilisateur par nom au login (LOGIN_USER_SQL, migration 0004)
+
+Test de non-régression sur la base DATABASE_URL (migrations appliquées) :
+le plan de la requête du login doit passer par l'index fonctionnel
+idx_users_username_lower. Ignoré si la base est injoignable.
+"""
+
+import pytest
+
+psycopg = pytest.importorskip("psycopg")
+
+from app.core.config import settings
+from app.main import LOGIN_USER_SQL
+
+
+LOGIN_INDEX = "idx_users_username_lower"
+
+
+@pytest.fixture(scope="module")
+def conn():
+    try:
+        connection = psycopg.connect(settings.DATABASE_URL, connect_timeout=3)
+    except psycopg.OperationalError as e:
+        pytest.skip(f"base PostgreSQL injoignable ({e})")
+    with connection:
+        yield connection
+
+
+def plan_nodes(plan):
+    """Nœuds d'un plan EXPLAIN (FORMAT JSON), à plat"""
+    nodes = [plan]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+def test_login_query_uses_the_username_index(conn):
+    with conn.transaction(force_rollback=True), conn.cursor() as cur:
+        # Sur une petite table le planificateur préfère un parcours séquentiel,
+        # ce qui ne dit rien de l'utilisabilité de l'index
+        cur.execute("SET LOCAL enable_seqscan = off;")
+        cur.execute("EXPLAIN (FORMAT JSON) " + LOGIN_USER_SQL, ("Admin",))
+        plan = cur.fetchone()[0][0]["Plan"]
+
+    index_names = [node.get("Index Name") for node in plan_nodes(plan)]
+    assert LOGIN_INDEX in index_names, f"le login n'utilise pas {LOGIN_INDEX} (migration 0004 appliquée ?) : {plan}"
@@ -0,0 +1,114 @@
+"""
+Cache des périodes de TVA clôturées (app/services/vat.py)
+
+La base est remplacée par une fausse connexion qui renvoie des totaux fixes ;
+NOTIFY est enregistré au lieu d'être envoyé.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+
+import pytest
+
+pytest.importorskip("psycopg")
+
+from app.services import vat
+
+
+COMPANY_ID = "company-1"
+TODAY = date(2026, 10, 17)
+
+
+class FakeVatCursor:
+    def __init__(self, during_query):
+        self.during_query = during_query
+        self.queries = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, query, params=None, **kwargs):
+        self.params = params
+
+    async def fetchone(self):
+        return ("Mensuelle",)
+
+    async def fetchall(self):
+        self.queries += 1
+        self.during_query()
+        start = self.params["start"]
+        return [(start, 200, 50)]
+
+
+class FakeVatDatabase:
+    def __init__(self, during_query=lambda: None):
+        self.cursor = FakeVatCursor(during_query)
+
+    @asynccontextmanager
+    async def connection(self):
+        outer = self
+
+        class Connection:
+            def cursor(self):
+                return outer.cursor
+
+        yield Connection()
+
+
+@pytest.fixture(autouse=True)
+def notifications(monkeypatch):
+    sent = []
+
+    async def record(channel, payload):
+        sent.append((channel, payload))
+
+    monkeypatch.setattr(vat, "notify_async", record)
+    vat.closed_periods_cache.clear()
+    yield sent
+    vat.closed_periods_cache.clear()
+
+
+def compute(monkeypatch, database):
+    monkeypatch.setattr(vat, "get_async_db_connection", database.connection)
+    return asyncio.run(vat.compute_vat(COMPANY_ID, today=TODAY))
+
+
+def test_closed_periods_are_served_from_the_cache(monkeypatch):
+    compute(monkeypatch, FakeVatDatabase())
+    database = FakeVatDatabase()
+    result = compute(monkeypatch, database)
+
+    # Seule la période courante est relue
+    assert database.cursor.params["start"] == date(2026, 10, 1)
+    assert [period["collected"] for period in result["history"]] == [200.0, 0.0, 0.0, 200.0]
+    assert result["snapshot"]["collected"] == 200.0
+
+
+def test_invalidation_during_a_computation_is_not_overwritten(monkeypatch):
+    # Une écriture (ou un NOTIFY d'un autre worker) arrive pendant la requête
+    compute(monkeypatch, FakeVatDatabase(during_query=lambda: vat._forget(COMPANY_ID)))
+    database = FakeVatDatabase()
+    compute(monkeypatch, database)
+
+    # Rien n'a été mis en cache : les périodes clôturées sont relues
+    assert database.cursor.params["start"] == date(2026, 7, 1)
+
+
+def test_invalidation_is_sent_to_the_other_workers(monkeypatch, notifications):
+    compute(monkeypatch, FakeVatDatabase())
+    asyncio.run(vat.invalidate_vat_cache([COMPANY_ID, COMPANY_ID]))
+    database = FakeVatDatabase()
+    compute(monkeypatch, database)
+
+    assert notifications == [(vat.VAT_CHANNEL, COMPANY_ID)]
+    assert database.cursor.params["start"] == date(2026, 7, 1)
+
+
+def test_unknown_company_invalidates_every_company(notifications):
+    asyncio.run(vat.invalidate_vat_cache([None, COMPANY_ID]))
+
+    assert notifications == [(vat.VAT_CHANNEL, "*")]
@@ -0,0 +1,119 @@
+"""
+File d'attente des réservations du webhook (app/services/webhook_inbox.py)
+
+La table webhook_inbox est remplacée par une fausse connexion qui applique la
+contrainte UNIQUE (company_id, idempotency_key) de la migration 0006.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+pytest.importorskip("psycopg")
+
+from app.services import webhook_inbox
+from app.services.webhook_inbox import enqueue_reservation, idempotency_key
+
+
+COMPANY_ID = "company-1"
+
+RESERVATION = {
+    "id": "resa-42",
+    "contact": "M. Martin",
+    "phone": "0612345678",
+    "status": "Nouveau",
+    "nextStepNote": "",
+}
+
+
+class FakeInbox:
+    """Lignes de webhook_inbox par (entreprise, clé d'idempotence)"""
+
+    def __init__(self):
+        self.rows = {}
+
+    @asynccontextmanager
+    async def connection(self):
+        yield FakeAsyncConnection(self)
+
+
+class FakeAsyncConnection:
+    def __init__(self, inbox):
+        self.inbox = inbox
+
+    def cursor(self):
+        return FakeAsyncCursor(self.inbox)
+
+
+class FakeAsyncCursor:
+    def __init__(self, inbox):
+        self.inbox = inbox
+        self.result = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, query, params=None, **kwargs):
+        company_id, key = params[0], params[1]
+        existing = self.inbox.rows.get((company_id, key))
+        if query == webhook_inbox.ENQUEUE_SQL:
+            # ON CONFLICT (company_id, idempotency_key) DO NOTHING
+            if existing is not None:
+                self.result = None
+                return
+            row_id = len(self.inbox.rows) + 1
+            self.inbox.rows[(company_id, key)] = (row_id, params[2])
+            self.result = (row_id, "pending", None, "")
+        else:
+            self.result = (existing[0], "pending", None)
+
+    async def fetchone(self):
+        return self.result
+
+
+@pytest.fixture
+def inbox(monkeypatch):
+    fake = FakeInbox()
+    monkeypatch.setattr(webhook_inbox, "get_async_db_connection", fake.connection)
+    return fake
+
+
+def enqueue(payload, header=None):
+    return asyncio.run(enqueue_reservation(COMPANY_ID, payload, idempotency_key(payload, header)))
+
+
+def test_resent_identical_payload_is_a_duplicate(inbox):
+    first = enqueue(RESERVATION)
+    again = enqueue(dict(RESERVATION))
+
+    assert first["duplicate"] is False
+    assert again["duplicate"] is True
+    assert again["id"] == first["id"]
+    assert len(inbox.rows) == 1
+
+
+def test_changed_payload_with_the_same_id_gets_through(inbox):
+    enqueue(RESERVATION)
+    changed = enqueue({**RESERVATION, "phone": "0698765432", "status": "Rappeler", "nextStepNote": "Rappeler lundi"})
+
+    assert changed["duplicate"] is False
+    assert len(inbox.rows) == 2
+
+
+def test_idempotency_key_header_wins_over_the_content(inbox):
+    first = enqueue(RESERVATION, header="resa-42-v1")
+    again = enqueue({**RESERVATION, "phone": "0698765432"}, header="resa-42-v1")
+
+    assert again["duplicate"] is True
+    assert again["id"] == first["id"]
+
+
+def test_idempotency_key_does_not_depend_on_key_order():
+    reordered = dict(reversed(list(RESERVATION.items())))
+
+    assert idempotency_key(reordered, None) == idempotency_key(RESERVATION, None)
+    assert idempotency_key(RESERVATION, None).startswith("sha256:")
@@ -3,6 +3,7 @@
  */
 
 import { httpClient, ApiResponse } from '../utils/httpClient';
+import { getActiveCompanyId, getAuthToken } from '../../lib/storage';
 
 export interface DocumentRecord {
   id: string;
@@ -19,6 +20,11 @@ export interface DocumentRecord {
   size?: string;
   fileName?: string;
   fileData?: string;
+  // Fichier stocké côté serveur (GET /documents/{id}/content)
+  hasContent?: boolean;
+  blobSha256?: string;
+  contentType?: string;
+  contentLength?: number;
   kind?: 'facture' | 'devis' | 'autre';
 }
 
@@ -58,6 +64,26 @@ export class DocumentService {
     return httpClient.put<DocumentRecord>(`/documents/${id}`, document);
   }
 
+  /**
+   * Télécharge le fichier d'un document (null si indisponible)
+   */
+  static async downloadContent(id: string): Promise<Blob | null> {
+    const headers: Record<string, string> = {};
+    const token = getAuthToken();
+    if (token && token.trim()) {
+      headers.Authorization = `Bearer ${token.trim()}`;
+    }
+    const activeCompanyId = getActiveCompanyId();
+    if (activeCompanyId) {
+      headers['X-Active-Company-Id'] = activeCompanyId;
+    }
+    const response = await fetch(`/api/documents/${encodeURIComponent(id)}/content`, { headers });
+    if (!response.ok) {
+      return null;
+    }
+    return response.blob();
+  }
+
   /**
    * Supprime un document
    */
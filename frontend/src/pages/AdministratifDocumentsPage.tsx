@@ -171,20 +171,29 @@ const AdministratifDocumentsPage = () => {
     );
   }
 
-  const handleDownload = (record: DocumentRecord) => {
+  const handleDownload = async (record: DocumentRecord) => {
     if (!canViewDocuments) {
       return;
     }
-    if (record.fileData) {
+    if (record.fileData || record.hasContent) {
       const fallbackName = record.title.replace(/\s+/g, '-').toLowerCase();
       const extension = record.fileType ? record.fileType.toLowerCase() : '';
       const safeName = record.fileName || (extension ? `${fallbackName}.${extension}` : fallbackName);
+      // Fichier stocké côté serveur : téléchargé à la demande (absent de la liste)
+      const content = record.fileData ? null : await DocumentService.downloadContent(record.id);
+      if (!record.fileData && !content) {
+        return;
+      }
+      const href = record.fileData || URL.createObjectURL(content as Blob);
       const anchor = window.document.createElement('a');
-      anchor.href = record.fileData;
+      anchor.href = href;
       anchor.download = safeName;
       window.document.body.appendChild(anchor);
       anchor.click();
       window.document.body.removeChild(anchor);
+      if (!record.fileData) {
+        URL.revokeObjectURL(href);
+      }
       return;
     }
     if (record.url) {
@@ -312,7 +321,7 @@ const AdministratifDocumentsPage = () => {
   const documentKpis = useMemo(() => {
     const totalDocuments = documents.length;
     const documentsWithAttachment = documents.filter(
-      (document) => Boolean(document.fileData) || Boolean(document.url)
+      (document) => Boolean(document.fileData) || Boolean(document.hasContent) || Boolean(document.url)
     ).length;
     const latestUpdate = documents.reduce<string | null>((latest, document) => {
       if (!document.updatedAt) {
@@ -672,12 +681,12 @@ const AdministratifDocumentsPage = () => {
                       </td>
                       <td className="px-6 py-5 align-middle" onClick={(e) => e.stopPropagation()}>
                         <div className="flex items-center gap-2">
-                          {canViewDocuments && (document.fileData || document.url) && (
+                          {canViewDocuments && (document.fileData || document.hasContent || document.url) && (
                             <button
                               type="button"
                               onClick={() => handleDownload(document)}
                               className="rounded-lg p-2 text-slate-600 transition hover:bg-blue-100 hover:text-blue-700 dark:text-slate-300 dark:hover:bg-blue-900/30 dark:hover:text-blue-200"
-                              title={document.fileData ? 'Télécharger' : 'Ouvrir'}
+                              title={document.fileData || document.hasContent ? 'Télécharger' : 'Ouvrir'}
                             >
                               <Download className="h-4 w-4" />
                             </button>
@@ -731,14 +740,14 @@ const AdministratifDocumentsPage = () => {
                 )}
               </div>
               <div className="flex items-center justify-between gap-2 border-t border-slate-200 pt-4 dark:border-slate-800">
-                {canViewDocuments && (document.fileData || document.url) && (
+                {canViewDocuments && (document.fileData || document.hasContent || document.url) && (
                   <button
                     type="button"
                     onClick={() => handleDownload(document)}
                     className="flex flex-1 items-center justify-center gap-2 rounded-lg bg-blue-600 px-4 py-2.5 text-sm font-medium text-white transition hover:bg-blue-700 dark:bg-blue-500 dark:hover:bg-blue-600"
                   >
                     <Download className="h-4 w-4" />
-                    {document.fileData ? 'Télécharger' : 'Ouvrir'}
+                    {document.fileData || document.hasContent ? 'Télécharger' : 'Ouvrir'}
                   </button>
                 )}
                 {canEditDocuments && (
@@ -440,6 +440,10 @@ export type DocumentRecord = {
   size?: string;
   fileName?: string;
   fileData?: string;
+  hasContent?: boolean;
+  blobSha256?: string;
+  contentType?: string;
+  contentLength?: number;
   kind?: CommercialDocumentKind;
   engagementId?: string | null;
   number?: string | null;